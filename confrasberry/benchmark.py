@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Fire Monitor - Benchmarks
+Micro-benchmarks del camino caliente de ingestión (on_message, base de
+datos y save_image) sin broker MQTT, con comparación contra una línea base
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from typing import Callable, Dict, List
+
+# Mismo tamaño de chunk que el firmware (src/main.cpp)
+CHUNK_SIZE = 2550
+DEVICE = 'ESP32-CAM'
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'benchmark_baseline.json')
+DEFAULT_TOLERANCE = 0.20
+
+# ============================================
+# DATOS SINTÉTICOS
+# ============================================
+
+class _Message:
+    """Mensaje con la forma de paho.mqtt.client.MQTTMessage (topic + payload)"""
+    __slots__ = ('topic', 'payload')
+    
+    def __init__(self, topic: str, payload: Dict):
+        self.topic = topic
+        self.payload = json.dumps(payload).encode()
+
+class _RawMessage:
+    """Mensaje con payload binario (sin JSON)"""
+    __slots__ = ('topic', 'payload')
+    
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+class _NullClient:
+    """Cliente MQTT que descarta las publicaciones (solicitudes de captura)"""
+    
+    def publish(self, *args, **kwargs):
+        pass
+
+def make_jpeg(size: int = 40000, width: int = 320, height: int = 240,
+              seed: int = 1234) -> bytes:
+    """
+    JPEG sintético con la estructura que valida inspect_jpeg
+    
+    SOI + SOF0 con las dimensiones + SOS + datos sin bytes 0xFF + EOI. No se
+    puede decodificar, pero recorre el mismo camino que una captura real
+    (QVGA calidad 20 ronda los 40 KB en el ESP32-CAM).
+    """
+    rng = random.Random(seed)
+    sof = bytes([0xFF, 0xC0, 0x00, 0x11, 0x08,
+                 height >> 8, height & 0xFF, width >> 8, width & 0xFF,
+                 0x03, 0x01, 0x22, 0x00, 0x02, 0x11, 0x01, 0x03, 0x11, 0x01])
+    sos = bytes([0xFF, 0xDA, 0x00, 0x0C, 0x03, 0x01, 0x00, 0x02, 0x11,
+                 0x03, 0x11, 0x00, 0x3F, 0x00])
+    header = b'\xff\xd8' + sof + sos
+    body = bytes(rng.randrange(0, 0xFF) for _ in range(max(0, size - len(header) - 2)))
+    return header + body + b'\xff\xd9'
+
+def image_messages(jpeg: bytes, capture: int, binary: bool = False) -> List[_Message]:
+    """
+    Metadata + chunks de una captura, como los publica el firmware
+    
+    Con binary=True los chunks van a fire/image/bin/<device> con la
+    cabecera de 16 bytes (IMAGE_BINARY_TRANSPORT del firmware).
+    """
+    from image_assembler import BINARY_CHUNK_HEADER, BINARY_CHUNK_MAGIC, BINARY_CHUNK_VERSION
+    
+    total = (len(jpeg) + CHUNK_SIZE - 1) // CHUNK_SIZE
+    messages = [_Message('fire/image/meta', {
+        'device': DEVICE,
+        'capture': capture,
+        'timestamp': capture,
+        'size': len(jpeg),
+        'width': 320,
+        'height': 240,
+        'chunks': total,
+        'chunk_size': CHUNK_SIZE,
+        'transport': 'bin' if binary else 'json'
+    })]
+    for i in range(total):
+        chunk = jpeg[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE]
+        if binary:
+            header = BINARY_CHUNK_HEADER.pack(BINARY_CHUNK_MAGIC, BINARY_CHUNK_VERSION, 0,
+                                              capture, i, total, zlib.crc32(chunk))
+            messages.append(_RawMessage(f'fire/image/bin/{DEVICE}', header + chunk))
+            continue
+        messages.append(_Message('fire/image', {
+            'device': DEVICE,
+            'capture': capture,
+            'chunk': i,
+            'total': total,
+            'data': base64.b64encode(chunk).decode()
+        }))
+    return messages
+
+# ============================================
+# MEDICIÓN
+# ============================================
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def measure(operation: Callable[[int], None], iterations: int, warmup: int) -> Dict:
+    """
+    Ejecutar operation(i) warmup + iterations veces
+    
+    Returns:
+        {'ops_per_sec', 'p50_ms', 'p99_ms', 'iterations', 'peak_rss_kb'}
+    """
+    for i in range(warmup):
+        operation(i)
+    
+    samples = []
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        t0 = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'ops_per_sec': round(iterations / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(_percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(_percentile(samples, 0.99) * 1000, 3),
+        'iterations': iterations,
+        'peak_rss_kb': _peak_rss_kb()
+    }
+
+# ============================================
+# CASOS
+# ============================================
+
+def build_cases(fm, jpeg: bytes) -> Dict[str, Callable[[int], None]]:
+    """Operaciones a medir (nombre -> función de la iteración)"""
+    from database import local_day_range
+    
+    db = fm.db
+    fire = _Message('fire/alert', {'alert': 'FIRE_DETECTED', 'timestamp': 1000, 'detections': 3})
+    clear = _Message('fire/alert', {'alert': 'CLEAR', 'timestamp': 1000, 'detections': 0})
+    chunk_messages = image_messages(jpeg, capture=1)[1:]
+    today_start, today_end = local_day_range()
+    
+    def alert_fire(i):
+        fm.on_message(fm.client, None, fire)
+    
+    def alert_clear(i):
+        fm.on_message(fm.client, None, clear)
+    
+    def image_transfer(i):
+        # Captura completa: meta + chunks + save_image al llegar el último
+        for message in image_messages(jpeg, capture=100000 + i):
+            fm.on_message(fm.client, None, message)
+    
+    def image_transfer_bin(i):
+        # Misma captura con chunks binarios (sin Base64 ni JSON)
+        for message in image_messages(jpeg, capture=200000 + i, binary=True):
+            fm.on_message(fm.client, None, message)
+    
+    def chunk_decode(i):
+        # Un chunk suelto (JSON + Base64), sin completar la captura
+        fm.on_message(fm.client, None, chunk_messages[i % (len(chunk_messages) - 1)])
+    
+    def db_insert_detection(i):
+        db.insert_detection(detected=False, esp32_millis=i, sync=True)
+    
+    def db_log_deferred(i):
+        db.log('DEBUG', 'PYTHON', 'benchmark', details={'i': i})
+    
+    def db_record_fire_event(i):
+        fm.state.record_fire_event(detections=i + 1, esp32_millis=i)
+    
+    def db_recent_detections(i):
+        db.get_recent_detections(100)
+    
+    def db_iter_logs(i):
+        for _ in zip(range(500), db.iter_logs()):
+            pass
+    
+    def db_summarize_today(i):
+        db.summarize_between(today_start, today_end)
+    
+    def save_image(i):
+        if fm.save_image(jpeg, metadata={'device': DEVICE, 'chunks': 16}) is None:
+            raise RuntimeError('save_image falló')
+    
+    return {
+        'alert_fire': alert_fire,
+        'alert_clear': alert_clear,
+        'image_transfer': image_transfer,
+        'image_transfer_bin': image_transfer_bin,
+        'chunk_decode': chunk_decode,
+        'db_insert_detection': db_insert_detection,
+        'db_log_deferred': db_log_deferred,
+        'db_record_fire_event': db_record_fire_event,
+        'db_recent_detections': db_recent_detections,
+        'db_iter_logs': db_iter_logs,
+        'db_summarize_today': db_summarize_today,
+        'save_image': save_image
+    }
+
+# Las transferencias completas son ~16 mensajes y escriben en disco
+HEAVY_CASES = {'image_transfer', 'image_transfer_bin', 'save_image'}
+
+def run_benchmarks(iterations: int, warmup: int, only: List[str] = None,
+                   metrics: bool = False, keep: bool = False) -> Dict:
+    """
+    Importar fire_monitor sobre rutas temporales y medir todos los casos
+    
+    La base de datos va a un directorio temporal; imágenes y latest.jpg a
+    tmpfs (/dev/shm) si existe, para medir CPU y SQLite y no la tarjeta SD.
+    Telegram queda deshabilitado y las publicaciones MQTT se descartan.
+    """
+    db_dir = tempfile.mkdtemp(prefix='fire_bench_db_')
+    shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    images_dir = tempfile.mkdtemp(prefix='fire_bench_img_', dir=shm)
+    
+    os.environ['FIRE_MONITOR_DB'] = os.path.join(db_dir, 'fire_monitor.db')
+    os.environ['FIRE_MONITOR_IMAGES_DIR'] = os.path.join(images_dir, 'images')
+    os.environ['FIRE_MONITOR_LATEST_IMAGE'] = os.path.join(images_dir, 'public', 'latest.jpg')
+    os.environ['FIRE_MONITOR_METRICS'] = '1' if metrics else '0'
+    
+    # Los prints del monitor van a /dev/null (en el Pi los recoge journald)
+    devnull = open(os.devnull, 'w')
+    try:
+        with contextlib.redirect_stdout(devnull):
+            import telegram_notifier
+            telegram_notifier.TELEGRAM_ENABLED = False
+            import fire_monitor as fm
+            
+            fm.client = _NullClient()
+            os.makedirs(fm.IMAGES_DIR, exist_ok=True)
+            os.makedirs(os.path.dirname(fm.LATEST_IMAGE_PATH), exist_ok=True)
+            
+            jpeg = make_jpeg()
+            cases = build_cases(fm, jpeg)
+            names = only or list(cases)
+            for name in names:
+                if name not in cases:
+                    raise ValueError(f"Caso desconocido: {name}")
+            
+            results = {}
+            for name in names:
+                count = max(1, iterations // 5) if name in HEAVY_CASES else iterations
+                results[name] = measure(cases[name], count, warmup)
+                fm.db.flush_writes()
+            
+            fm.db.close()
+    finally:
+        devnull.close()
+        if not keep:
+            shutil.rmtree(db_dir, ignore_errors=True)
+            shutil.rmtree(images_dir, ignore_errors=True)
+    
+    return {
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'image_bytes': len(jpeg),
+        'peak_rss_kb': _peak_rss_kb(),
+        'cases': results
+    }
+
+# ============================================
+# LÍNEA BASE
+# ============================================
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Regresiones frente a la línea base
+    
+    Un caso retrocede si pierde más de tolerance en ops/s o si su p99 (o
+    el pico de RSS del proceso) crece más de tolerance.
+    
+    Returns:
+        Lista de descripciones (vacía si no hay regresiones)
+    """
+    regressions = []
+    
+    for name, current in report['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous:
+            continue
+        if current['ops_per_sec'] < previous['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['ops_per_sec']} ops/s "
+                               f"(línea base {previous['ops_per_sec']})")
+        if current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']} ms "
+                               f"(línea base {previous['p99_ms']})")
+    
+    previous_rss = baseline.get('peak_rss_kb')
+    if previous_rss and report['peak_rss_kb'] > previous_rss * (1 + tolerance):
+        regressions.append(f"RSS pico: {report['peak_rss_kb']} KB (línea base {previous_rss})")
+    
+    return regressions
+
+def print_report(report: Dict, baseline: Dict = None):
+    print(f"\n⏱️  Fire Monitor benchmarks ({report['machine']}, Python {report['python']})")
+    print(f"   Imagen sintética: {report['image_bytes']} bytes, chunks de {CHUNK_SIZE}\n")
+    print(f"   {'caso':<24}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'Δ ops/s':>10}")
+    
+    for name, result in report['cases'].items():
+        delta = ''
+        previous = (baseline or {}).get('cases', {}).get(name)
+        if previous and previous['ops_per_sec']:
+            delta = f"{(result['ops_per_sec'] / previous['ops_per_sec'] - 1) * 100:+.0f}%"
+        print(f"   {name:<24}{result['ops_per_sec']:>10}{result['p50_ms']:>10}"
+              f"{result['p99_ms']:>10}{delta:>10}")
+    
+    print(f"\n   RSS pico: {report['peak_rss_kb'] / 1024:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks del Fire Monitor')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--cases', nargs='+', help='Casos a ejecutar (por defecto todos)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Archivo JSON de línea base')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Guardar los resultados como nueva línea base')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Regresión permitida (0.20 = 20%%)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Medir con las métricas de Prometheus activas')
+    parser.add_argument('--json', action='store_true', help='Imprimir el informe en JSON')
+    parser.add_argument('--keep', action='store_true', help='Conservar los archivos temporales')
+    args = parser.parse_args()
+    
+    report = run_benchmarks(args.iterations, args.warmup, args.cases, args.metrics, args.keep)
+    
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, baseline)
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Línea base guardada en {args.baseline}")
+        return 0
+    
+    if baseline is None:
+        print(f"\nℹ️  Sin línea base ({args.baseline}); usar --save-baseline para crearla")
+        return 0
+    
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"   • {regression}")
+        return 1
+    
+    print(f"\n✓ Sin regresiones (tolerancia {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Fire Monitor - Config Service
+Configuración en memoria (system_config + telegram_config.py) que se
+recarga sola al cambiar y avisa a los suscriptores
+"""
+
+import importlib.util
+import os
+import runpy
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+# Valores de telegram_config.py que se vigilan (mismos nombres que el archivo)
+TELEGRAM_KEYS = (
+    'TELEGRAM_BOT_TOKEN',
+    'TELEGRAM_CHAT_ID',
+    'TELEGRAM_ENABLED',
+    'SEND_IMAGES',
+    'ALERT_COOLDOWN',
+    'MESSAGES'
+)
+
+class ConfigService:
+    def __init__(self, db, telegram_config_path: str = None, poll_interval: float = 2.0):
+        """
+        Inicializar servicio de configuración
+        
+        Los cambios se detectan sin releer nada mientras no haya cambios:
+        PRAGMA data_version (cambia cuando otra conexión confirma cualquier
+        transacción) y, solo entonces, config_version (la incrementan los
+        triggers de system_config); para telegram_config.py, su mtime.
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            telegram_config_path: Ruta a telegram_config.py (por defecto el
+                                  módulo que encuentre Python)
+            poll_interval: Segundos entre comprobaciones (hilo de start())
+        """
+        self.db = db
+        self.poll_interval = poll_interval
+        self.telegram_config_path = telegram_config_path or self._find_telegram_config()
+        
+        self._values = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        
+        # Conexión propia de solo lectura para data_version (no se comparte
+        # con el pool: sus escrituras también deben contar como cambios)
+        self._conn = sqlite3.connect(db.db_path, check_same_thread=False)
+        self._data_version = None
+        self._config_version = None
+        self._telegram_mtime = None
+        
+        self._stop = threading.Event()
+        self._thread = None
+        
+        self.check()
+    
+    # ============================================
+    # LECTURAS
+    # ============================================
+    
+    def get(self, key: str, default=None):
+        """Valor actual (sin acceso a disco)"""
+        value = self._values.get(key)
+        return default if value is None else value
+    
+    def snapshot(self) -> Dict:
+        """Copia de toda la configuración"""
+        with self._lock:
+            return dict(self._values)
+    
+    # ============================================
+    # SUSCRIPCIONES
+    # ============================================
+    
+    def subscribe(self, callback: Callable[[Dict], None], keys: Iterable[str] = None,
+                  initial: bool = False):
+        """
+        Registrar un callback para cambios de configuración
+        
+        Args:
+            callback: Recibe un dict clave -> valor nuevo con las claves
+                      cambiadas (solo las de keys, si se indicó)
+            keys: Claves que interesan (None = todas)
+            initial: Llamar de inmediato con los valores actuales
+        """
+        keys = set(keys) if keys is not None else None
+        with self._lock:
+            self._subscribers.append((callback, keys))
+            current = dict(self._values)
+        
+        if initial:
+            callback({k: v for k, v in current.items() if keys is None or k in keys})
+    
+    # ============================================
+    # DETECCIÓN DE CAMBIOS
+    # ============================================
+    
+    def check(self) -> Dict:
+        """
+        Recargar lo que haya cambiado y notificar
+        
+        Returns:
+            Dict clave -> valor nuevo con los cambios detectados
+        """
+        with self._check_lock:
+            updated = {}
+            
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version:
+                # Cualquier escritura cambia data_version (detecciones, logs...):
+                # solo se relee system_config si su propia versión cambió
+                self._data_version = version
+                config_version = self._read_config_version()
+                if config_version is None or config_version != self._config_version:
+                    self._config_version = config_version
+                    updated.update(self.db.get_all_config())
+            
+            mtime = self._telegram_mtime_ns()
+            if mtime != self._telegram_mtime:
+                self._telegram_mtime = mtime
+                updated.update(self._load_telegram_config())
+            
+            with self._lock:
+                changed = {k: v for k, v in updated.items() if self._values.get(k) != v}
+                self._values.update(changed)
+                subscribers = list(self._subscribers)
+        
+        if changed:
+            for callback, keys in subscribers:
+                relevant = {k: v for k, v in changed.items() if keys is None or k in keys}
+                if relevant:
+                    try:
+                        callback(relevant)
+                    except Exception as e:
+                        print(f"❌ Error aplicando configuración: {e}")
+        
+        return changed
+    
+    def start(self):
+        """Comprobar cambios periódicamente en segundo plano"""
+        if self._thread is not None:
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='config-service', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Detener el hilo y cerrar la conexión"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + 1)
+            self._thread = None
+        self._conn.close()
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                changed = self.check()
+                if changed:
+                    print(f"🔧 Configuración actualizada: {', '.join(sorted(changed))}")
+            except Exception as e:
+                print(f"❌ Error comprobando configuración: {e}")
+    
+    def _read_config_version(self) -> Optional[int]:
+        """Versión de system_config (None con un schema sin config_version)"""
+        try:
+            row = self._conn.execute('SELECT version FROM config_version WHERE id = 1').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+    
+    @staticmethod
+    def _find_telegram_config() -> Optional[str]:
+        spec = importlib.util.find_spec('telegram_config')
+        return spec.origin if spec else None
+    
+    def _telegram_mtime_ns(self) -> Optional[int]:
+        if not self.telegram_config_path:
+            return None
+        try:
+            return os.stat(self.telegram_config_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _load_telegram_config(self) -> Dict:
+        """Ejecutar telegram_config.py y tomar los valores vigilados"""
+        if self._telegram_mtime is None:
+            return {}
+        try:
+            values = runpy.run_path(self.telegram_config_path)
+        except Exception as e:
+            # Archivo a medio editar: se conserva la configuración anterior
+            print(f"⚠️ telegram_config.py inválido, se ignora: {e}")
+            return {}
+        return {key: values[key] for key in TELEGRAM_KEYS if key in values}
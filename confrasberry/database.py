@@ -4,16 +4,271 @@ Fire Monitor - Database Handler
 Maneja todas las operaciones de base de datos SQLite
 """
 
+import re
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Tuple
+import threading
+import weakref
+from datetime import datetime, timedelta, date as date_type, timezone
+from typing import Optional, Dict, List, Tuple, Union
 import os
+from db_writer import WriteBehindQueue
+
+# Los días locales siguen la hora local del sistema, igual que
+# DATE(..., 'localtime') en los triggers y vistas de SQLite (que guarda
+# CURRENT_TIMESTAMP en UTC): la zona se configura en el host (timedatectl)
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Schema instalado en el Pi; si no existe se usa el fire_monitor.sql del repositorio
+SCHEMA_PATH = '/home/pi/fire_monitor/schema.sql'
+BUNDLED_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fire_monitor.sql')
+
+# PRAGMAs aplicados a cada conexión del pool (modo pooled)
+DEFAULT_PRAGMAS = {
+    # Primero: en una base nueva auto_vacuum solo se puede fijar antes de
+    # que se escriba la cabecera (journal_mode=WAL ya la escribe)
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',      # Lectores no bloquean al escritor
+    'synchronous': 'NORMAL',    # Con WAL, fsync solo en checkpoint
+    'cache_size': -8000,        # ~8 MB de caché de páginas (negativo = KiB)
+    'mmap_size': 33554432,      # 32 MB mapeados en memoria
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # ms esperando un lock antes de fallar
+    'foreign_keys': 'ON'
+}
+
+def local_today() -> date_type:
+    """Fecha de hoy en la hora local del sistema (la de 'localtime')"""
+    return datetime.now().date()
+
+def to_db_timestamp(value: Union[str, datetime]) -> str:
+    """
+    Convertir a timestamp UTC 'YYYY-MM-DD HH:MM:SS' comparable con las columnas
+    
+    Los str se asumen ya en ese formato (UTC); un datetime sin zona se
+    interpreta en la hora local del sistema (con su horario de verano).
+    """
+    if isinstance(value, str):
+        return value
+    return value.astimezone(timezone.utc).strftime(DB_TIMESTAMP_FORMAT)
+
+def local_day_range(day: Union[str, date_type] = None) -> Tuple[str, str]:
+    """
+    Límites UTC [inicio, fin) de un día local
+    
+    Args:
+        day: 'YYYY-MM-DD', date o None (hoy)
+    
+    Returns:
+        Tupla (inicio, fin) para usar con columna >= ? AND columna < ?
+    """
+    if day is None:
+        day = local_today()
+    elif isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    
+    next_day = day + timedelta(days=1)
+    start = datetime(day.year, day.month, day.day)
+    end = datetime(next_day.year, next_day.month, next_day.day)
+    return to_db_timestamp(start), to_db_timestamp(end)
+
+def days_ago_timestamp(days: int) -> str:
+    """Timestamp UTC de hace N días (límite para retención)"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    return cutoff.strftime(DB_TIMESTAMP_FORMAT)
+
+# Columnas añadidas a tablas existentes (CREATE TABLE IF NOT EXISTS no las
+# agrega a una base ya creada): tabla -> [(columna, tipo)]
+ADDED_COLUMNS = {
+    'captured_images': [('device', 'TEXT')]
+}
+
+# Sentencias compartidas entre la escritura directa y la diferida
+SQL_INSERT_DETECTION = '''
+    INSERT INTO fire_detections 
+    (sensor_type, detected, confidence, esp32_millis)
+    VALUES (?, ?, ?, ?)
+'''
+
+SQL_INSERT_LOG = '''
+    INSERT INTO system_logs 
+    (log_level, component, message, details)
+    VALUES (?, ?, ?, ?)
+'''
+
+SQL_INSERT_OUTBOX = '''
+    INSERT INTO notification_outbox 
+    (alert_id, kind, payload)
+    VALUES (?, ?, ?)
+'''
+
+def parse_config_value(value: str, value_type: str):
+    """Convertir un valor de system_config según su value_type"""
+    if value_type == 'integer':
+        return int(value)
+    elif value_type == 'boolean':
+        return value.lower() == 'true'
+    elif value_type == 'json':
+        return json.loads(value)
+    elif value_type == 'float':
+        return float(value)
+    else:
+        return value
+
+def classify_severity(detections: int) -> str:
+    """Severidad de una alerta según las detecciones acumuladas"""
+    if detections > 5:
+        return 'HIGH'
+    if detections > 2:
+        return 'MEDIUM'
+    return 'LOW'
+
+_STATEMENT_RE = re.compile(r'\b(?:INTO|FROM|UPDATE)\s+(\w+)', re.IGNORECASE)
+
+def _statement_label(sql: str) -> Tuple[str, str]:
+    """(operación, tabla) de una sentencia, p.ej. ('INSERT', 'system_logs')"""
+    words = sql.split(None, 1)
+    op = words[0].upper() if words else ''
+    match = _STATEMENT_RE.search(sql)
+    return op, match.group(1) if match else ''
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Conexión que mide cada execute/executemany/commit en un Metrics
+    
+    Solo se usa si FireMonitorDB recibe metrics; sin ellas las conexiones
+    son sqlite3.Connection normales.
+    """
+    metrics = None
+    _labels = {}
+    
+    def _label(self, sql: str) -> Tuple[str, str]:
+        label = self._labels.get(sql)
+        if label is None:
+            label = _statement_label(sql)
+            if len(self._labels) < 512:
+                self._labels[sql] = label
+        return label
+    
+    def execute(self, sql, parameters=()):
+        op, table = self._label(sql)
+        with self.metrics.timer('db_statement_seconds', op=op, table=table):
+            return super().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        op, table = self._label(sql)
+        with self.metrics.timer('db_statement_seconds', op=op + '_MANY', table=table):
+            return super().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        with self.metrics.timer('db_statement_seconds', op='COMMIT', table=''):
+            return super().commit()
+
+class _ThreadConnection:
+    """
+    Conexión del pool de un hilo (se guarda en threading.local)
+    
+    Cuando el hilo termina, threading.local suelta este objeto y el
+    finalizador cierra la conexión y la quita del pool.
+    """
+    __slots__ = ('conn', '__weakref__')
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+def _close_thread_connection(lock: threading.Lock, pool: set, conn: sqlite3.Connection):
+    """Finalizador de _ThreadConnection (puede ejecutarse en cualquier hilo)"""
+    with lock:
+        pool.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+class KeysetIterator:
+    """
+    Recorrido perezoso de una tabla por páginas (paginación keyset)
+    
+    Cada página es una consulta independiente que continúa después de la
+    última clave (tiempo, id) vista, así que el coste no crece con la
+    posición (sin OFFSET) y no se mantiene abierta una transacción de
+    lectura entre páginas. La memoria usada es la de una página.
+    
+    Uso:
+        it = db.iter_logs(level='ERROR', page_size=200)
+        for row in it:
+            ...
+        it.cursor  # (tiempo, id) de la última fila entregada, para reanudar
+    """
+    
+    def __init__(self, fetch_page, key_name: str, cursor=None):
+        self._fetch_page = fetch_page
+        self._key_name = key_name
+        self.cursor = tuple(cursor) if cursor else None
+        self.exhausted = False
+    
+    def next_page(self) -> List[Dict]:
+        """Siguiente página completa (lista vacía al terminar)"""
+        if self.exhausted:
+            return []
+        
+        rows, full = self._fetch_page(self.cursor)
+        if rows:
+            last = rows[-1]
+            self.cursor = (last[self._key_name], last['id'])
+        if not full:
+            self.exhausted = True
+        return rows
+    
+    def __iter__(self):
+        while not self.exhausted:
+            rows, full = self._fetch_page(self.cursor)
+            if not full:
+                self.exhausted = True
+            for row in rows:
+                # Actualizar por fila: si el consumidor corta a mitad de
+                # página, el cursor reanuda justo después de lo entregado
+                self.cursor = (row[self._key_name], row['id'])
+                yield row
 
 class FireMonitorDB:
-    def __init__(self, db_path: str = "/home/pi/fire_monitor/fire_monitor.db"):
-        """Inicializar conexión a la base de datos"""
+    def __init__(self, db_path: str = "/home/pi/fire_monitor/fire_monitor.db",
+                 pooled: bool = False, pragmas: Dict = None, metrics=None):
+        """
+        Inicializar conexión a la base de datos
+        
+        Args:
+            db_path: Ruta al archivo SQLite
+            pooled: Reutilizar una conexión persistente por hilo en lugar de
+                    abrir y cerrar una conexión por operación. Pensado para
+                    hilos de larga vida (paho, trabajadores, outbox); la
+                    conexión de un hilo que termina (manejadores HTTP,
+                    temporizadores) se cierra al terminar el hilo
+            pragmas: PRAGMAs adicionales o que reemplazan a DEFAULT_PRAGMAS
+                     (solo en modo pooled)
+            metrics: metrics.Metrics opcional para medir cada sentencia
+        """
         self.db_path = db_path
+        self.pooled = pooled
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        
+        # Fábrica de conexiones: con métricas habilitadas, una subclase que
+        # mide cada sentencia (sin coste alguno si no hay métricas)
+        self._connection_factory = sqlite3.Connection
+        if metrics is not None and metrics.enabled:
+            self._connection_factory = type('TimedConnection', (TimedConnection,),
+                                            {'metrics': metrics, '_labels': {}})
+        
+        # Pool: una conexión por hilo (paho, hilo de estadísticas, etc.)
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._pool_connections = set()
+        
+        # Escritura diferida (ver start_write_behind)
+        self.writer = None
+        
         self.ensure_directory()
         self.init_database()
     
@@ -25,43 +280,129 @@ class FireMonitorDB:
     
     def get_connection(self) -> sqlite3.Connection:
         """Obtener conexión a la base de datos"""
-        conn = sqlite3.connect(self.db_path)
+        if self.pooled:
+            holder = getattr(self._local, 'holder', None)
+            if holder is None:
+                holder = self._local.holder = _ThreadConnection(self._open_pooled_connection())
+                weakref.finalize(holder, _close_thread_connection,
+                                 self._pool_lock, self._pool_connections, holder.conn)
+            return holder.conn
+        
+        conn = sqlite3.connect(self.db_path, factory=self._connection_factory)
         conn.row_factory = sqlite3.Row  # Permite acceso por nombre de columna
         return conn
     
+    def release_connection(self, conn: sqlite3.Connection):
+        """Liberar conexión (en modo pooled queda abierta para el hilo)"""
+        if not self.pooled:
+            conn.close()
+        elif conn.in_transaction:
+            # Una operación falló antes del commit: no arrastrar la
+            # transacción a la siguiente operación del hilo
+            conn.rollback()
+    
+    def _open_pooled_connection(self) -> sqlite3.Connection:
+        """Abrir una conexión persistente para el hilo actual"""
+        # check_same_thread=False solo para poder cerrarla desde close() o
+        # al terminar el hilo; cada conexión se usa exclusivamente desde el
+        # hilo que la abrió
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               factory=self._connection_factory)
+        conn.row_factory = sqlite3.Row
+        
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        
+        with self._pool_lock:
+            self._pool_connections.add(conn)
+        return conn
+    
+    def start_write_behind(self, flush_interval_ms: int = 200, max_batch: int = 100,
+                           max_queue: int = 5000):
+        """
+        Activar escritura diferida de logs y detecciones
+        
+        Las filas se agrupan y se confirman con executemany en una sola
+        transacción cada flush_interval_ms o cada max_batch filas.
+        """
+        if self.writer is None:
+            self.writer = WriteBehindQueue(self, flush_interval_ms, max_batch, max_queue)
+        self.writer.start()
+    
+    def flush_writes(self, timeout: float = 5.0) -> bool:
+        """Esperar a que las escrituras diferidas pendientes estén en disco"""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+    
+    def _submit_write(self, sql: str, params: Tuple) -> bool:
+        """Encolar una escritura diferida (False si hay que escribir ya)"""
+        return self.writer is not None and self.writer.submit(sql, params)
+    
+    def close(self):
+        """Vaciar escrituras diferidas y cerrar todas las conexiones del pool"""
+        if self.writer is not None:
+            self.writer.stop()
+        
+        with self._pool_lock:
+            connections = list(self._pool_connections)
+            self._pool_connections.clear()
+        
+        for conn in connections:
+            conn.close()
+        
+        self._local = threading.local()
+    
     def init_database(self):
         """Inicializar base de datos con el schema"""
-        with open('/home/pi/fire_monitor/schema.sql', 'r') as f:
+        schema_path = SCHEMA_PATH if os.path.exists(SCHEMA_PATH) else BUNDLED_SCHEMA_PATH
+        with open(schema_path, 'r') as f:
             schema = f.read()
         
         conn = self.get_connection()
         try:
             conn.executescript(schema)
+            self._add_missing_columns(conn)
             conn.commit()
             print("✓ Base de datos inicializada")
         except Exception as e:
             print(f"❌ Error inicializando base de datos: {e}")
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection):
+        """Agregar las columnas de ADDED_COLUMNS que falten (bases antiguas)"""
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for name, column_type in columns:
+                if name not in existing:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
     
     # ============================================
     # DETECCIONES
     # ============================================
     
     def insert_detection(self, detected: bool, sensor_type: str = 'KY-026', 
-                        esp32_millis: int = None, confidence: int = 100) -> int:
-        """Registrar una detección del sensor"""
+                        esp32_millis: int = None, confidence: int = 100,
+                        sync: bool = True) -> Optional[int]:
+        """
+        Registrar una detección del sensor
+        
+        Con sync=False y la escritura diferida activa, la fila se encola y
+        se devuelve None (no hay lastrowid disponible todavía).
+        """
+        params = (sensor_type, detected, confidence, esp32_millis)
+        if not sync and self._submit_write(SQL_INSERT_DETECTION, params):
+            return None
+        
         conn = self.get_connection()
         try:
-            cursor = conn.execute('''
-                INSERT INTO fire_detections 
-                (sensor_type, detected, confidence, esp32_millis)
-                VALUES (?, ?, ?, ?)
-            ''', (sensor_type, detected, confidence, esp32_millis))
+            cursor = conn.execute(SQL_INSERT_DETECTION, params)
             conn.commit()
             return cursor.lastrowid
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_recent_detections(self, limit: int = 100) -> List[Dict]:
         """Obtener detecciones recientes"""
@@ -74,20 +415,12 @@ class FireMonitorDB:
             ''', (limit,))
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_detections_by_date(self, date: str) -> List[Dict]:
-        """Obtener detecciones de una fecha específica (YYYY-MM-DD)"""
-        conn = self.get_connection()
-        try:
-            cursor = conn.execute('''
-                SELECT * FROM fire_detections 
-                WHERE DATE(timestamp) = ?
-                ORDER BY timestamp DESC
-            ''', (date,))
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+        """Obtener detecciones de una fecha local específica (YYYY-MM-DD)"""
+        start, end = local_day_range(date)
+        return self.get_detections_between(start, end)
     
     # ============================================
     # ALERTAS
@@ -110,7 +443,98 @@ class FireMonitorDB:
             self.log('INFO', 'ALERT', f'Alerta creada: {alert_type} (ID: {alert_id})')
             return alert_id
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def record_fire_event(self, detections: int, esp32_millis: int = None,
+                          sensor_type: str = 'KY-026', confidence: int = 100,
+                          alert_type: str = 'FIRE_DETECTED',
+                          active_alert: Dict = None, notification: Dict = None) -> Dict:
+        """
+        Registrar una detección positiva y su alerta en una sola transacción
+        
+        Inserta la detección, busca la alerta activa y la actualiza o crea
+        una nueva (con su log). Los contadores los actualizan los triggers
+        dentro de la misma transacción. BEGIN IMMEDIATE toma el lock de
+        escritura antes de leer la alerta activa, así dos eventos
+        simultáneos no pueden crear dos alertas.
+        
+        Args:
+            active_alert: Alerta activa conocida por el llamador (caché, con
+                          id y severity); se actualiza directamente si sigue
+                          ACTIVE y solo si no se consulta la tabla
+            notification: Datos del aviso de alerta nueva; se añade al
+                          outbox ('fire_alert', con la severidad calculada)
+                          en la misma transacción que la alerta
+        
+        Returns:
+            Dict con detection_id, alert_id, created (True si la alerta es
+            nueva), severity, detections_count y outbox_id (o None)
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            
+            detection_id = conn.execute(
+                SQL_INSERT_DETECTION, (sensor_type, True, confidence, esp32_millis)
+            ).lastrowid
+            
+            active = None
+            if active_alert is not None:
+                cursor = conn.execute('''
+                    UPDATE alerts 
+                    SET detections_count = ?
+                    WHERE id = ? AND status = 'ACTIVE'
+                ''', (detections, active_alert['id']))
+                if cursor.rowcount == 1:
+                    active = active_alert
+            
+            if active is None:
+                active = conn.execute('''
+                    SELECT id, severity FROM alerts 
+                    WHERE status = 'ACTIVE' 
+                    ORDER BY created_at DESC 
+                    LIMIT 1
+                ''').fetchone()
+                if active:
+                    conn.execute('''
+                        UPDATE alerts 
+                        SET detections_count = ?
+                        WHERE id = ?
+                    ''', (detections, active['id']))
+            
+            if active:
+                alert_id = active['id']
+                severity = active['severity']
+                created = False
+            else:
+                severity = classify_severity(detections)
+                created = True
+                alert_id = conn.execute('''
+                    INSERT INTO alerts 
+                    (detection_id, alert_type, severity, detections_count, status)
+                    VALUES (?, ?, ?, ?, 'ACTIVE')
+                ''', (detection_id, alert_type, severity, detections)).lastrowid
+                conn.execute(SQL_INSERT_LOG, ('INFO', 'ALERT',
+                             f'Alerta creada: {alert_type} (ID: {alert_id})', None))
+            
+            outbox_id = None
+            if created and notification is not None:
+                payload = dict(notification, severity=severity, detections=detections)
+                outbox_id = conn.execute(SQL_INSERT_OUTBOX,
+                                         (alert_id, 'fire_alert', json.dumps(payload))).lastrowid
+            
+            conn.commit()
+            
+            return {
+                'detection_id': detection_id,
+                'alert_id': alert_id,
+                'created': created,
+                'severity': severity,
+                'detections_count': detections,
+                'outbox_id': outbox_id
+            }
+        finally:
+            self.release_connection(conn)
     
     def get_active_alert(self) -> Optional[Dict]:
         """Obtener la alerta activa actual (si existe)"""
@@ -125,7 +549,7 @@ class FireMonitorDB:
             row = cursor.fetchone()
             return dict(row) if row else None
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_alert_by_id(self, alert_id: int) -> Optional[Dict]:
         """Obtener una alerta específica por ID"""
@@ -140,7 +564,7 @@ class FireMonitorDB:
             row = cursor.fetchone()
             return dict(row) if row else None
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def update_alert_detections(self, alert_id: int, detections_count: int):
         """Actualizar contador de detecciones de una alerta"""
@@ -153,7 +577,7 @@ class FireMonitorDB:
             ''', (detections_count, alert_id))
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def resolve_alert(self, alert_id: int, status: str = 'RESOLVED'):
         """Resolver una alerta activa"""
@@ -169,7 +593,7 @@ class FireMonitorDB:
             # Log
             self.log('INFO', 'ALERT', f'Alerta {alert_id} resuelta: {status}')
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_alerts(self, status: str = None, limit: int = 50) -> List[Dict]:
         """Obtener alertas (filtradas por estado opcional)"""
@@ -191,7 +615,196 @@ class FireMonitorDB:
             
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    # ============================================
+    # OUTBOX DE NOTIFICACIONES
+    # ============================================
+    
+    def enqueue_notification(self, kind: str, payload: Dict, alert_id: int = None) -> int:
+        """Añadir una notificación pendiente al outbox"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(SQL_INSERT_OUTBOX, (alert_id, kind, json.dumps(payload)))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            self.release_connection(conn)
+    
+    def get_due_notifications(self, limit: int = 20) -> List[Dict]:
+        """Notificaciones pendientes cuyo próximo intento ya venció (más antiguas primero)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT * FROM notification_outbox
+                WHERE status = 'PENDING' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            ''', (limit,))
+            notifications = []
+            for row in cursor.fetchall():
+                notification = dict(row)
+                notification['payload'] = json.loads(notification['payload'])
+                notifications.append(notification)
+            return notifications
+        finally:
+            self.release_connection(conn)
+    
+    def mark_notification_delivered(self, notification_id: int):
+        """
+        Marcar una notificación como entregada
+        
+        Si es el aviso de una alerta, alerts.notification_sent se actualiza
+        en la misma transacción.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                UPDATE notification_outbox
+                SET status = 'DELIVERED', delivered_at = CURRENT_TIMESTAMP,
+                    attempts = attempts + 1, last_error = NULL
+                WHERE id = ?
+            ''', (notification_id,))
+            conn.execute('''
+                UPDATE alerts
+                SET notification_sent = 1, notification_sent_at = CURRENT_TIMESTAMP
+                WHERE id = (SELECT alert_id FROM notification_outbox
+                            WHERE id = ? AND kind = 'fire_alert')
+            ''', (notification_id,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def reschedule_notification(self, notification_id: int, delay_seconds: float,
+                                error: str = None):
+        """Registrar un intento fallido y programar el siguiente"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE notification_outbox
+                SET attempts = attempts + 1, last_error = ?,
+                    next_attempt_at = DATETIME('now', ?)
+                WHERE id = ?
+            ''', (error, f'+{int(delay_seconds)} seconds', notification_id))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def defer_notification(self, notification_id: int, delay_seconds: float, attempts: int):
+        """
+        Aplazar una notificación agrupada en un resumen o álbum (sin contar
+        intento); si el envío agrupado no se confirma, vuelve a vencer
+        
+        No toca la fila si ya se resolvió o se reprogramó entretanto
+        (attempts distinto).
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE notification_outbox
+                SET next_attempt_at = DATETIME('now', ?)
+                WHERE id = ? AND status = 'PENDING' AND attempts = ?
+            ''', (f'+{int(delay_seconds)} seconds', notification_id, attempts))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def fail_notification(self, notification_id: int, error: str = None):
+        """Abandonar una notificación (demasiado antigua o sin destinatario)"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE notification_outbox
+                SET status = 'FAILED', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            ''', (error, notification_id))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def get_outbox_stats(self) -> Dict:
+        """Pendientes y antigüedad (segundos) del pendiente más antiguo"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT COUNT(*) AS pending,
+                       MIN(created_at) AS oldest_created_at,
+                       MAX(attempts) AS max_attempts
+                FROM notification_outbox
+                WHERE status = 'PENDING'
+            ''')
+            stats = dict(cursor.fetchone())
+            stats['oldest_age_seconds'] = None
+            if stats['oldest_created_at']:
+                oldest = datetime.strptime(stats['oldest_created_at'], DB_TIMESTAMP_FORMAT)
+                stats['oldest_age_seconds'] = round(
+                    (datetime.now(timezone.utc).replace(tzinfo=None) - oldest).total_seconds(), 1)
+            return stats
+        finally:
+            self.release_connection(conn)
+    
+    # ============================================
+    # CACHÉ DE ARCHIVOS DE TELEGRAM
+    # ============================================
+    
+    def load_telegram_files(self, limit: int = 500) -> List[Dict]:
+        """file_id guardados, de menos a más recientemente usados"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT content_hash, file_id, file_size FROM (
+                    SELECT * FROM telegram_file_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT ?
+                ) ORDER BY last_used_at
+            ''', (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+    
+    def save_telegram_file(self, content_hash: str, file_id: str, file_size: int = None,
+                           max_entries: int = 500):
+        """Guardar un file_id y descartar los menos usados por encima de max_entries"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO telegram_file_cache (content_hash, file_id, file_size)
+                VALUES (?, ?, ?)
+            ''', (content_hash, file_id, file_size))
+            conn.execute('''
+                DELETE FROM telegram_file_cache
+                WHERE content_hash IN (
+                    SELECT content_hash FROM telegram_file_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (max_entries,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def touch_telegram_file(self, content_hash: str):
+        """Marcar un file_id como usado ahora (escritura diferida si está activa)"""
+        sql = 'UPDATE telegram_file_cache SET last_used_at = CURRENT_TIMESTAMP WHERE content_hash = ?'
+        if self._submit_write(sql, (content_hash,)):
+            return
+        
+        conn = self.get_connection()
+        try:
+            conn.execute(sql, (content_hash,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+    
+    def delete_telegram_file(self, content_hash: str):
+        """Olvidar un file_id (Telegram ya no lo acepta)"""
+        conn = self.get_connection()
+        try:
+            conn.execute('DELETE FROM telegram_file_cache WHERE content_hash = ?', (content_hash,))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
     
     # ============================================
     # IMÁGENES
@@ -199,24 +812,25 @@ class FireMonitorDB:
     
     def save_image_record(self, alert_id: int, file_path: str, file_name: str,
                          image_size: int, width: int, height: int, 
-                         chunks_total: int = 1, trigger: str = 'AUTO') -> int:
+                         chunks_total: int = 1, trigger: str = 'AUTO',
+                         device: str = None) -> int:
         """Guardar registro de imagen capturada"""
         conn = self.get_connection()
         try:
             cursor = conn.execute('''
                 INSERT INTO captured_images 
                 (alert_id, file_path, file_name, image_size_bytes, 
-                 width, height, chunks_total, capture_trigger)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                 width, height, chunks_total, capture_trigger, device)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (alert_id, file_path, file_name, image_size, 
-                  width, height, chunks_total, trigger))
+                  width, height, chunks_total, trigger, device))
             conn.commit()
             
             # Log
             self.log('INFO', 'CAMERA', f'Imagen guardada: {file_name} ({image_size} bytes)')
             return cursor.lastrowid
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_images_by_alert(self, alert_id: int) -> List[Dict]:
         """Obtener todas las imágenes de una alerta"""
@@ -229,7 +843,7 @@ class FireMonitorDB:
             ''', (alert_id,))
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_recent_images(self, limit: int = 20) -> List[Dict]:
         """Obtener imágenes recientes"""
@@ -244,16 +858,151 @@ class FireMonitorDB:
             ''', (limit,))
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def get_latest_image(self) -> Optional[Dict]:
+        """Obtener la imagen más reciente"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT * FROM captured_images 
+                ORDER BY capture_time DESC, id DESC 
+                LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            self.release_connection(conn)
+    
+    def get_max_image_id(self) -> int:
+        """Mayor id de captured_images (0 si no hay imágenes)"""
+        conn = self.get_connection()
+        try:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM captured_images').fetchone()[0]
+        finally:
+            self.release_connection(conn)
+    
+    def get_all_images(self) -> List[Dict]:
+        """Obtener todos los registros de imágenes (en orden de inserción)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('SELECT * FROM captured_images ORDER BY id')
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+    
+    def get_images_for_eviction(self, before: str = None, linked: bool = None,
+                                limit: int = 50) -> List[Dict]:
+        """
+        Imágenes más antiguas primero (candidatas a eliminar)
+        
+        Args:
+            before: Solo capturas anteriores a este timestamp UTC
+            linked: True solo con alerta, False solo sin alerta, None todas
+            limit: Tamaño del lote
+        """
+        query = 'SELECT id, file_path, image_size_bytes, alert_id FROM captured_images WHERE 1=1'
+        params = []
+        
+        if before is not None:
+            query += ' AND capture_time < ?'
+            params.append(to_db_timestamp(before))
+        if linked is True:
+            query += ' AND alert_id IS NOT NULL'
+        elif linked is False:
+            query += ' AND alert_id IS NULL'
+        
+        query += ' ORDER BY capture_time, id LIMIT ?'
+        params.append(limit)
+        
+        conn = self.get_connection()
+        try:
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            self.release_connection(conn)
+    
+    def delete_image_records(self, image_ids: List[int]) -> int:
+        """Eliminar registros de imágenes por ID (una transacción corta)"""
+        if not image_ids:
+            return 0
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.executemany('DELETE FROM captured_images WHERE id = ?',
+                                      [(image_id,) for image_id in image_ids])
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            self.release_connection(conn)
+    
+    def get_registered_image_paths(self, file_paths: List[str]) -> set:
+        """Cuáles de estas rutas ya tienen fila en captured_images"""
+        if not file_paths:
+            return set()
+        
+        conn = self.get_connection()
+        try:
+            placeholders = ','.join('?' * len(file_paths))
+            cursor = conn.execute(f'''
+                SELECT file_path FROM captured_images
+                WHERE file_path IN ({placeholders})
+            ''', list(file_paths))
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            self.release_connection(conn)
+    
+    def insert_existing_images(self, images: List[Dict]) -> List[int]:
+        """
+        Registrar imágenes que ya están en disco (una transacción)
+        
+        Args:
+            images: dicts con file_path, file_name, image_size y
+                    capture_time (UTC 'YYYY-MM-DD HH:MM:SS')
+        
+        Returns:
+            IDs asignados, en el mismo orden
+        """
+        if not images:
+            return []
+        
+        conn = self.get_connection()
+        try:
+            ids = []
+            for image in images:
+                cursor = conn.execute('''
+                    INSERT INTO captured_images 
+                    (file_path, file_name, image_size_bytes, capture_time)
+                    VALUES (?, ?, ?, ?)
+                ''', (image['file_path'], image['file_name'], image['image_size'],
+                      image['capture_time']))
+                ids.append(cursor.lastrowid)
+            conn.commit()
+            return ids
+        finally:
+            self.release_connection(conn)
+    
+    def get_image_storage_bytes(self) -> int:
+        """Bytes ocupados por las imágenes registradas"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT COALESCE(SUM(image_size_bytes), 0) FROM captured_images').fetchone()
+            return row[0]
+        finally:
+            self.release_connection(conn)
     
     def delete_old_images(self, days: int = 30) -> int:
-        """Eliminar registros de imágenes antiguas"""
+        """
+        Eliminar registros de imágenes antiguas
+        
+        Solo borra las filas; para borrar también los archivos usar
+        retention.RetentionEngine.
+        """
         conn = self.get_connection()
         try:
             cursor = conn.execute('''
                 DELETE FROM captured_images 
-                WHERE capture_time < datetime('now', '-' || ? || ' days')
-            ''', (days,))
+                WHERE capture_time < ?
+            ''', (days_ago_timestamp(days),))
             conn.commit()
             deleted = cursor.rowcount
             
@@ -262,7 +1011,7 @@ class FireMonitorDB:
             
             return deleted
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     # ============================================
     # DISPOSITIVOS
@@ -285,7 +1034,7 @@ class FireMonitorDB:
             ''', (device_id, status, ip_address, uptime))
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_device_status(self, device_id: str) -> Optional[Dict]:
         """Obtener estado de un dispositivo"""
@@ -298,25 +1047,31 @@ class FireMonitorDB:
             row = cursor.fetchone()
             return dict(row) if row else None
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     # ============================================
     # LOGS
     # ============================================
     
-    def log(self, level: str, component: str, message: str, details: Dict = None):
-        """Registrar un log del sistema"""
+    def log(self, level: str, component: str, message: str, details: Dict = None,
+            sync: bool = False):
+        """
+        Registrar un log del sistema
+        
+        Si la escritura diferida está activa el log se encola, salvo que
+        se pida sync=True.
+        """
+        details_json = json.dumps(details) if details else None
+        params = (level, component, message, details_json)
+        if not sync and self._submit_write(SQL_INSERT_LOG, params):
+            return
+        
         conn = self.get_connection()
         try:
-            details_json = json.dumps(details) if details else None
-            conn.execute('''
-                INSERT INTO system_logs 
-                (log_level, component, message, details)
-                VALUES (?, ?, ?, ?)
-            ''', (level, component, message, details_json))
+            conn.execute(SQL_INSERT_LOG, params)
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_logs(self, level: str = None, component: str = None, 
                  limit: int = 100) -> List[Dict]:
@@ -340,25 +1095,41 @@ class FireMonitorDB:
             cursor = conn.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def delete_old_logs(self, days: int = 7) -> int:
-        """Eliminar logs antiguos"""
+    def delete_old_logs(self, days: int = 7, batch_size: int = 500) -> int:
+        """
+        Eliminar logs antiguos
+        
+        Se borra en lotes de batch_size filas, cada uno en su propia
+        transacción, para no bloquear a los escritores durante la limpieza.
+        """
+        cutoff = days_ago_timestamp(days)
+        deleted = 0
+        
         conn = self.get_connection()
         try:
-            cursor = conn.execute('''
-                DELETE FROM system_logs 
-                WHERE timestamp < datetime('now', '-' || ? || ' days')
-            ''', (days,))
-            conn.commit()
-            deleted = cursor.rowcount
-            
-            if deleted > 0:
-                self.log('INFO', 'DATABASE', f'Eliminados {deleted} logs antiguos')
-            
-            return deleted
+            while True:
+                cursor = conn.execute('''
+                    DELETE FROM system_logs 
+                    WHERE id IN (
+                        SELECT id FROM system_logs 
+                        WHERE timestamp < ?
+                        ORDER BY timestamp 
+                        LIMIT ?
+                    )
+                ''', (cutoff, batch_size))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
         finally:
-            conn.close()
+            self.release_connection(conn)
+        
+        if deleted > 0:
+            self.log('INFO', 'DATABASE', f'Eliminados {deleted} logs antiguos')
+        
+        return deleted
     
     # ============================================
     # CONFIGURACIÓN
@@ -378,20 +1149,19 @@ class FireMonitorDB:
                 return None
             
             value, value_type = row
-            
-            # Convertir según el tipo
-            if value_type == 'integer':
-                return int(value)
-            elif value_type == 'boolean':
-                return value.lower() == 'true'
-            elif value_type == 'json':
-                return json.loads(value)
-            elif value_type == 'float':
-                return float(value)
-            else:
-                return value
+            return parse_config_value(value, value_type)
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def get_all_config(self) -> Dict:
+        """Obtener toda la configuración (valores ya convertidos según su tipo)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('SELECT key, value, value_type FROM system_config')
+            return {row['key']: parse_config_value(row['value'], row['value_type'])
+                    for row in cursor.fetchall()}
+        finally:
+            self.release_connection(conn)
     
     def set_config(self, key: str, value, value_type: str = 'string', 
                    description: str = None):
@@ -415,12 +1185,16 @@ class FireMonitorDB:
             ''', (key, value_str, value_type, description))
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     # ============================================
     # ESTADÍSTICAS
     # ============================================
     
+    # Los contadores de daily_statistics y system_counters los mantienen
+    # triggers (ver fire_monitor.sql) en la misma transacción que cada
+    # INSERT/UPDATE, así que estas lecturas son O(1).
+    
     def get_today_stats(self) -> Dict:
         """Obtener estadísticas de hoy"""
         conn = self.get_connection()
@@ -429,7 +1203,7 @@ class FireMonitorDB:
             row = cursor.fetchone()
             return dict(row) if row else {}
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_system_status(self) -> Dict:
         """Obtener estado general del sistema"""
@@ -439,10 +1213,42 @@ class FireMonitorDB:
             row = cursor.fetchone()
             return dict(row) if row else {}
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def get_counters(self) -> Dict:
+        """Obtener contadores de estado (alertas activas, dispositivos en línea...)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('SELECT * FROM system_counters WHERE id = 1')
+            row = cursor.fetchone()
+            return dict(row) if row else {}
+        finally:
+            self.release_connection(conn)
+    
+    def refresh_counters(self):
+        """Recalcular system_counters desde las tablas (corrige posibles desvíos)"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE system_counters SET
+                    active_alerts = (SELECT COUNT(*) FROM alerts WHERE status = 'ACTIVE'),
+                    online_devices = (SELECT COUNT(*) FROM device_status WHERE status = 'online'),
+                    last_detection = (SELECT MAX(timestamp) FROM fire_detections WHERE detected = 1),
+                    last_activity = (SELECT MAX(timestamp) FROM fire_detections),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+            ''')
+            conn.commit()
+        finally:
+            self.release_connection(conn)
     
     def update_daily_statistics(self, date, alerts=0, detections=0, images=0):
-        """Actualizar estadísticas del día actual"""
+        """
+        Ajustar manualmente las estadísticas de un día
+        
+        Las inserciones de detecciones, alertas e imágenes ya actualizan
+        daily_statistics mediante triggers; no llamar tras esas escrituras.
+        """
         conn = self.get_connection()
         try:
             conn.execute("""
@@ -455,7 +1261,7 @@ class FireMonitorDB:
             """, (date, alerts, detections, images, alerts, detections, images))
             conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_statistics_range(self, days: int = 7) -> List[Dict]:
         """Obtener estadísticas de los últimos N días"""
@@ -463,19 +1269,210 @@ class FireMonitorDB:
         try:
             cursor = conn.execute('''
                 SELECT * FROM daily_statistics 
-                WHERE date >= date('now', '-' || ? || ' days')
+                WHERE date >= ?
                 ORDER BY date DESC
-            ''', (days,))
+            ''', ((local_today() - timedelta(days=days)).isoformat(),))
             return [dict(row) for row in cursor.fetchall()]
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    # ============================================
+    # RANGOS DE TIEMPO
+    # ============================================
+    # Todas las consultas usan límites semiabiertos [start, end) sobre la
+    # columna sin funciones, para que SQLite use los índices de tiempo.
+    # start/end: str UTC 'YYYY-MM-DD HH:MM:SS' o datetime (ver to_db_timestamp).
+    # Para un día local usar local_day_range().
+    
+    def _query_between(self, table: str, column: str, start, end,
+                       filters: Dict = None, limit: int = None) -> List[Dict]:
+        """SELECT * de table con column en [start, end) y filtros de igualdad"""
+        query = f'SELECT * FROM {table} WHERE {column} >= ? AND {column} < ?'
+        params = [to_db_timestamp(start), to_db_timestamp(end)]
+        
+        for name, value in (filters or {}).items():
+            if value is not None:
+                query += f' AND {name} = ?'
+                params.append(value)
+        
+        query += f' ORDER BY {column} DESC, id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+    
+    def get_detections_between(self, start, end, detected: bool = None,
+                               limit: int = None) -> List[Dict]:
+        """Detecciones con timestamp en [start, end)"""
+        return self._query_between('fire_detections', 'timestamp', start, end,
+                                   {'detected': detected}, limit)
+    
+    def get_alerts_between(self, start, end, status: str = None,
+                           limit: int = None) -> List[Dict]:
+        """Alertas con created_at en [start, end)"""
+        return self._query_between('alerts', 'created_at', start, end,
+                                   {'status': status}, limit)
+    
+    def get_images_between(self, start, end, limit: int = 500) -> List[Dict]:
+        """Imágenes con capture_time en [start, end)"""
+        return self._query_between('captured_images', 'capture_time', start, end,
+                                   limit=limit)
+    
+    def get_logs_between(self, start, end, level: str = None, component: str = None,
+                         limit: int = None) -> List[Dict]:
+        """Logs con timestamp en [start, end)"""
+        return self._query_between('system_logs', 'timestamp', start, end,
+                                   {'log_level': level, 'component': component}, limit)
+    
+    def summarize_between(self, start, end) -> Dict:
+        """
+        Resumen de actividad en [start, end)
+        
+        Cada conteo se resuelve solo con índices de cobertura (sin leer
+        las filas de las tablas).
+        """
+        params = (to_db_timestamp(start), to_db_timestamp(end))
+        conn = self.get_connection()
+        try:
+            detections = conn.execute('''
+                SELECT COUNT(*) FROM fire_detections 
+                WHERE detected = 1 AND timestamp >= ? AND timestamp < ?
+            ''', params).fetchone()[0]
+            
+            alerts = {row[0]: row[1] for row in conn.execute('''
+                SELECT severity, COUNT(*) FROM alerts 
+                WHERE created_at >= ? AND created_at < ?
+                GROUP BY severity
+            ''', params)}
+            
+            images = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(image_size_bytes), 0) FROM captured_images 
+                WHERE capture_time >= ? AND capture_time < ?
+            ''', params).fetchone()
+            
+            logs = {row[0]: row[1] for row in conn.execute('''
+                SELECT log_level, COUNT(*) FROM system_logs 
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY log_level
+            ''', params)}
+            
+            return {
+                'start': params[0],
+                'end': params[1],
+                'detections': detections,
+                'alerts': sum(alerts.values()),
+                'alerts_by_severity': alerts,
+                'images': images[0],
+                'images_bytes': images[1],
+                'logs_by_level': logs
+            }
+        finally:
+            self.release_connection(conn)
+    
+    # ============================================
+    # ITERADORES (PAGINACIÓN KEYSET)
+    # ============================================
+    # Recorren el historial completo en memoria constante. cursor es el
+    # KeysetIterator.cursor de un recorrido anterior (tupla o lista JSON).
+    # start/end acotan opcionalmente a [start, end) como en RANGOS DE TIEMPO.
+    
+    def _iter_keyset(self, select: str, key_column: str, id_column: str = 'id',
+                     filters: Dict = None, start=None, end=None, cursor=None,
+                     page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Construir un KeysetIterator sobre select ordenado por (key_column, id_column)"""
+        where = []
+        params = []
+        
+        for name, value in (filters or {}).items():
+            if value is not None:
+                where.append(f'{name} = ?')
+                params.append(value)
+        if start is not None:
+            where.append(f'{key_column} >= ?')
+            params.append(to_db_timestamp(start))
+        if end is not None:
+            where.append(f'{key_column} < ?')
+            params.append(to_db_timestamp(end))
+        
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+        order = f' ORDER BY {key_column} {direction}, {id_column} {direction} LIMIT ?'
+        
+        def fetch_page(after):
+            clauses = list(where)
+            page_params = list(params)
+            if after:
+                clauses.append(f'({key_column}, {id_column}) {comparison} (?, ?)')
+                page_params.extend(after)
+            query = select + (' WHERE ' + ' AND '.join(clauses) if clauses else '') + order
+            page_params.append(page_size)
+            
+            conn = self.get_connection()
+            try:
+                rows = [dict(row) for row in conn.execute(query, page_params)]
+            finally:
+                self.release_connection(conn)
+            return rows, len(rows) == page_size
+        
+        return KeysetIterator(fetch_page, key_column.split('.')[-1], cursor)
+    
+    def iter_detections(self, detected: bool = None, start=None, end=None, cursor=None,
+                        page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Detecciones por (timestamp, id)"""
+        return self._iter_keyset('SELECT * FROM fire_detections', 'timestamp',
+                                 filters={'detected': detected}, start=start, end=end,
+                                 cursor=cursor, page_size=page_size, descending=descending)
+    
+    def iter_alerts(self, status: str = None, start=None, end=None, cursor=None,
+                    page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Alertas por (created_at, id)"""
+        return self._iter_keyset('SELECT * FROM alerts', 'created_at',
+                                 filters={'status': status}, start=start, end=end,
+                                 cursor=cursor, page_size=page_size, descending=descending)
+    
+    def iter_images(self, alert_id: int = None, start=None, end=None, cursor=None,
+                    page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Imágenes (con tipo y severidad de su alerta) por (capture_time, id)"""
+        return self._iter_keyset('''
+                SELECT ci.*, a.alert_type, a.severity 
+                FROM captured_images ci
+                LEFT JOIN alerts a ON ci.alert_id = a.id
+            ''', 'ci.capture_time', 'ci.id',
+            filters={'ci.alert_id': alert_id}, start=start, end=end,
+            cursor=cursor, page_size=page_size, descending=descending)
+    
+    def iter_logs(self, level: str = None, component: str = None, start=None, end=None,
+                  cursor=None, page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Logs por (timestamp, id)"""
+        return self._iter_keyset('SELECT * FROM system_logs', 'timestamp',
+                                 filters={'log_level': level, 'component': component},
+                                 start=start, end=end, cursor=cursor,
+                                 page_size=page_size, descending=descending)
+    
+    def iter_statistics(self, start_date: str = None, end_date: str = None, cursor=None,
+                        page_size: int = 500, descending: bool = True) -> KeysetIterator:
+        """Estadísticas diarias por (date, id); fechas locales 'YYYY-MM-DD', fin exclusivo"""
+        return self._iter_keyset('SELECT * FROM daily_statistics', 'date',
+                                 start=start_date, end=end_date, cursor=cursor,
+                                 page_size=page_size, descending=descending)
     
     # ============================================
     # UTILIDADES
     # ============================================
     
     def cleanup_database(self):
-        """Limpieza de datos antiguos según configuración"""
+        """
+        Limpieza de datos antiguos según configuración
+        
+        No borra los archivos de imagen; fire_monitor.py usa
+        retention.RetentionEngine, que sí lo hace.
+        """
         image_retention = self.get_config('image_retention_days') or 30
         log_retention = self.get_config('log_retention_days') or 7
         
@@ -494,14 +1491,64 @@ class FireMonitorDB:
             conn.execute('VACUUM')
             self.log('INFO', 'DATABASE', 'Base de datos optimizada (VACUUM)')
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Activar auto_vacuum=INCREMENTAL en una base creada sin él
+        
+        El cambio de modo solo se aplica con un VACUUM completo que reescribe
+        toda la base y la bloquea mientras dura: llamarlo solo en
+        mantenimiento, antes de que el monitor reciba mensajes (ver
+        DB_CONVERT_INCREMENTAL_VACUUM en fire_monitor.py). Las bases nuevas
+        ya se crean en modo incremental (DEFAULT_PRAGMAS en modo pooled,
+        fire_monitor.sql en el resto).
+        
+        Returns:
+            True si hubo que convertir la base
+        """
+        conn = self.get_connection()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return False
+            
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        finally:
+            self.release_connection(conn)
+        
+        self.log('INFO', 'DATABASE', 'auto_vacuum incremental activado (VACUUM único)')
+        return True
+    
+    def incremental_vacuum(self, max_pages: int = 1000) -> int:
+        """
+        Devolver al sistema hasta max_pages páginas libres
+        
+        A diferencia de VACUUM no reescribe la base ni la bloquea durante
+        mucho tiempo. Requiere auto_vacuum=INCREMENTAL.
+        
+        Returns:
+            Páginas liberadas
+        """
+        conn = self.get_connection()
+        try:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+            after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            return before - after
+        finally:
+            self.release_connection(conn)
     
     def get_database_size(self) -> int:
         """Obtener tamaño de la base de datos en bytes"""
         return os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
     
     def export_to_json(self, output_path: str, days: int = 7) -> bool:
-        """Exportar datos a JSON"""
+        """
+        Exportar un resumen reciente a JSON (con límites por tabla)
+        
+        Para respaldos completos o incrementales usar db_export.StreamingExporter.
+        """
         try:
             data = {
                 'export_date': datetime.now().isoformat(),
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Fire Monitor - Streaming Export
+Exporta tablas fila a fila (NDJSON o CSV, opcionalmente comprimidas) con
+exportación incremental desde la última fila enviada de cada tabla
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+from typing import Dict, List
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional: pip install zstandard
+    zstandard = None
+
+# Tablas exportables:
+# - 'incremental': solo reciben INSERT, se envían las filas con id > marca
+# - 'snapshot': sus filas se actualizan (estado de alertas, contadores del
+#   día, dispositivos), se envían completas en cada exportación
+EXPORT_TABLES = {
+    'fire_detections': 'incremental',
+    'captured_images': 'incremental',
+    'system_logs': 'incremental',
+    'alerts': 'snapshot',
+    'daily_statistics': 'snapshot',
+    'device_status': 'snapshot'
+}
+
+FORMATS = ('ndjson', 'csv')
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+# Marcas de agua (último id exportado por tabla) en system_config
+HIGH_WATER_KEY = 'export_high_water'
+
+FETCH_SIZE = 500
+
+class StreamingExporter:
+    def __init__(self, db, output_dir: str, fmt: str = 'ndjson',
+                 compression: str = None, fetch_size: int = FETCH_SIZE):
+        """
+        Inicializar exportador
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            output_dir: Directorio donde se escriben los archivos
+            fmt: 'ndjson' o 'csv'
+            compression: None, 'gzip' o 'zstd' (requiere el paquete zstandard)
+            fetch_size: Filas leídas del cursor en cada fetchmany
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato de exportación inválido: {fmt}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Compresión inválida: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("Compresión zstd no disponible (pip install zstandard)")
+        
+        self.db = db
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compression = compression
+        self.fetch_size = fetch_size
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # ============================================
+    # API
+    # ============================================
+    
+    def export(self, tables: List[str] = None, incremental: bool = True) -> Dict:
+        """
+        Exportar tablas a un archivo por tabla
+        
+        Cada archivo se escribe a un temporal y se renombra al terminar; la
+        marca de agua de la tabla solo avanza después del rename, así que
+        una exportación interrumpida se repite completa la próxima vez.
+        
+        Args:
+            tables: Tablas a exportar (por defecto todas las de EXPORT_TABLES)
+            incremental: False exporta todo ignorando las marcas de agua
+        
+        Returns:
+            Dict tabla -> {'path', 'rows', 'last_id'} (path None si no había
+            filas nuevas)
+        """
+        tables = tables or list(EXPORT_TABLES)
+        for table in tables:
+            if table not in EXPORT_TABLES:
+                raise ValueError(f"Tabla no exportable: {table}")
+        
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        high_water = self.get_high_water()
+        results = {}
+        
+        for table in tables:
+            since = high_water.get(table, 0) if incremental else 0
+            if EXPORT_TABLES[table] == 'snapshot':
+                since = 0
+            
+            path = os.path.join(self.output_dir, f"{table}_{stamp}.{self.fmt}{self._extension()}")
+            rows, last_id = self._export_table(table, since, path)
+            if not os.path.exists(path):
+                path = None
+            
+            if EXPORT_TABLES[table] == 'incremental' and last_id is not None:
+                high_water[table] = last_id
+                self.db.set_config(HIGH_WATER_KEY, high_water, 'json',
+                                   'Último id exportado por tabla')
+            
+            results[table] = {'path': path, 'rows': rows, 'last_id': last_id}
+        
+        total = sum(r['rows'] for r in results.values())
+        self.db.log('INFO', 'DATABASE', f'Exportación {self.fmt}: {total} filas en {self.output_dir}',
+                    {t: r['rows'] for t, r in results.items()})
+        return results
+    
+    def get_high_water(self) -> Dict:
+        """Último id exportado por tabla"""
+        return self.db.get_config(HIGH_WATER_KEY) or {}
+    
+    def reset_high_water(self, table: str = None):
+        """Olvidar la marca de una tabla (o de todas) para reexportarla completa"""
+        high_water = {} if table is None else self.get_high_water()
+        high_water.pop(table, None)
+        self.db.set_config(HIGH_WATER_KEY, high_water, 'json',
+                           'Último id exportado por tabla')
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _extension(self) -> str:
+        return {None: '', 'gzip': '.gz', 'zstd': '.zst'}[self.compression]
+    
+    def _open(self, path: str):
+        """Abrir archivo de salida en texto, con la compresión configurada"""
+        if self.compression == 'gzip':
+            return gzip.open(path, 'wt', encoding='utf-8', newline='')
+        if self.compression == 'zstd':
+            raw = open(path, 'wb')
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+            return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        return open(path, 'w', encoding='utf-8', newline='')
+    
+    def _export_table(self, table: str, since_id: int, path: str):
+        """
+        Volcar las filas con id > since_id de una tabla
+        
+        Las filas se leen con un solo SELECT (una instantánea consistente de
+        la tabla) en bloques de fetch_size y se escriben según llegan.
+        
+        Returns:
+            (filas escritas, último id o None si no hubo filas)
+        """
+        tmp_path = path + '.tmp'
+        rows = 0
+        last_id = None
+        
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id', (since_id,))
+            columns = [c[0] for c in cursor.description]
+            
+            with self._open(tmp_path) as f:
+                if self.fmt == 'csv':
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                
+                while True:
+                    batch = cursor.fetchmany(self.fetch_size)
+                    if not batch:
+                        break
+                    
+                    for row in batch:
+                        if self.fmt == 'csv':
+                            writer.writerow(tuple(row))
+                        else:
+                            f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False,
+                                               default=str) + '\n')
+                    
+                    rows += len(batch)
+                    last_id = batch[-1]['id']
+            
+            if rows == 0 and since_id > 0:
+                # Sin filas nuevas: no dejar archivos vacíos en el respaldo
+                os.remove(tmp_path)
+                return 0, None
+            
+            os.replace(tmp_path, path)
+            return rows, last_id
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self.db.release_connection(conn)
+
+def main():
+    """Exportación desde línea de comandos (p.ej. cron nocturno)"""
+    import argparse
+    from database import FireMonitorDB
+    
+    parser = argparse.ArgumentParser(description='Exportar la base de datos del Fire Monitor')
+    parser.add_argument('output_dir', help='Directorio de salida')
+    parser.add_argument('--db', default='/home/pi/fire_monitor/fire_monitor.db')
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--full', action='store_true', help='Ignorar marcas de agua')
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES))
+    args = parser.parse_args()
+    
+    db = FireMonitorDB(args.db)
+    exporter = StreamingExporter(db, args.output_dir, args.format, args.compress)
+    results = exporter.export(args.tables, incremental=not args.full)
+    
+    for table, result in results.items():
+        print(f"✓ {table}: {result['rows']} filas → {result['path'] or '(sin cambios)'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Fire Monitor - Write-Behind Queue
+Agrupa INSERTs (logs, detecciones) y los confirma en una sola transacción
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+# Reintentos de un lote si SQLite sigue ocupado tras busy_timeout
+# (espera 0.1s, 0.2s, 0.4s); después se escribe fila a fila
+WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.1
+
+class _FlushRequest:
+    """Marcador en la cola: escribir todo lo pendiente y avisar"""
+    def __init__(self):
+        self.done = threading.Event()
+
+class WriteBehindQueue:
+    def __init__(self, db, flush_interval_ms: int = 200, max_batch: int = 100,
+                 max_queue: int = 5000):
+        """
+        Inicializar cola de escritura diferida
+
+        Args:
+            db: Instancia de FireMonitorDB (se usa get/release_connection)
+            flush_interval_ms: Tiempo máximo que una fila espera en memoria
+            max_batch: Filas que fuerzan un commit aunque no venza el tiempo
+            max_queue: Capacidad de la cola; si se llena, submit() devuelve
+                       False y el llamador escribe de forma síncrona
+        """
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self._stop_seen = False
+        
+        # submit() (productores) y el hilo escritor actualizan stats
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'overflow': 0,
+            'retries': 0,
+            'errors': 0,
+            'dropped': 0
+        }
+    
+    def start(self):
+        """Iniciar hilo escritor"""
+        if self.thread and self.thread.is_alive():
+            return
+        
+        self._stop_seen = False
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+    
+    def submit(self, sql: str, params: Tuple) -> bool:
+        """
+        Encolar un INSERT
+
+        Returns:
+            True si se encoló; False si la cola está llena o detenida
+        """
+        if not self.thread or not self.thread.is_alive():
+            return False
+        
+        try:
+            self.queue.put_nowait((sql, params))
+            self._count('enqueued')
+            return True
+        except queue.Full:
+            self._count('overflow')
+            return False
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Esperar a que todo lo encolado hasta ahora esté en disco"""
+        if not self.thread or not self.thread.is_alive():
+            return True
+        
+        request = _FlushRequest()
+        self.queue.put(request)
+        return request.done.wait(timeout)
+    
+    def stop(self, timeout: float = 5.0):
+        """Vaciar la cola y detener el hilo escritor"""
+        if not self.thread or not self.thread.is_alive():
+            return
+        
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+    
+    def pending(self) -> int:
+        """Filas en espera de ser escritas"""
+        return self.queue.qsize()
+    
+    def get_stats(self) -> Dict:
+        """Copia de los contadores"""
+        with self._stats_lock:
+            return dict(self.stats)
+    
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+    
+    def _run(self):
+        """Bucle del hilo escritor: acumular por tiempo o tamaño y confirmar"""
+        batch = []
+        deadline = None
+        
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()  # Venció el intervalo
+            
+            if item is None:
+                # Parada: escribir lo que quede y salir
+                waiters = self._drain_into(batch)
+                self._write_batch(batch)
+                for request in waiters:
+                    request.done.set()
+                return
+            
+            if isinstance(item, _FlushRequest):
+                waiters = self._drain_into(batch)
+                self._write_batch(batch)
+                batch, deadline = [], None
+                for request in [item] + waiters:
+                    request.done.set()
+                if self._stop_seen:
+                    return
+                continue
+            
+            if item:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            
+            if batch and (len(batch) >= self.max_batch or time.monotonic() >= deadline):
+                self._write_batch(batch)
+                batch, deadline = [], None
+    
+    def _drain_into(self, batch: List) -> List[_FlushRequest]:
+        """Mover a batch las filas ya encoladas (sin bloquear)"""
+        waiters = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return waiters
+            
+            if item is None:
+                self._stop_seen = True
+            elif isinstance(item, _FlushRequest):
+                waiters.append(item)
+            elif item:
+                batch.append(item)
+    
+    def _write_batch(self, batch: List):
+        """
+        Escribir un lote con executemany en una única transacción
+        
+        Si SQLite falla (p.ej. SQLITE_BUSY tras busy_timeout) se reintenta
+        el lote con espera creciente; si sigue fallando se escribe fila a
+        fila, así un error solo descarta las filas que no se pueden escribir.
+        """
+        if not batch:
+            return
+        
+        # Agrupar filas consecutivas con la misma sentencia (mantiene el orden)
+        groups = []
+        for sql, params in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        
+        for attempt in range(WRITE_RETRIES + 1):
+            if attempt:
+                self._count('retries')
+                time.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+            try:
+                self._execute(groups)
+                with self._stats_lock:
+                    self.stats['written'] += len(batch)
+                    self.stats['batches'] += 1
+                return
+            except sqlite3.Error as e:
+                self._count('errors')
+                error = e
+        
+        print(f"⚠️ Lote de {len(batch)} filas no escrito ({error}), escribiendo fila a fila")
+        for sql, params in batch:
+            try:
+                self._execute([(sql, [params])])
+                self._count('written')
+            except sqlite3.Error as e:
+                self._count('dropped')
+                print(f"❌ Fila descartada por el escritor diferido: {e}")
+    
+    def _execute(self, groups: List):
+        """Ejecutar los grupos (sql, filas) en una transacción"""
+        conn = self.db.get_connection()
+        try:
+            for sql, rows in groups:
+                conn.executemany(sql, rows)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            self.db.release_connection(conn)
@@ -7,11 +7,22 @@ import paho.mqtt.client as mqtt
 import json
 import base64
 import os
+import threading
+import time
 from datetime import datetime
-from PIL import Image
-import io
-from database import FireMonitorDB
+from database import FireMonitorDB, classify_severity
 from telegram_notifier import TelegramNotifier
+from telegram_file_cache import FileIdCache
+from image_assembler import ImageReassembler, parse_binary_chunk
+from image_catalog import ImageCatalog
+from image_publisher import LatestImagePublisher
+from jpeg_inspector import inspect_jpeg
+from retention import RetentionEngine
+from hot_state import HotState
+from config_service import ConfigService, TELEGRAM_KEYS
+from metrics import Metrics, MetricsServer
+from message_dispatcher import MessageDispatcher, Lane, capture_key
+from notification_outbox import NotificationOutbox
 
 # ============================================
 # CONFIGURACIÓN
@@ -25,24 +36,101 @@ TOPIC_ALERT = "fire/alert"
 TOPIC_CAPTURE_CMD = "fire/capture"
 TOPIC_IMAGE = "fire/image"
 TOPIC_IMAGE_META = "fire/image/meta"
+TOPIC_IMAGE_BIN = "fire/image/bin/+"   # chunks binarios, un subtopic por dispositivo
+TOPIC_IMAGE_BIN_PREFIX = "fire/image/bin/"
 TOPIC_STATUS = "fire/status"
 
-# Directorios
-IMAGES_DIR = "/home/pi/fire_images"
-LATEST_IMAGE_PATH = "/home/pi/fire_monitor/public/latest.jpg"
+# Directorios (las variables de entorno permiten ejecutar el monitor fuera
+# del Pi, p.ej. en benchmark.py)
+DB_PATH = os.environ.get("FIRE_MONITOR_DB", "/home/pi/fire_monitor/fire_monitor.db")
+IMAGES_DIR = os.environ.get("FIRE_MONITOR_IMAGES_DIR", "/home/pi/fire_images")
+LATEST_IMAGE_PATH = os.environ.get("FIRE_MONITOR_LATEST_IMAGE",
+                                   "/home/pi/fire_monitor/public/latest.jpg")
+
+# Publicación de latest.jpg: 'hardlink', 'symlink' o 'copy'. Con un
+# directorio en tmpfs (p.ej. "/dev/shm/fire_monitor") las últimas capturas
+# se sirven desde RAM
+LATEST_IMAGE_MODE = "hardlink"
+LATEST_RING_DIR = None
+LATEST_RING_SIZE = 5
+
+# Métricas del camino caliente (GET http://127.0.0.1:9108/metrics). Con
+# METRICS_ENABLED = False no se mide nada
+METRICS_ENABLED = os.environ.get("FIRE_MONITOR_METRICS", "1") != "0"
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Despacho de mensajes: cada carril tiene su cola acotada y sus hilos, así
+# las alertas nunca esperan detrás de los chunks de una imagen. Políticas
+# de desbordamiento: 'drop_new', 'drop_oldest' o 'block'
+DISPATCH_ALERT_QUEUE = 200
+DISPATCH_ALERT_OVERFLOW = "block"         # nunca descartar un FIRE_DETECTED en espera
+DISPATCH_ALERT_BLOCK_TIMEOUT = 2.0        # s que puede frenarse el bucle de red
+DISPATCH_IMAGE_WORKERS = 2                # capturas en paralelo
+DISPATCH_IMAGE_QUEUE = 400                # ~10 capturas de 40 chunks
+DISPATCH_IMAGE_OVERFLOW = "drop_new"
+DISPATCH_STATUS_QUEUE = 50
+
+# Mantenimiento: convertir una base antigua a auto_vacuum=INCREMENTAL al
+# arrancar (VACUUM completo, bloquea la base; FIRE_MONITOR_CONVERT_VACUUM=1
+# una sola vez). Sin conversión la retención no devuelve espacio al disco
+DB_CONVERT_INCREMENTAL_VACUUM = os.environ.get("FIRE_MONITOR_CONVERT_VACUUM", "0") == "1"
 
 # Estado global
-image_chunks = {}
-image_metadata = {}
+reassembler = ImageReassembler()
 last_alert_time = None
 capture_requested = False
 current_alert_id = None  # ID de la alerta activa actual
 
-# Inicializar base de datos
-db = FireMonitorDB()
+# capture_requested y current_alert_id los usan a la vez el carril de
+# alertas y los trabajadores de imágenes: se cambian con este lock
+capture_lock = threading.Lock()
+
+metrics = Metrics(enabled=METRICS_ENABLED)
+metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT)
+
+# Inicializar base de datos (conexión persistente por hilo, modo WAL)
+db = FireMonitorDB(DB_PATH, pooled=True, metrics=metrics)
+db.start_write_behind()
+
+# Configuración en memoria (system_config + telegram_config.py), se
+# recarga sola al cambiar
+config = ConfigService(db)
+
+# Alerta activa, últimas detecciones y contadores de hoy en memoria
+state = HotState(db)
+state.load()
+
+# Catálogo de imágenes (IMAGES_DIR/YYYY/MM/DD + manifest.ndjson)
+catalog = ImageCatalog(db, IMAGES_DIR)
+
+# Retención de imágenes y logs (antigüedad + presupuesto de disco)
+retention = RetentionEngine(db, catalog, config=config)
+
+# Publicador de la última imagen para la web
+latest_publisher = LatestImagePublisher(
+    LATEST_IMAGE_PATH,
+    mode=LATEST_IMAGE_MODE,
+    ring_dir=LATEST_RING_DIR,
+    ring_size=LATEST_RING_SIZE
+)
+
+# Inicializar notificador de Telegram (envíos fuera del hilo de MQTT; los
+# file_id de las fotos subidas se guardan en la base de datos)
+telegram = TelegramNotifier(async_delivery=True, metrics=metrics, file_cache=FileIdCache(db))
+config.subscribe(telegram.apply_config, keys=TELEGRAM_KEYS)
 
-# Inicializar notificador de Telegram
-telegram = TelegramNotifier()
+# Notificaciones de alertas guardadas en SQLite hasta entregarse (cortes de
+# internet, reinicios)
+outbox = NotificationOutbox(db, telegram, metrics=metrics)
+
+# Valores instantáneos (colas, reensamblado) que se leen al exportar
+metrics.register_collector(lambda: {f'reassembly_{k}': v for k, v in reassembler.get_stats().items()})
+metrics.register_collector(lambda: {f'telegram_{k}': v for k, v in telegram.get_delivery_metrics().items()})
+metrics.register_collector(lambda: {f'outbox_{k}': v for k, v in outbox.get_metrics().items()})
+metrics.register_collector(lambda: {f'db_writer_{k}': v for k, v in
+                                     dict(db.writer.get_stats(), pending=db.writer.pending()).items()}
+                           if db.writer else {})
 
 # ============================================
 # FUNCIONES DE UTILIDAD
@@ -55,51 +143,68 @@ def ensure_directories():
     print(f"✓ Directorios verificados")
     db.log('INFO', 'PYTHON', 'Directorios verificados')
 
-def save_image(image_data, filename=None, metadata=None):
-    """Guardar imagen desde Base64"""
-    global current_alert_id
+def save_image(image_data, filename=None, metadata=None, alert_id=None, trigger='MANUAL'):
+    """
+    Guardar imagen (bytes/memoryview ya decodificados, o Base64 como str)
     
+    alert_id y trigger los lee el llamador una sola vez (ver
+    take_capture_request), así no cambian a mitad del guardado.
+    """
     try:
-        # Decodificar Base64
-        image_bytes = base64.b64decode(image_data)
+        # Los chunks llegan decodificados desde el reensamblador; se acepta
+        # también Base64 por compatibilidad
+        if isinstance(image_data, str):
+            image_bytes = base64.b64decode(image_data)
+        else:
+            image_bytes = image_data
         
-        # Generar nombre si no se proporciona
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"fire_capture_{timestamp}.jpg"
+        device = metadata.get('device') if metadata else None
         
-        # Guardar en directorio de imágenes
-        filepath = os.path.join(IMAGES_DIR, filename)
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
+        # Validar estructura JPEG (SOI/SOFn/EOI) antes de guardar o enviar
+        with metrics.timer('stage_seconds', stage='jpeg_inspect'):
+            info = inspect_jpeg(image_bytes)
+        if not info.valid:
+            print(f"❌ Imagen descartada de {device}: {info.reason}")
+            db.log('ERROR', 'CAMERA', f'Imagen descartada: {info.reason}',
+                   details={'device': device, 'size': len(image_bytes), 'truncated': info.truncated})
+            return None
+        width, height = info.width, info.height
+        
+        # Ruta en el directorio del día (IMAGES_DIR/YYYY/MM/DD/)
+        filepath = catalog.path_for(device=device)
+        if filename is not None:
+            filepath = os.path.join(os.path.dirname(filepath), filename)
+        filename = os.path.basename(filepath)
         
-        # Guardar como última imagen para la web
-        with open(LATEST_IMAGE_PATH, 'wb') as f:
-            f.write(image_bytes)
+        # Guardar en directorio de imágenes
+        with metrics.timer('stage_seconds', stage='file_write'):
+            with open(filepath, 'wb') as f:
+                f.write(image_bytes)
         
-        # Obtener información de la imagen
-        img = Image.open(io.BytesIO(image_bytes))
-        width, height = img.size
+        # Publicar como última imagen para la web (enlace + rename atómico,
+        # sin escribir la imagen por segunda vez)
+        with metrics.timer('stage_seconds', stage='publish_latest'):
+            latest_publisher.publish(filepath, image_bytes)
         
         print(f"✅ Imagen guardada: {filename} ({width}x{height}, {len(image_bytes)} bytes)")
         
-        # Guardar en base de datos
-        if current_alert_id:
-            chunks_total = metadata.get('chunks', 1) if metadata else 1
-            db.save_image_record(
-                alert_id=current_alert_id,
-                file_path=filepath,
-                file_name=filename,
-                image_size=len(image_bytes),
-                width=width,
-                height=height,
-                chunks_total=chunks_total,
-                trigger='AUTO' if capture_requested else 'MANUAL'
-            )
+        # Registrar en el catálogo (captured_images + manifiesto), con o sin
+        # alerta activa, para que ningún lector tenga que listar el directorio
+        chunks_total = metadata.get('chunks', 1) if metadata else 1
+        catalog.add(
+            filepath,
+            alert_id=alert_id,
+            image_size=len(image_bytes),
+            width=width,
+            height=height,
+            chunks_total=chunks_total,
+            trigger=trigger,
+            device=device
+        )
+        state.record_image()
         
-        # Al insertar una imagen, actualizar estadísticas diarias
-        fecha_actual = datetime.now().strftime("%Y-%m-%d")
-        db.update_daily_statistics(date=fecha_actual, images=1)
+        # Desalojar capturas antiguas si se supera el presupuesto de disco
+        retention.after_save(len(image_bytes))
         
         return filepath
         
@@ -111,11 +216,22 @@ def save_image(image_data, filename=None, metadata=None):
 def request_capture():
     """Solicitar captura a ESP32"""
     global capture_requested
-    if not capture_requested:
-        client.publish(TOPIC_CAPTURE_CMD, "CAPTURE")
+    with capture_lock:
+        if capture_requested:
+            return
         capture_requested = True
-        print("📸 Solicitando captura a ESP32...")
-        db.log('INFO', 'PYTHON', 'Captura solicitada a ESP32')
+    
+    client.publish(TOPIC_CAPTURE_CMD, "CAPTURE")
+    print("📸 Solicitando captura a ESP32...")
+    db.log('INFO', 'PYTHON', 'Captura solicitada a ESP32')
+
+def take_capture_request() -> bool:
+    """Consumir la captura solicitada (True si la imagen la respondía)"""
+    global capture_requested
+    with capture_lock:
+        requested = capture_requested
+        capture_requested = False
+    return requested
 
 # ============================================
 # CALLBACKS MQTT
@@ -131,31 +247,52 @@ def on_connect(client, userdata, flags, rc):
         client.subscribe(TOPIC_ALERT)
         client.subscribe(TOPIC_IMAGE)
         client.subscribe(TOPIC_IMAGE_META)
+        client.subscribe(TOPIC_IMAGE_BIN)
         client.subscribe(TOPIC_STATUS)
         
         print(f"✓ Suscrito a topics:")
         print(f"  - {TOPIC_ALERT}")
         print(f"  - {TOPIC_IMAGE}")
         print(f"  - {TOPIC_IMAGE_META}")
+        print(f"  - {TOPIC_IMAGE_BIN}")
         print(f"  - {TOPIC_STATUS}")
         
     else:
         print(f"❌ Error de conexión MQTT: {rc}")
         db.log('ERROR', 'MQTT', f'Error de conexión MQTT: {rc}')
 
+def decode_payload(msg):
+    """Decodificar el JSON de un mensaje (etapa 'json' en las métricas)"""
+    with metrics.timer('stage_seconds', stage='json'):
+        return json.loads(msg.payload.decode())
+
 def on_message(client, userdata, msg):
-    """Callback cuando llega un mensaje"""
-    global last_alert_time, image_chunks, image_metadata, capture_requested, current_alert_id
+    """Callback cuando llega un mensaje (hilo de red de paho: solo encola)"""
+    if metrics.enabled:
+        metrics.inc('messages_total', topic=msg.topic)
+        metrics.inc('message_bytes_total', len(msg.payload), topic=msg.topic)
+    
+    if dispatcher.running:
+        dispatcher.submit(msg)
+    else:
+        handle_message(msg)
+
+def handle_message(msg):
+    """Procesar un mensaje (en un trabajador del despachador)"""
+    global last_alert_time, current_alert_id
     
     topic = msg.topic
+    if metrics.enabled:
+        started = time.perf_counter()
     
     try:
         # ===== ALERTA DE FUEGO =====
         if topic == TOPIC_ALERT:
-            data = json.loads(msg.payload.decode())
+            data = decode_payload(msg)
             alert_type = data.get('alert')
             timestamp = data.get('timestamp')
             detections = data.get('detections', 0)
+            device = data.get('device', 'ESP32-CAM')
             
             if alert_type == "FIRE_DETECTED":
                 print(f"\n🔥 ¡ALERTA DE FUEGO!")
@@ -164,159 +301,150 @@ def on_message(client, userdata, msg):
                 
                 last_alert_time = datetime.now()
                 
-                # Registrar detección en DB
-                detection_id = db.insert_detection(
-                    detected=True,
-                    esp32_millis=timestamp,
-                    confidence=100
-                )
-                
-                # Al insertar una detección, actualizar estadísticas diarias
-                fecha_actual = datetime.now().strftime("%Y-%m-%d")
-                db.update_daily_statistics(date=fecha_actual, detections=1)
-                
-                # Verificar si ya hay una alerta activa
-                active_alert = db.get_active_alert()
-                
-                if active_alert:
-                    # Actualizar contador de detecciones
-                    current_alert_id = active_alert['id']
-                    db.update_alert_detections(current_alert_id, detections)
-                    print(f"   📊 Alerta existente actualizada (ID: {current_alert_id})")
-                else:
-                    # Crear nueva alerta
-                    severity = 'HIGH' if detections > 5 else 'MEDIUM' if detections > 2 else 'LOW'
-                    current_alert_id = db.create_alert(
-                        detection_id=detection_id,
-                        alert_type='FIRE_DETECTED',
-                        severity=severity,
-                        detections_count=detections
+                # Detección + alerta (nueva o actualizada) + notificación
+                # pendiente en una transacción
+                notification = None
+                if telegram.enabled:
+                    notification = {'timestamp': last_alert_time.isoformat(), 'device': device}
+                with metrics.timer('stage_seconds', stage='db_fire_event'):
+                    event = state.record_fire_event(
+                        detections=detections,
+                        esp32_millis=timestamp,
+                        confidence=100,
+                        notification=notification
                     )
-                    print(f"   🆕 Nueva alerta creada (ID: {current_alert_id}, Severidad: {severity})")
+                alert_id = event['alert_id']
+                with capture_lock:
+                    current_alert_id = alert_id
+                severity = event['severity']
+                
+                if not event['created']:
+                    print(f"   📊 Alerta existente actualizada (ID: {alert_id})")
                     
-                    # 🔔 ENVIAR NOTIFICACIÓN DE TELEGRAM (solo para nuevas alertas)
-                    telegram.send_fire_alert(
+                    # Sin mensaje propio; se suma al resumen si la ventana de
+                    # cooldown de Telegram está abierta
+                    telegram.dispatch(
+                        telegram.note_alert_update,
                         detections=detections,
-                        timestamp=last_alert_time,
-                        severity=severity
+                        severity=classify_severity(detections),
+                        device=device
                     )
-
-                    # ← AGREGAR AQUÍ LA ACTUALIZACIÓN DE ALERTAS
-                    fecha_actual = datetime.now().strftime("%Y-%m-%d")
-                    db.update_daily_statistics(date=fecha_actual, alerts=1)
+                else:
+                    print(f"   🆕 Nueva alerta creada (ID: {alert_id}, Severidad: {severity})")
+                    
+                    # 🔔 ENVIAR NOTIFICACIÓN DE TELEGRAM (solo para nuevas alertas;
+                    # ya está en el outbox)
+                    if event.get('outbox_id'):
+                        outbox.wake()
                 
-                # Solicitar captura automáticamente
-                request_capture()
+                # Solicitar captura automáticamente (auto_capture_enabled se
+                # puede cambiar en caliente desde system_config)
+                if config.get('auto_capture_enabled', True):
+                    request_capture()
                 
             elif alert_type == "CLEAR":
                 print(f"✓ Alerta despejada")
                 
-                # Registrar detección negativa
-                db.insert_detection(
-                    detected=False,
-                    esp32_millis=timestamp,
-                    confidence=100
-                )
+                # Registrar detección negativa (escritura diferida)
+                state.record_clear(esp32_millis=timestamp, confidence=100)
                 
-                capture_requested = False
+                take_capture_request()
         
         # ===== METADATA DE IMAGEN =====
         elif topic == TOPIC_IMAGE_META:
-            data = json.loads(msg.payload.decode())
-            image_metadata = data
-            image_chunks.clear()
+            data = decode_payload(msg)
+            transfer = reassembler.start_transfer(data)
+            if transfer is None:
+                db.log('WARNING', 'CAMERA', 'Metadata de imagen rechazada (tamaño excesivo)',
+                       details={'device': data.get('device'), 'size': data.get('size')})
+                return
             
-            print(f"\n📦 Metadata de imagen recibida:")
+            print(f"\n📦 Metadata de imagen recibida ({transfer.device}, captura {transfer.capture_id}):")
             print(f"   Tamaño: {data.get('size')} bytes")
             print(f"   Resolución: {data.get('width')}x{data.get('height')}")
             print(f"   Chunks esperados: {data.get('chunks')}")
             
-            db.log('INFO', 'CAMERA', f"Metadata recibida: {data.get('width')}x{data.get('height')}, {data.get('chunks')} chunks")
+            db.log('INFO', 'CAMERA', f"Metadata recibida de {transfer.device}: {data.get('width')}x{data.get('height')}, {data.get('chunks')} chunks")
         
-        # ===== CHUNKS DE IMAGEN =====
-        elif topic == TOPIC_IMAGE:
-            data = json.loads(msg.payload.decode())
+        # ===== CHUNKS DE IMAGEN (JSON/Base64 o binarios) =====
+        elif topic == TOPIC_IMAGE or topic.startswith(TOPIC_IMAGE_BIN_PREFIX):
+            if topic == TOPIC_IMAGE:
+                data = decode_payload(msg)
+            else:
+                try:
+                    data = parse_binary_chunk(topic[len(TOPIC_IMAGE_BIN_PREFIX):], msg.payload)
+                except ValueError as e:
+                    print(f"❌ Chunk binario inválido en {topic}: {e}")
+                    db.log('WARNING', 'CAMERA', f'Chunk binario inválido: {e}', details={'topic': topic})
+                    metrics.inc('message_errors_total', topic=topic, error='binary')
+                    return
             chunk_num = data.get('chunk')
             total_chunks = data.get('total')
-            chunk_data = data.get('data')
             
-            # Validar que chunk_data no sea None
-            if chunk_data is None:
-                print(f"⚠️ Chunk {chunk_num + 1}/{total_chunks} está vacío (None)")
-                db.log('WARNING', 'CAMERA', f'Chunk {chunk_num + 1}/{total_chunks} vacío')
-                return
+            # Validar que el chunk traiga datos (en los binarios, data=None
+            # indica CRC inválido y ya se informó)
+            if data.get('data') is None and topic == TOPIC_IMAGE:
+                print(f"⚠️ Chunk {chunk_num}/{total_chunks} está vacío (None)")
+                db.log('WARNING', 'CAMERA', f'Chunk {chunk_num}/{total_chunks} vacío')
             
-            image_chunks[chunk_num] = chunk_data
+            # Se agrupa por dispositivo y captura; un chunk inválido descarta
+            # solo su propia transferencia
+            with metrics.timer('stage_seconds', stage='chunk_decode'):
+                transfer = reassembler.add_chunk(data)
             
-            print(f"📥 Chunk {chunk_num + 1}/{total_chunks} recibido ({len(chunk_data)} chars)")
+            if data.get('data') is not None:
+                unit = 'chars' if topic == TOPIC_IMAGE else 'bytes'
+                print(f"📥 Chunk {chunk_num + 1}/{total_chunks} recibido ({len(data['data'])} {unit})")
             
             # Si recibimos todos los chunks, reconstruir imagen
-            if len(image_chunks) == total_chunks:
-                print("🔄 Reconstruyendo imagen...")
-                
-                # Verificar que todos los chunks estén presentes
-                missing_chunks = []
-                for i in range(total_chunks):
-                    if i not in image_chunks:
-                        missing_chunks.append(i)
+            if transfer is not None:
+                print(f"🔄 Reconstruyendo imagen de {transfer.device} ({transfer.elapsed():.1f}s)...")
+                metrics.observe('reassembly_seconds', transfer.elapsed())
                 
-                if missing_chunks:
-                    print(f"❌ Faltan chunks: {missing_chunks}")
-                    db.log('ERROR', 'CAMERA', f'Faltan chunks: {missing_chunks}')
-                    image_chunks.clear()
-                    return
+                # Los chunks ya se decodificaron en el buffer de la transferencia
+                image_view = transfer.assemble()
+                image_metadata = transfer.metadata
                 
-                # Ordenar y concatenar chunks
-                full_image_b64 = ""
-                for i in range(total_chunks):
-                    chunk = image_chunks[i]
-                    if chunk is None:
-                        print(f"❌ Chunk {i} es None, abortando reconstrucción")
-                        db.log('ERROR', 'CAMERA', f'Chunk {i} es None')
-                        image_chunks.clear()
-                        return
-                    full_image_b64 += chunk
+                print(f"📊 Imagen completa: {len(image_view)} bytes")
                 
-                print(f"📊 Imagen completa: {len(full_image_b64)} caracteres Base64")
+                # Alerta activa y captura pendiente leídas una sola vez: el
+                # carril de alertas puede cambiarlas mientras se guarda
+                with capture_lock:
+                    alert_id = current_alert_id
+                trigger = 'AUTO' if take_capture_request() else 'MANUAL'
                 
-                # Guardar imagen
-                if save_image(full_image_b64, metadata=image_metadata):
+                # Guardar imagen (devuelve la ruta del archivo escrito)
+                latest_image = save_image(image_view, metadata=image_metadata,
+                                          alert_id=alert_id, trigger=trigger)
+                if latest_image:
                     print("✅ Imagen procesada correctamente")
                     
                     # 🔔 ENVIAR IMAGEN POR TELEGRAM si hay alerta activa
-                    if current_alert_id:
-                        # Obtener ruta de la última imagen guardada
-                        import glob
-                        images = glob.glob(os.path.join(IMAGES_DIR, "fire_capture_*.jpg"))
-                        if images:
-                            latest_image = max(images, key=os.path.getctime)
+                    if alert_id:
+                        # Datos de la alerta para el caption (desde memoria)
+                        alert_data = state.active_alert()
+                        if alert_data and alert_data['id'] == alert_id:
+                            # Crear caption con información de la alerta
+                            timestamp_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                            severity = alert_data.get('severity', 'MEDIUM')
+                            detections = alert_data.get('detections_count', 0)
                             
-                            # Obtener datos de la alerta para contexto
-                            alert_data = db.get_alert_by_id(current_alert_id)
-                            if alert_data:
-                                # Crear caption con información de la alerta
-                                timestamp_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                                severity = alert_data.get('severity', 'MEDIUM')
-                                detections = alert_data.get('detections_count', 0)
-                                
-                                caption = f"""
-📸 <b>Imagen de Alerta #{current_alert_id}</b>
+                            caption = f"""
+📸 <b>Imagen de Alerta #{alert_id}</b>
 
 🔴 Severidad: {severity}
 📊 Detecciones: {detections}
 🕐 Captura: {timestamp_str}
 """
-                                # Enviar solo la foto con caption (sin cooldown)
-                                telegram.send_photo(latest_image, caption=caption.strip())
-                
-                # Limpiar chunks
-                image_chunks.clear()
-                image_metadata.clear()
-                capture_requested = False
+                            # Primera foto de la ventana al momento; las demás van al resumen
+                            if telegram.enabled:
+                                outbox.enqueue('alert_photo',
+                                               {'image_path': latest_image, 'caption': caption.strip()},
+                                               alert_id=alert_id)
         
         # ===== ESTADO DEL DISPOSITIVO =====
         elif topic == TOPIC_STATUS:
-            data = json.loads(msg.payload.decode())
+            data = decode_payload(msg)
             status = data.get('status')
             device = data.get('device', 'ESP32-CAM')
             ip = data.get('ip')
@@ -334,11 +462,26 @@ def on_message(client, userdata, msg):
     except json.JSONDecodeError:
         print(f"❌ Error decodificando JSON del topic {topic}")
         db.log('ERROR', 'MQTT', f'Error decodificando JSON del topic {topic}')
+        metrics.inc('message_errors_total', topic=topic, error='json')
     except Exception as e:
         print(f"❌ Error procesando mensaje: {e}")
         db.log('ERROR', 'MQTT', f'Error procesando mensaje: {e}')
+        metrics.inc('message_errors_total', topic=topic, error='exception')
         import traceback
         traceback.print_exc()
+    finally:
+        if metrics.enabled:
+            metrics.observe('message_seconds', time.perf_counter() - started, topic=topic)
+
+# Carriles del despachador (se inicia en main)
+dispatcher = MessageDispatcher(handle_message, [
+    Lane('alerts', [TOPIC_ALERT], max_queue=DISPATCH_ALERT_QUEUE,
+         overflow=DISPATCH_ALERT_OVERFLOW, block_timeout=DISPATCH_ALERT_BLOCK_TIMEOUT),
+    Lane('images', [TOPIC_IMAGE_META, TOPIC_IMAGE, TOPIC_IMAGE_BIN], workers=DISPATCH_IMAGE_WORKERS,
+         max_queue=DISPATCH_IMAGE_QUEUE, overflow=DISPATCH_IMAGE_OVERFLOW, key=capture_key),
+    Lane('status', [TOPIC_STATUS], max_queue=DISPATCH_STATUS_QUEUE, overflow='drop_oldest')
+], metrics=metrics)
+metrics.register_collector(lambda: {f'dispatch_{k}': v for k, v in dispatcher.get_metrics().items()})
 
 def on_disconnect(client, userdata, rc):
     """Callback cuando se desconecta del broker"""
@@ -361,8 +504,20 @@ def main():
     # Crear directorios
     ensure_directories()
     
+    # JPEG sueltos de versiones anteriores sin registro: pasan a contar en
+    # el presupuesto de disco (solo la primera vez)
+    retention.sweep_legacy_images()
+    
+    # Conversión de mantenimiento, antes de que ningún hilo use la base
+    if DB_CONVERT_INCREMENTAL_VACUUM:
+        print("🧹 Convirtiendo la base a auto_vacuum incremental (VACUUM)...")
+        if db.enable_incremental_vacuum():
+            print("✓ auto_vacuum incremental activado")
+        else:
+            print("✓ La base ya estaba en auto_vacuum incremental")
+    
     # Mostrar estadísticas
-    stats = db.get_today_stats()
+    stats = state.today()
     if stats:
         print(f"\n📊 Estadísticas de hoy:")
         print(f"   • Detecciones: {stats.get('detections_today', 0)}")
@@ -382,45 +537,71 @@ def main():
     client.on_message = on_message
     client.on_disconnect = on_disconnect
     
+    # Trabajadores de los carriles (alertas, imágenes, estado)
+    dispatcher.start()
+    
+    # Entregar notificaciones pendientes (también las de antes del reinicio)
+    outbox.start()
+    
     # Conectar al broker
     try:
         print(f"\n🔌 Conectando a broker MQTT en {MQTT_BROKER}:{MQTT_PORT}...")
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         
         # Enviar notificación de sistema iniciado
-        telegram.send_system_status('online', f'Broker: {MQTT_BROKER}:{MQTT_PORT}')
+        telegram.dispatch(telegram.send_system_status, 'online', f'Broker: {MQTT_BROKER}:{MQTT_PORT}')
         
         print("\n✅ Sistema iniciado correctamente")
         print("📡 Esperando alertas de fuego...")
         print("\nPresiona Ctrl+C para detener\n")
         
-        # Actualizar estadísticas cada hora
+        # Las estadísticas las mantienen los triggers de la base de datos;
+        # cada hora se aplica la retención y se recalculan los contadores de
+        # estado por si hubo deriva
         import threading
         def update_stats():
             while True:
                 import time
+                retention.run()
                 time.sleep(3600)  # 1 hora
-                db.update_daily_statistics()
+                reassembler.expire_stale()
+                db.log('INFO', 'CAMERA', 'Estado de reensamblado', details=reassembler.get_stats())
+                db.refresh_counters()
+                state.load()
+                if metrics.enabled:
+                    db.log('INFO', 'PYTHON', 'Resumen de métricas', details=metrics.summary())
                 print("📊 Estadísticas actualizadas")
         
         stats_thread = threading.Thread(target=update_stats, daemon=True)
         stats_thread.start()
         
+        # Recargar configuración al cambiar (system_config / telegram_config.py)
+        config.start()
+        
+        # Endpoint local de métricas (formato Prometheus)
+        if metrics.enabled:
+            try:
+                metrics_server.start()
+            except OSError as e:
+                print(f"⚠️ No se pudo iniciar el endpoint de métricas: {e}")
+        
         # Loop infinito
         client.loop_forever()
         
     except KeyboardInterrupt:
         print("\n\n🛑 Deteniendo sistema...")
         
-        # Guardar estadísticas finales
-        db.update_daily_statistics()
+        # Procesar los mensajes ya encolados
+        dispatcher.stop()
         
         # Enviar notificación de sistema detenido
-        stats = db.get_today_stats()
+        stats = state.today()
         details = None
         if stats:
             details = f"Detecciones: {stats.get('detections_today', 0)} | Alertas: {stats.get('alerts_today', 0)}"
+        outbox.stop()
         telegram.send_system_status('offline', details)
+        telegram.shutdown()
         
         # Mostrar resumen
         print("\n📊 Resumen de la sesión:")
@@ -430,11 +611,14 @@ def main():
             print(f"   • Imágenes capturadas: {stats.get('images_today', 0)}")
         
         client.disconnect()
+        config.stop()
+        metrics_server.stop()
+        db.close()
         print("✓ Desconectado")
         
     except Exception as e:
         print(f"❌ Error: {e}")
-        db.log('CRITICAL', 'PYTHON', f'Error fatal: {e}')
+        db.log('CRITICAL', 'PYTHON', f'Error fatal: {e}', sync=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
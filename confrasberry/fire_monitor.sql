@@ -3,6 +3,10 @@
 -- SQLite Database for Raspberry Pi
 -- ============================================
 
+-- Las páginas libres se devuelven al disco con PRAGMA incremental_vacuum
+-- (solo tiene efecto al crear la base; ver enable_incremental_vacuum)
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- Tabla de detecciones de fuego (sensor data)
 CREATE TABLE IF NOT EXISTS fire_detections (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -16,7 +20,7 @@ CREATE TABLE IF NOT EXISTS fire_detections (
 );
 
 -- Índice para consultas por fecha
-CREATE INDEX IF NOT EXISTS idx_fire_detections_timestamp ON fire_detections(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_fire_detections_keyset ON fire_detections(timestamp, id);
 CREATE INDEX IF NOT EXISTS idx_fire_detections_detected ON fire_detections(detected, timestamp);
 
 -- Tabla de alertas (eventos de fuego agrupados)
@@ -40,8 +44,8 @@ CREATE TABLE IF NOT EXISTS alerts (
 );
 
 -- Índices para alertas
-CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts(status, created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_status_keyset ON alerts(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_alerts_keyset ON alerts(created_at, id);
 
 -- Tabla de imágenes capturadas
 CREATE TABLE IF NOT EXISTS captured_images (
@@ -56,13 +60,14 @@ CREATE TABLE IF NOT EXISTS captured_images (
     chunks_total INTEGER DEFAULT 1,
     capture_trigger TEXT DEFAULT 'AUTO', -- 'AUTO', 'MANUAL', 'SCHEDULED'
     processed BOOLEAN DEFAULT 0,
+    device TEXT, -- Cámara que tomó la captura
     FOREIGN KEY (alert_id) REFERENCES alerts(id) ON DELETE CASCADE,
     CONSTRAINT chk_capture_trigger CHECK (capture_trigger IN ('AUTO', 'MANUAL', 'SCHEDULED'))
 );
 
 -- Índices para imágenes
 CREATE INDEX IF NOT EXISTS idx_images_alert ON captured_images(alert_id);
-CREATE INDEX IF NOT EXISTS idx_images_capture_time ON captured_images(capture_time DESC);
+CREATE INDEX IF NOT EXISTS idx_images_keyset ON captured_images(capture_time, id);
 CREATE INDEX IF NOT EXISTS idx_images_trigger ON captured_images(capture_trigger);
 
 -- Tabla de estado de dispositivos
@@ -95,9 +100,9 @@ CREATE TABLE IF NOT EXISTS system_logs (
 );
 
 -- Índices para logs
-CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON system_logs(timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_logs_level ON system_logs(log_level, timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_logs_component ON system_logs(component, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_logs_keyset ON system_logs(timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_logs_level_keyset ON system_logs(log_level, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_logs_component_keyset ON system_logs(component, timestamp, id);
 
 -- Tabla de configuración del sistema
 CREATE TABLE IF NOT EXISTS system_config (
@@ -129,6 +134,66 @@ CREATE TABLE IF NOT EXISTS daily_statistics (
 -- Índice para estadísticas
 CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_stats_date ON daily_statistics(date DESC);
 
+-- Contadores del estado actual (una sola fila, mantenida por triggers)
+CREATE TABLE IF NOT EXISTS system_counters (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    active_alerts INTEGER NOT NULL DEFAULT 0,
+    online_devices INTEGER NOT NULL DEFAULT 0,
+    last_detection DATETIME, -- Última detección positivo (detected = 1)
+    last_activity DATETIME, -- Última lectura registrada del sensor
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Outbox de notificaciones (Telegram): se escribe en la misma transacción
+-- que la alerta y un hilo lo entrega con reintentos, también tras reiniciar
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    alert_id INTEGER,
+    kind TEXT NOT NULL, -- 'fire_alert', 'alert_photo'
+    payload TEXT NOT NULL, -- JSON con los datos del mensaje
+    status TEXT DEFAULT 'PENDING',
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    delivered_at DATETIME,
+    FOREIGN KEY (alert_id) REFERENCES alerts(id) ON DELETE SET NULL,
+    CONSTRAINT chk_outbox_status CHECK (status IN ('PENDING', 'DELIVERED', 'FAILED'))
+);
+
+-- Índice para el hilo de entrega (pendientes vencidos, más antiguos primero)
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, next_attempt_at, id);
+
+-- Caché de file_id de Telegram: fotos ya subidas, por hash del contenido
+-- (LRU; se reenvían a cualquier chat sin volver a subirlas)
+CREATE TABLE IF NOT EXISTS telegram_file_cache (
+    content_hash TEXT PRIMARY KEY, -- sha256 del JPEG
+    file_id TEXT NOT NULL,
+    file_size INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_file_cache_used ON telegram_file_cache(last_used_at);
+
+-- Versión de system_config (una sola fila, la incrementan los triggers):
+-- ConfigService solo relee la configuración cuando cambia
+CREATE TABLE IF NOT EXISTS config_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO config_version (id, version) VALUES (1, 0);
+
+-- Inicializar contadores desde los datos existentes (solo la primera vez)
+INSERT OR IGNORE INTO system_counters (id, active_alerts, online_devices, last_detection, last_activity)
+SELECT 
+    1,
+    (SELECT COUNT(*) FROM alerts WHERE status = 'ACTIVE'),
+    (SELECT COUNT(*) FROM device_status WHERE status = 'online'),
+    (SELECT MAX(timestamp) FROM fire_detections WHERE detected = 1),
+    (SELECT MAX(timestamp) FROM fire_detections);
+
 -- ============================================
 -- TRIGGERS para mantener integridad
 -- ============================================
@@ -165,6 +230,136 @@ BEGIN
     WHERE id = NEW.id;
 END;
 
+-- Triggers: Incrementar la versión de la configuración
+CREATE TRIGGER IF NOT EXISTS config_version_insert
+AFTER INSERT ON system_config
+BEGIN
+    UPDATE config_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS config_version_update
+AFTER UPDATE ON system_config
+BEGIN
+    UPDATE config_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS config_version_delete
+AFTER DELETE ON system_config
+BEGIN
+    UPDATE config_version SET version = version + 1 WHERE id = 1;
+END;
+
+-- ============================================
+-- TRIGGERS de contadores (daily_statistics + system_counters)
+-- Se actualizan en la misma transacción que la escritura que los provoca.
+-- El día es la fecha local, igual que las claves que usa fire_monitor.py.
+-- ============================================
+
+-- Detecciones
+CREATE TRIGGER IF NOT EXISTS counters_detection_insert
+AFTER INSERT ON fire_detections
+FOR EACH ROW
+BEGIN
+    INSERT OR IGNORE INTO daily_statistics (date) VALUES (DATE(NEW.timestamp, 'localtime'));
+    UPDATE daily_statistics 
+    SET total_detections = total_detections + NEW.detected
+    WHERE date = DATE(NEW.timestamp, 'localtime');
+    
+    UPDATE system_counters 
+    SET last_activity = NEW.timestamp,
+        last_detection = CASE WHEN NEW.detected THEN NEW.timestamp ELSE last_detection END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
+-- Alertas nuevas
+CREATE TRIGGER IF NOT EXISTS counters_alert_insert
+AFTER INSERT ON alerts
+FOR EACH ROW
+BEGIN
+    INSERT OR IGNORE INTO daily_statistics (date) VALUES (DATE(NEW.created_at, 'localtime'));
+    UPDATE daily_statistics 
+    SET total_alerts = total_alerts + 1
+    WHERE date = DATE(NEW.created_at, 'localtime');
+    
+    UPDATE system_counters 
+    SET active_alerts = active_alerts + (NEW.status = 'ACTIVE'),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
+-- Cambio de estado de una alerta (resolución, falsa alarma, reactivación)
+CREATE TRIGGER IF NOT EXISTS counters_alert_status
+AFTER UPDATE OF status ON alerts
+FOR EACH ROW
+WHEN NEW.status IS NOT OLD.status
+BEGIN
+    UPDATE system_counters 
+    SET active_alerts = active_alerts + (NEW.status = 'ACTIVE') - (OLD.status = 'ACTIVE'),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+    
+    UPDATE daily_statistics 
+    SET false_alarms = false_alarms + (NEW.status = 'FALSE_ALARM') - (OLD.status = 'FALSE_ALARM')
+    WHERE date = DATE(NEW.created_at, 'localtime');
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_alert_delete
+AFTER DELETE ON alerts
+FOR EACH ROW
+WHEN OLD.status = 'ACTIVE'
+BEGIN
+    UPDATE system_counters 
+    SET active_alerts = active_alerts - 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
+-- Imágenes
+CREATE TRIGGER IF NOT EXISTS counters_image_insert
+AFTER INSERT ON captured_images
+FOR EACH ROW
+BEGIN
+    INSERT OR IGNORE INTO daily_statistics (date) VALUES (DATE(NEW.capture_time, 'localtime'));
+    UPDATE daily_statistics 
+    SET images_captured = images_captured + 1
+    WHERE date = DATE(NEW.capture_time, 'localtime');
+END;
+
+-- Dispositivos en línea
+CREATE TRIGGER IF NOT EXISTS counters_device_insert
+AFTER INSERT ON device_status
+FOR EACH ROW
+WHEN NEW.status = 'online'
+BEGIN
+    UPDATE system_counters 
+    SET online_devices = online_devices + 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_device_status
+AFTER UPDATE OF status ON device_status
+FOR EACH ROW
+WHEN NEW.status IS NOT OLD.status
+BEGIN
+    UPDATE system_counters 
+    SET online_devices = online_devices + (NEW.status = 'online') - (OLD.status = 'online'),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_device_delete
+AFTER DELETE ON device_status
+FOR EACH ROW
+WHEN OLD.status = 'online'
+BEGIN
+    UPDATE system_counters 
+    SET online_devices = online_devices - 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+END;
+
 -- ============================================
 -- VISTAS para consultas comunes
 -- ============================================
@@ -189,27 +384,32 @@ WHERE a.status = 'ACTIVE'
 GROUP BY a.id
 ORDER BY a.created_at DESC;
 
--- Vista: Estadísticas de hoy
-CREATE VIEW IF NOT EXISTS today_statistics AS
+-- Vista: Estadísticas de hoy (lee los contadores, O(1))
+DROP VIEW IF EXISTS today_statistics;
+CREATE VIEW today_statistics AS
 SELECT 
-    DATE('now') as today,
-    COUNT(DISTINCT CASE WHEN fd.detected = 1 THEN fd.id END) as detections_today,
-    COUNT(DISTINCT a.id) as alerts_today,
-    COUNT(DISTINCT ci.id) as images_today,
-    MAX(fd.timestamp) as last_detection
-FROM fire_detections fd
-LEFT JOIN alerts a ON DATE(a.created_at) = DATE('now')
-LEFT JOIN captured_images ci ON DATE(ci.capture_time) = DATE('now')
-WHERE DATE(fd.timestamp) = DATE('now');
-
--- Vista: Estado del sistema
-CREATE VIEW IF NOT EXISTS system_status AS
+    DATE('now', 'localtime') as today,
+    COALESCE(ds.total_detections, 0) as detections_today,
+    COALESCE(ds.total_alerts, 0) as alerts_today,
+    COALESCE(ds.images_captured, 0) as images_today,
+    CASE WHEN DATE(sc.last_detection, 'localtime') = DATE('now', 'localtime')
+         THEN sc.last_detection END as last_detection
+FROM system_counters sc
+LEFT JOIN daily_statistics ds ON ds.date = DATE('now', 'localtime')
+WHERE sc.id = 1;
+
+-- Vista: Estado del sistema (lee los contadores, O(1))
+DROP VIEW IF EXISTS system_status;
+CREATE VIEW system_status AS
 SELECT 
-    (SELECT COUNT(*) FROM alerts WHERE status = 'ACTIVE') as active_alerts,
-    (SELECT COUNT(*) FROM device_status WHERE status = 'online') as online_devices,
-    (SELECT COUNT(*) FROM captured_images WHERE DATE(capture_time) = DATE('now')) as images_today,
-    (SELECT COUNT(*) FROM fire_detections WHERE detected = 1 AND DATE(timestamp) = DATE('now')) as detections_today,
-    (SELECT MAX(timestamp) FROM fire_detections) as last_activity;
+    sc.active_alerts,
+    sc.online_devices,
+    COALESCE(ds.images_captured, 0) as images_today,
+    COALESCE(ds.total_detections, 0) as detections_today,
+    sc.last_activity
+FROM system_counters sc
+LEFT JOIN daily_statistics ds ON ds.date = DATE('now', 'localtime')
+WHERE sc.id = 1;
 
 -- ============================================
 -- DATOS INICIALES
@@ -223,6 +423,8 @@ INSERT OR IGNORE INTO system_config (key, value, value_type, description) VALUES
 ('notification_enabled', 'false', 'boolean', 'Activar notificaciones por email'),
 ('image_retention_days', '30', 'integer', 'Días para mantener imágenes antiguas'),
 ('log_retention_days', '7', 'integer', 'Días para mantener logs'),
+('image_disk_budget_mb', '2048', 'integer', 'Espacio máximo para imágenes (MB)'),
+('min_free_disk_mb', '500', 'integer', 'Espacio libre mínimo en disco (MB)'),
 ('mqtt_broker', 'localhost:1883', 'string', 'Dirección del broker MQTT'),
 ('web_port', '3000', 'integer', 'Puerto del servidor web'),
 ('sensor_read_interval_ms', '100', 'integer', 'Intervalo de lectura del sensor (ms)'),
@@ -240,9 +442,30 @@ INSERT INTO system_logs (log_level, component, message) VALUES
 -- ÍNDICES ADICIONALES PARA PERFORMANCE
 -- ============================================
 
--- Índice compuesto para búsquedas complejas
-CREATE INDEX IF NOT EXISTS idx_detections_datetime_detected 
-ON fire_detections(DATE(timestamp), detected);
+-- Las consultas por rango usan [inicio, fin) sobre la columna cruda; el
+-- índice de expresión DATE(timestamp) ya no se usa y solo encarecía los INSERT
+DROP INDEX IF EXISTS idx_detections_datetime_detected;
+
+-- Los índices de tiempo terminan en id para que la paginación keyset
+-- (ORDER BY tiempo DESC, id DESC) recorra el índice sin ordenar en memoria;
+-- reemplazan a los antiguos índices (tiempo DESC)
+DROP INDEX IF EXISTS idx_fire_detections_timestamp;
+DROP INDEX IF EXISTS idx_alerts_status;
+DROP INDEX IF EXISTS idx_alerts_created;
+DROP INDEX IF EXISTS idx_images_capture_time;
+DROP INDEX IF EXISTS idx_logs_timestamp;
+DROP INDEX IF EXISTS idx_logs_level;
+DROP INDEX IF EXISTS idx_logs_component;
+
+-- Índices de cobertura para FireMonitorDB.summarize_between
+CREATE INDEX IF NOT EXISTS idx_alerts_created_severity 
+ON alerts(created_at, severity);
+
+CREATE INDEX IF NOT EXISTS idx_images_time_size 
+ON captured_images(capture_time, image_size_bytes);
+
+CREATE INDEX IF NOT EXISTS idx_logs_time_level 
+ON system_logs(timestamp, log_level);
 
 -- Índice para alertas activas con imágenes
 CREATE INDEX IF NOT EXISTS idx_images_alert_time 
@@ -0,0 +1,199 @@
+"""
+Fire Monitor - Hot State
+Copia en memoria del estado que se consulta en cada mensaje: alerta
+activa, últimas detecciones y contadores de hoy
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, Dict, List
+
+from database import DB_TIMESTAMP_FORMAT
+
+class HotState:
+    def __init__(self, db, detections_window: int = 50):
+        """
+        Inicializar estado en memoria
+        
+        Las escrituras del monitor pasan por los métodos record_* (que
+        escriben en SQLite y actualizan la copia); las lecturas se sirven
+        desde memoria. load() rehidrata todo desde la base de datos.
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            detections_window: Detecciones recientes que se conservan
+        """
+        self.db = db
+        self._lock = threading.Lock()
+        self._active_alert = None
+        self._detections = deque(maxlen=detections_window)
+        self._today = {}
+        self._day = None
+    
+    # ============================================
+    # CARGA
+    # ============================================
+    
+    def load(self):
+        """
+        Rehidratar desde SQLite (al arrancar y en la tarea horaria)
+        
+        Corrige también cambios hechos por otros procesos, p.ej. una alerta
+        resuelta desde la web.
+        """
+        active = self.db.get_active_alert()
+        detections = self.db.get_recent_detections(self._detections.maxlen)
+        today = self.db.get_today_stats()
+        
+        with self._lock:
+            self._active_alert = active
+            self._detections.clear()
+            self._detections.extend(reversed(detections))
+            self._day = self._current_day()
+            self._today = {
+                'detections_today': today.get('detections_today', 0) or 0,
+                'alerts_today': today.get('alerts_today', 0) or 0,
+                'images_today': today.get('images_today', 0) or 0,
+                'last_detection': today.get('last_detection')
+            }
+    
+    # ============================================
+    # ESCRITURAS
+    # ============================================
+    
+    def record_fire_event(self, detections: int, esp32_millis: int = None,
+                          confidence: int = 100, notification: Dict = None) -> Dict:
+        """
+        Registrar detección positiva + alerta (ver FireMonitorDB.record_fire_event)
+        
+        Se pasa la alerta activa en caché, así la transacción no necesita
+        buscarla salvo que haya cambiado fuera de este proceso.
+        """
+        with self._lock:
+            cached = self._active_alert
+        
+        event = self.db.record_fire_event(
+            detections=detections,
+            esp32_millis=esp32_millis,
+            confidence=confidence,
+            active_alert=cached,
+            notification=notification
+        )
+        now = self._now()
+        
+        with self._lock:
+            if event['created'] or cached is None or cached['id'] != event['alert_id']:
+                self._active_alert = {
+                    'id': event['alert_id'],
+                    'detection_id': event['detection_id'],
+                    'alert_type': 'FIRE_DETECTED',
+                    'severity': event['severity'],
+                    'detections_count': detections,
+                    'status': 'ACTIVE',
+                    'created_at': now
+                }
+            else:
+                self._active_alert = dict(cached, detections_count=detections)
+            
+            self._append_detection(event['detection_id'], True, esp32_millis, confidence, now)
+            self._roll_day()
+            self._today['detections_today'] += 1
+            self._today['last_detection'] = now
+            if event['created']:
+                self._today['alerts_today'] += 1
+        
+        return event
+    
+    def record_clear(self, esp32_millis: int = None, confidence: int = 100):
+        """Registrar detección negativa (escritura diferida)"""
+        self.db.insert_detection(
+            detected=False,
+            esp32_millis=esp32_millis,
+            confidence=confidence,
+            sync=False
+        )
+        
+        with self._lock:
+            # Las negativas no cuentan en detections_today (igual que el trigger)
+            self._append_detection(None, False, esp32_millis, confidence, self._now())
+    
+    def record_image(self):
+        """Contabilizar una imagen registrada en el catálogo"""
+        with self._lock:
+            self._roll_day()
+            self._today['images_today'] += 1
+    
+    def resolve_alert(self, alert_id: int, status: str = 'RESOLVED'):
+        """Resolver una alerta y olvidarla como activa"""
+        self.db.resolve_alert(alert_id, status)
+        
+        with self._lock:
+            if self._active_alert and self._active_alert['id'] == alert_id:
+                self._active_alert = None
+    
+    # ============================================
+    # LECTURAS
+    # ============================================
+    
+    def active_alert(self) -> Optional[Dict]:
+        """Alerta activa (copia)"""
+        with self._lock:
+            return dict(self._active_alert) if self._active_alert else None
+    
+    def recent_detections(self, limit: int = None) -> List[Dict]:
+        """Últimas detecciones, más reciente primero"""
+        with self._lock:
+            detections = list(reversed(self._detections))
+        return detections[:limit] if limit else detections
+    
+    def today(self) -> Dict:
+        """Contadores de hoy (mismas claves que FireMonitorDB.get_today_stats)"""
+        with self._lock:
+            self._roll_day()
+            return dict(self._today, today=self._day)
+    
+    def snapshot(self) -> Dict:
+        """Estado completo (para una API de estado)"""
+        return {
+            'active_alert': self.active_alert(),
+            'recent_detections': self.recent_detections(),
+            'today': self.today()
+        }
+    
+    # ============================================
+    # INTERNOS (llamar con _lock tomado)
+    # ============================================
+    
+    @staticmethod
+    def _now() -> str:
+        # Mismo formato y zona (UTC) que CURRENT_TIMESTAMP de SQLite
+        return datetime.now(timezone.utc).strftime(DB_TIMESTAMP_FORMAT)
+    
+    @staticmethod
+    def _current_day() -> str:
+        # Igual que DATE(..., 'localtime') de los triggers (ver local_today)
+        return datetime.now().strftime('%Y-%m-%d')
+    
+    def _roll_day(self):
+        """Reiniciar contadores al cambiar de día"""
+        day = self._current_day()
+        if day != self._day:
+            self._day = day
+            self._today = {
+                'detections_today': 0,
+                'alerts_today': 0,
+                'images_today': 0,
+                'last_detection': self._today.get('last_detection')
+            }
+    
+    def _append_detection(self, detection_id, detected: bool, esp32_millis,
+                          confidence: int, timestamp: str):
+        self._detections.append({
+            'id': detection_id,
+            'sensor_type': 'KY-026',
+            'detected': int(detected),
+            'confidence': confidence,
+            'timestamp': timestamp,
+            'esp32_millis': esp32_millis
+        })
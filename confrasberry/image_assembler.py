@@ -0,0 +1,345 @@
+"""
+Fire Monitor - Image Reassembler
+Reconstruye imágenes enviadas por chunks, separadas por dispositivo y captura
+"""
+
+import base64
+import binascii
+import struct
+import threading
+import time
+import zlib
+from typing import Optional, Dict, List, Tuple
+
+DEFAULT_DEVICE = 'ESP32-CAM'
+
+# Chunks binarios (fire/image/bin/<device>): cabecera little-endian de 16
+# bytes seguida de los bytes JPEG sin codificar
+#   magic 'FI' | versión u8 | flags u8 | capture u32 | chunk u16 | total u16 | crc32 u32
+BINARY_CHUNK_MAGIC = b'FI'
+BINARY_CHUNK_VERSION = 1
+BINARY_CHUNK_HEADER = struct.Struct('<2sBBIHHI')
+
+def parse_binary_chunk(device: str, payload: bytes) -> Dict:
+    """
+    Decodificar un chunk binario al mismo dict que un chunk JSON
+    
+    'data' es una vista sobre el payload (sin copiar); si el CRC32 no
+    coincide se devuelve con data=None, así el reensamblador descarta la
+    transferencia igual que con un chunk JSON inválido.
+    
+    Raises:
+        ValueError: Cabecera ausente, magic o versión desconocidos
+    """
+    if len(payload) < BINARY_CHUNK_HEADER.size:
+        raise ValueError(f'chunk binario de {len(payload)} bytes, sin cabecera completa')
+    
+    magic, version, _flags, capture_id, index, total, crc = \
+        BINARY_CHUNK_HEADER.unpack_from(payload)
+    if magic != BINARY_CHUNK_MAGIC:
+        raise ValueError(f'magic inválido {magic!r}')
+    if version != BINARY_CHUNK_VERSION:
+        raise ValueError(f'versión de chunk binario no soportada: {version}')
+    
+    data = memoryview(payload)[BINARY_CHUNK_HEADER.size:]
+    if zlib.crc32(data) != crc:
+        print(f"❌ CRC inválido en chunk {index}/{total} ({device}, captura {capture_id})")
+        data = None
+    
+    return {
+        'device': device,
+        'capture': capture_id,
+        'chunk': index,
+        'total': total,
+        'data': data
+    }
+
+class ImageTransfer:
+    """Transferencia en curso de una captura (meta + chunks recibidos)"""
+    
+    def __init__(self, device: str, capture_id, metadata: Dict, deadline: float):
+        self.device = device
+        self.capture_id = capture_id
+        self.metadata = metadata
+        self.total = metadata.get('chunks')
+        self.size = metadata.get('size')
+        self.chunk_size = metadata.get('chunk_size')
+        self.received = set()
+        self.bytes_used = 0
+        self.started_at = time.monotonic()
+        self.deadline = deadline
+        
+        # Con 'size' conocido se decodifica cada chunk directamente en su
+        # posición final; sin él se guardan las partes y se unen al final
+        self.buffer = None
+        self.parts = {}
+        if isinstance(self.size, int) and self.size > 0:
+            self.buffer = bytearray(self.size)
+            self.bytes_used = self.size
+    
+    @property
+    def key(self) -> Tuple:
+        return (self.device, self.capture_id)
+    
+    def add(self, index: int, data) -> int:
+        """
+        Copiar un chunk (Base64 como str, o bytes de un chunk binario) en el
+        buffer de la imagen
+        
+        Todos los chunks salvo el último tienen el mismo tamaño (chunk_size
+        de la metadata o, si falta, el del primer chunk no final recibido),
+        por lo que el desplazamiento se deduce del índice.
+        
+        Returns:
+            Bytes de memoria adicionales que ocupa la transferencia
+        
+        Raises:
+            ValueError: Base64 inválido o chunk fuera de los límites
+        """
+        if isinstance(data, str):
+            try:
+                raw = base64.b64decode(data, validate=True)
+            except (binascii.Error, ValueError) as e:
+                raise ValueError(f'Base64 inválido: {e}')
+        else:
+            raw = data
+        
+        if not raw:
+            raise ValueError(f'chunk {index} vacío')
+        
+        if self.buffer is None:
+            previous = self.parts.get(index)
+            self.parts[index] = bytes(raw)
+            self.received.add(index)
+            return len(raw) - (len(previous) if previous is not None else 0)
+        
+        if index == self.total - 1:
+            offset = self.size - len(raw)
+            if self.chunk_size and offset != index * self.chunk_size:
+                raise ValueError(f'último chunk de {len(raw)} bytes no cuadra con el tamaño declarado')
+        else:
+            if not self.chunk_size:
+                self.chunk_size = len(raw)
+            elif len(raw) != self.chunk_size:
+                raise ValueError(f'chunk {index} de {len(raw)} bytes (esperados {self.chunk_size})')
+            offset = index * self.chunk_size
+        
+        if offset < 0 or offset + len(raw) > self.size:
+            raise ValueError(f'chunk {index} excede el tamaño declarado ({self.size} bytes)')
+        
+        memoryview(self.buffer)[offset:offset + len(raw)] = raw
+        self.received.add(index)
+        return 0
+    
+    def is_complete(self) -> bool:
+        return self.total is not None and len(self.received) == self.total
+    
+    def assemble(self) -> memoryview:
+        """Imagen completa (vista sobre el buffer, sin copias si hubo 'size')"""
+        if self.buffer is not None:
+            return memoryview(self.buffer)
+        return memoryview(b''.join(self.parts[i] for i in range(self.total)))
+    
+    def elapsed(self) -> float:
+        """Segundos desde que empezó la transferencia"""
+        return time.monotonic() - self.started_at
+
+class ImageReassembler:
+    def __init__(self, transfer_timeout: float = 30.0, max_bytes: int = 4 * 1024 * 1024,
+                 max_transfers: int = 8, max_image_bytes: int = None):
+        """
+        Inicializar gestor de reensamblado
+        
+        Args:
+            transfer_timeout: Segundos que puede durar una transferencia
+                              antes de descartarse como incompleta
+            max_bytes: Memoria total para chunks en curso (todas las cámaras)
+            max_transfers: Transferencias simultáneas como máximo
+            max_image_bytes: Tamaño máximo de una imagen (por defecto
+                             max_bytes); una metadata que declara más se
+                             rechaza antes de reservar el buffer
+        """
+        self.transfer_timeout = transfer_timeout
+        self.max_bytes = max_bytes
+        self.max_transfers = max_transfers
+        self.max_image_bytes = min(max_image_bytes or max_bytes, max_bytes)
+        
+        self._transfers = {}  # (device, capture_id) -> ImageTransfer
+        self._latest = {}     # device -> capture_id más reciente (firmware sin 'capture')
+        self._bytes_used = 0
+        self._lock = threading.Lock()
+        
+        self.counters = {
+            'started': 0,
+            'completed': 0,
+            'expired': 0,
+            'evicted': 0,
+            'corrupt': 0,
+            'rejected': 0
+        }
+    
+    # ============================================
+    # API
+    # ============================================
+    
+    def start_transfer(self, metadata: Dict) -> Optional[ImageTransfer]:
+        """
+        Registrar metadata de una nueva captura (fire/image/meta)
+        
+        Returns:
+            La transferencia, o None si el tamaño declarado excede
+            max_image_bytes (no se reserva memoria)
+        """
+        device = metadata.get('device') or DEFAULT_DEVICE
+        capture_id = metadata.get('capture', metadata.get('timestamp'))
+        size = metadata.get('size')
+        
+        with self._lock:
+            if isinstance(size, int) and size > self.max_image_bytes:
+                print(f"❌ Captura {capture_id} de {device} declara {size} bytes "
+                      f"(máximo {self.max_image_bytes}), descartada")
+                self.counters['rejected'] += 1
+                self._discard_locked((device, capture_id))
+                return None
+            
+            self._expire_locked(time.monotonic())
+            
+            key = (device, capture_id)
+            if key in self._transfers:
+                self._discard_locked(key)
+            
+            transfer = ImageTransfer(device, capture_id, dict(metadata),
+                                     time.monotonic() + self.transfer_timeout)
+            self._transfers[key] = transfer
+            self._bytes_used += transfer.bytes_used
+            self._latest[device] = capture_id
+            self.counters['started'] += 1
+            
+            self._enforce_limits_locked(keep=key)
+            return transfer
+    
+    def add_chunk(self, chunk: Dict) -> Optional[ImageTransfer]:
+        """
+        Añadir un chunk (fire/image, o fire/image/bin/<device> ya pasado por
+        parse_binary_chunk)
+        
+        Returns:
+            La transferencia completa cuando llega el último chunk; None en
+            otro caso. La transferencia devuelta ya no la gestiona el
+            reensamblador.
+        """
+        device = chunk.get('device') or DEFAULT_DEVICE
+        index = chunk.get('chunk')
+        total = chunk.get('total')
+        data = chunk.get('data')
+        
+        with self._lock:
+            now = time.monotonic()
+            self._expire_locked(now)
+            
+            capture_id = chunk.get('capture', self._latest.get(device))
+            key = (device, capture_id)
+            transfer = self._transfers.get(key)
+            
+            if transfer is None:
+                # Chunk sin metadata previa: abrir transferencia implícita
+                transfer = ImageTransfer(device, capture_id, {'device': device, 'chunks': total},
+                                         now + self.transfer_timeout)
+                self._transfers[key] = transfer
+                self._latest[device] = capture_id
+                self.counters['started'] += 1
+            
+            if transfer.total is None:
+                transfer.total = total
+            
+            if (data is None or not isinstance(index, int) or total != transfer.total
+                    or not 0 <= index < transfer.total):
+                print(f"❌ Chunk inválido ({device}, captura {capture_id}): "
+                      f"{index}/{total}, descartando transferencia")
+                self.counters['corrupt'] += 1
+                self._discard_locked(key)
+                return None
+            
+            try:
+                added = transfer.add(index, data)
+            except ValueError as e:
+                print(f"❌ Chunk {index}/{total} corrupto ({device}, captura {capture_id}): {e}")
+                self.counters['corrupt'] += 1
+                self._discard_locked(key)
+                return None
+            
+            transfer.bytes_used += added
+            self._bytes_used += added
+            
+            # Sin 'size' en la metadata, el tope se comprueba según llegan
+            if transfer.bytes_used > self.max_image_bytes:
+                print(f"❌ Captura {capture_id} de {device} supera {self.max_image_bytes} bytes, "
+                      f"descartada")
+                self.counters['rejected'] += 1
+                self._discard_locked(key)
+                return None
+            
+            if transfer.is_complete():
+                self._discard_locked(key)
+                self.counters['completed'] += 1
+                return transfer
+            
+            self._enforce_limits_locked(keep=key)
+            return None
+    
+    def expire_stale(self) -> int:
+        """Descartar transferencias vencidas; devuelve cuántas"""
+        with self._lock:
+            return self._expire_locked(time.monotonic())
+    
+    def get_stats(self) -> Dict:
+        """Contadores y estado de las transferencias en curso"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats['in_progress'] = len(self._transfers)
+            stats['bytes_buffered'] = self._bytes_used
+        return stats
+    
+    def pending_transfers(self) -> List[Dict]:
+        """Resumen de transferencias en curso (para diagnóstico)"""
+        with self._lock:
+            return [{
+                'device': t.device,
+                'capture_id': t.capture_id,
+                'received': len(t.received),
+                'total': t.total,
+                'bytes': t.bytes_used,
+                'age_s': round(t.elapsed(), 1)
+            } for t in self._transfers.values()]
+    
+    # ============================================
+    # INTERNOS (llamar con _lock tomado)
+    # ============================================
+    
+    def _discard_locked(self, key: Tuple):
+        transfer = self._transfers.pop(key, None)
+        if transfer is not None:
+            self._bytes_used -= transfer.bytes_used
+    
+    def _expire_locked(self, now: float) -> int:
+        expired = [key for key, t in self._transfers.items() if now >= t.deadline]
+        for key in expired:
+            transfer = self._transfers[key]
+            print(f"⏱️ Transferencia vencida ({transfer.device}, captura {transfer.capture_id}): "
+                  f"{len(transfer.received)}/{transfer.total} chunks")
+            self._discard_locked(key)
+            self.counters['expired'] += 1
+        return len(expired)
+    
+    def _enforce_limits_locked(self, keep: Tuple):
+        """Desalojar las transferencias más antiguas si se exceden los límites"""
+        while (self._bytes_used > self.max_bytes or len(self._transfers) > self.max_transfers):
+            candidates = [t for k, t in self._transfers.items() if k != keep]
+            if not candidates:
+                return
+            
+            oldest = min(candidates, key=lambda t: t.started_at)
+            print(f"⚠️ Memoria de reensamblado excedida, descartando captura "
+                  f"{oldest.capture_id} de {oldest.device}")
+            self._discard_locked(oldest.key)
+            self.counters['evicted'] += 1
@@ -0,0 +1,261 @@
+"""
+Fire Monitor - Image Catalog
+Índice de imágenes capturadas (tabla captured_images + manifiesto en disco)
+con almacenamiento repartido en directorios por fecha (YYYY/MM/DD)
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Tuple
+
+MANIFEST_NAME = 'manifest.ndjson'
+
+class ImageCatalog:
+    def __init__(self, db, images_dir: str, manifest_path: str = None):
+        """
+        Inicializar catálogo
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            images_dir: Directorio raíz de imágenes
+            manifest_path: Manifiesto NDJSON de solo-anexado (por defecto
+                           images_dir/manifest.ndjson)
+        """
+        self.db = db
+        self.images_dir = images_dir
+        self.manifest_path = manifest_path or os.path.join(images_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # Una regeneración a la vez
+        
+        # Bajas anotadas desde la última compactación (None = desconocido,
+        # p.ej. al arrancar: la primera compact_manifest() regenera)
+        self._pending_deletes = None
+    
+    # ============================================
+    # ALMACENAMIENTO
+    # ============================================
+    
+    def path_for(self, captured_at: datetime = None, device: str = None) -> str:
+        """
+        Ruta absoluta para una nueva captura: images_dir/YYYY/MM/DD/archivo.jpg
+        
+        El nombre incluye microsegundos (y el dispositivo si se indica) para
+        que capturas simultáneas de varias cámaras no se sobrescriban.
+        """
+        captured_at = captured_at or datetime.now()
+        shard = os.path.join(self.images_dir, captured_at.strftime('%Y'),
+                             captured_at.strftime('%m'), captured_at.strftime('%d'))
+        os.makedirs(shard, exist_ok=True)
+        
+        filename = f"fire_capture_{captured_at.strftime('%Y%m%d_%H%M%S_%f')}"
+        if device:
+            filename += f"_{''.join(c for c in device if c.isalnum() or c in '-_')}"
+        return os.path.join(shard, filename + '.jpg')
+    
+    def relative_path(self, file_path: str) -> str:
+        """Ruta relativa a images_dir con '/' (la que usa la web)"""
+        return os.path.relpath(file_path, self.images_dir).replace(os.sep, '/')
+    
+    def add(self, file_path: str, alert_id: int = None, image_size: int = 0,
+            width: int = None, height: int = None, chunks_total: int = 1,
+            trigger: str = 'AUTO', device: str = None) -> int:
+        """
+        Registrar una imagen ya escrita en disco
+        
+        Returns:
+            ID del registro en captured_images
+        """
+        file_name = os.path.basename(file_path)
+        
+        # Registro y anexado bajo el mismo lock que rebuild_manifest(): una
+        # regeneración en curso no puede dejar la imagen duplicada
+        with self._lock:
+            image_id = self.db.save_image_record(
+                alert_id=alert_id,
+                file_path=file_path,
+                file_name=file_name,
+                image_size=image_size,
+                width=width,
+                height=height,
+                chunks_total=chunks_total,
+                trigger=trigger,
+                device=device
+            )
+            
+            self._append_manifest_locked({
+                'op': 'add',
+                'id': image_id,
+                'path': self.relative_path(file_path),
+                'file_name': file_name,
+                'alert_id': alert_id,
+                'device': device,
+                # Mismo formato y zona (UTC) que CURRENT_TIMESTAMP de SQLite
+                'captured_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                'size': image_size,
+                'width': width,
+                'height': height
+            })
+        return image_id
+    
+    def register_existing(self, images: List[Dict]) -> int:
+        """
+        Registrar imágenes ya presentes en disco sin fila en captured_images
+        (ver RetentionEngine.sweep_legacy_images)
+        
+        Args:
+            images: dicts con file_path, image_size y capture_time (UTC)
+        
+        Returns:
+            Imágenes registradas
+        """
+        records = [dict(image, file_name=os.path.basename(image['file_path']))
+                   for image in images]
+        
+        with self._lock:
+            image_ids = self.db.insert_existing_images(records)
+            self._append_manifest_locked(*({
+                'op': 'add',
+                'id': image_id,
+                'path': self.relative_path(record['file_path']),
+                'file_name': record['file_name'],
+                'alert_id': None,
+                'device': None,
+                'captured_at': record['capture_time'],
+                'size': record['image_size'],
+                'width': None,
+                'height': None
+            } for image_id, record in zip(image_ids, records)))
+        return len(image_ids)
+    
+    def remove(self, image_id: int, file_path: str = None):
+        """Anotar en el manifiesto que una imagen fue eliminada"""
+        self.remove_many([(image_id, file_path)])
+    
+    def remove_many(self, images: List[Tuple[int, Optional[str]]]):
+        """Anotar varias bajas (id, ruta) con una sola escritura al manifiesto"""
+        entries = []
+        for image_id, file_path in images:
+            entry = {'op': 'del', 'id': image_id}
+            if file_path:
+                entry['path'] = self.relative_path(file_path)
+            entries.append(entry)
+        
+        with self._lock:
+            self._append_manifest_locked(*entries)
+            if self._pending_deletes is not None:
+                self._pending_deletes += len(entries)
+    
+    # ============================================
+    # CONSULTAS
+    # ============================================
+    
+    def latest(self) -> Optional[Dict]:
+        """Imagen más reciente"""
+        return self.db.get_latest_image()
+    
+    def by_alert(self, alert_id: int) -> List[Dict]:
+        """Imágenes de una alerta (usa idx_images_alert_time)"""
+        return self.db.get_images_by_alert(alert_id)
+    
+    def in_range(self, start: str, end: str, limit: int = 500) -> List[Dict]:
+        """Imágenes con capture_time en [start, end) (UTC, 'YYYY-MM-DD HH:MM:SS')"""
+        return self.db.get_images_between(start, end, limit)
+    
+    # ============================================
+    # MANIFIESTO
+    # ============================================
+    
+    def compact_manifest(self) -> Optional[int]:
+        """
+        Regenerar el manifiesto si acumula bajas desde la última compactación
+        (lo llama RetentionEngine.run tras eliminar imágenes)
+        
+        Sin compactar, las líneas 'del' crecen sin límite y desplazan las
+        altas vigentes fuera del final que lee server.js.
+        
+        Returns:
+            Entradas escritas, o None si no hacía falta
+        """
+        if self._pending_deletes == 0:
+            return None
+        return self.rebuild_manifest()
+    
+    def _append_manifest_locked(self, *entries: Dict):
+        """Anexar líneas al manifiesto (una sola escritura; con _lock tomado)"""
+        if not entries:
+            return
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+    
+    def rebuild_manifest(self) -> int:
+        """
+        Regenerar el manifiesto desde captured_images (compacta las bajas)
+        
+        Las filas se leen por páginas (iter_images) sin tomar el lock, así
+        add() no espera durante la regeneración; lo anotado en el manifiesto
+        entretanto se copia al final antes de reemplazarlo. Se escribe a un
+        archivo temporal y se reemplaza con os.replace, así los lectores
+        nunca ven un manifiesto a medias.
+        
+        Returns:
+            Número de entradas escritas
+        """
+        tmp_path = self.manifest_path + '.tmp'
+        count = 0
+        
+        with self._rebuild_lock:
+            # Punto de corte: las altas posteriores tienen id mayor y quedan
+            # en el manifiesto a partir de offset
+            with self._lock:
+                max_id = self.db.get_max_image_id()
+                offset = self._manifest_size()
+            
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for row in self.db.iter_images(descending=False):
+                    if row['id'] > max_id:
+                        continue
+                    f.write(json.dumps({
+                        'op': 'add',
+                        'id': row['id'],
+                        'path': self.relative_path(row['file_path']),
+                        'file_name': row['file_name'],
+                        'alert_id': row['alert_id'],
+                        'device': row['device'],
+                        'captured_at': row['capture_time'],
+                        'size': row['image_size_bytes'],
+                        'width': row['width'],
+                        'height': row['height']
+                    }, ensure_ascii=False) + '\n')
+                    count += 1
+            
+            with self._lock:
+                deletes = 0
+                with open(tmp_path, 'a', encoding='utf-8') as f:
+                    for line in self._manifest_lines_from(offset):
+                        f.write(line)
+                        if json.loads(line).get('op') == 'del':
+                            deletes += 1
+                        else:
+                            count += 1
+                os.replace(tmp_path, self.manifest_path)
+                self._pending_deletes = deletes
+        
+        return count
+    
+    def _manifest_size(self) -> int:
+        try:
+            return os.path.getsize(self.manifest_path)
+        except OSError:
+            return 0
+    
+    def _manifest_lines_from(self, offset: int) -> List[str]:
+        """Líneas anexadas al manifiesto desde offset (con _lock tomado)"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                f.seek(offset)
+                return [line for line in f if line.endswith('\n')]
+        except FileNotFoundError:
+            return []
@@ -0,0 +1,140 @@
+"""
+Fire Monitor - Latest Image Publisher
+Publica la última captura como latest.jpg sin segunda escritura y sin
+lecturas a medias (enlace + rename atómico)
+"""
+
+import os
+import threading
+from typing import Optional, List
+
+class LatestImagePublisher:
+    MODES = ('hardlink', 'symlink', 'copy')
+    
+    def __init__(self, latest_path: str, mode: str = 'hardlink',
+                 ring_dir: str = None, ring_size: int = 5):
+        """
+        Inicializar publicador
+        
+        Args:
+            latest_path: Ruta pública de la última imagen (latest.jpg)
+            mode: 'hardlink' (mismo sistema de archivos), 'symlink' o 'copy'.
+                  Si el modo falla se prueba el siguiente
+            ring_dir: Directorio en tmpfs (p.ej. /dev/shm/fire_monitor) para
+                      guardar las últimas ring_size capturas en RAM; latest.jpg
+                      pasa a ser un symlink a la más reciente
+            ring_size: Capturas que se conservan en el anillo
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de publicación inválido: {mode}")
+        
+        self.latest_path = latest_path
+        self.mode = mode
+        self.ring_dir = ring_dir
+        self.ring_size = ring_size
+        self._seq = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(latest_path) or '.', exist_ok=True)
+        if ring_dir:
+            os.makedirs(ring_dir, exist_ok=True)
+    
+    def publish(self, file_path: str, image_bytes=None) -> Optional[str]:
+        """
+        Reemplazar latest.jpg de forma atómica
+        
+        Args:
+            file_path: Imagen ya guardada en el archivo de capturas
+            image_bytes: Contenido (solo necesario con ring_dir o modo 'copy',
+                         evita volver a leer el archivo)
+        
+        Returns:
+            Ruta a la que apunta latest.jpg, o None si falló
+        """
+        with self._lock:
+            try:
+                if self.ring_dir:
+                    frame_path = self._write_ring_frame(file_path, image_bytes)
+                    self._replace_with_symlink(frame_path)
+                    return frame_path
+                
+                modes = self.MODES[self.MODES.index(self.mode):]
+                for mode in modes:
+                    try:
+                        if mode == 'hardlink':
+                            self._replace_with_hardlink(file_path)
+                        elif mode == 'symlink':
+                            self._replace_with_symlink(file_path)
+                        else:
+                            self._replace_with_copy(file_path, image_bytes)
+                        return file_path
+                    except OSError as e:
+                        if mode == modes[-1]:
+                            raise
+                        print(f"⚠️ Publicación por {mode} falló ({e}), probando siguiente modo")
+            except OSError as e:
+                print(f"❌ Error publicando última imagen: {e}")
+                return None
+    
+    def ring_frames(self) -> List[str]:
+        """Capturas en el anillo, más reciente primero"""
+        if not self.ring_dir:
+            return []
+        
+        with self._lock:
+            frames = []
+            for i in range(min(self._seq, self.ring_size)):
+                slot = (self._seq - 1 - i) % self.ring_size
+                frames.append(os.path.join(self.ring_dir, f'frame_{slot}.jpg'))
+            return frames
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _tmp_path(self) -> str:
+        return f"{self.latest_path}.{os.getpid()}.tmp"
+    
+    def _replace_with_hardlink(self, target: str):
+        tmp = self._tmp_path()
+        self._remove_quietly(tmp)
+        os.link(target, tmp)
+        os.replace(tmp, self.latest_path)
+    
+    def _replace_with_symlink(self, target: str):
+        tmp = self._tmp_path()
+        self._remove_quietly(tmp)
+        os.symlink(os.path.abspath(target), tmp)
+        os.replace(tmp, self.latest_path)
+    
+    def _replace_with_copy(self, source: str, image_bytes=None):
+        tmp = self._tmp_path()
+        if image_bytes is None:
+            with open(source, 'rb') as f:
+                image_bytes = f.read()
+        with open(tmp, 'wb') as f:
+            f.write(image_bytes)
+        os.replace(tmp, self.latest_path)
+    
+    def _write_ring_frame(self, source: str, image_bytes=None) -> str:
+        """Escribir la captura en el siguiente hueco del anillo (RAM)"""
+        if image_bytes is None:
+            with open(source, 'rb') as f:
+                image_bytes = f.read()
+        
+        slot = self._seq % self.ring_size
+        frame_path = os.path.join(self.ring_dir, f'frame_{slot}.jpg')
+        tmp = frame_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(image_bytes)
+        os.replace(tmp, frame_path)
+        
+        self._seq += 1
+        return frame_path
+    
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
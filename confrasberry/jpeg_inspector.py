@@ -0,0 +1,110 @@
+"""
+Fire Monitor - JPEG Inspector
+Lectura de cabeceras JPEG (SOI/SOFn/EOI) sin decodificar la imagen
+"""
+
+# Marcadores SOFn con dimensiones (excluye DHT=C4, JPG=C8, DAC=CC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+               0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Marcadores sin campo de longitud
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+
+# Bytes de relleno tolerados después de EOI (algunos encoders alinean)
+MAX_TRAILING_BYTES = 64
+
+class JpegInfo:
+    """Resultado de la inspección"""
+    
+    def __init__(self, valid: bool, width: int = None, height: int = None,
+                 truncated: bool = False, reason: str = None):
+        self.valid = valid
+        self.width = width
+        self.height = height
+        self.truncated = truncated
+        self.reason = reason
+    
+    def __repr__(self):
+        if self.valid:
+            return f"JpegInfo(valid, {self.width}x{self.height})"
+        return f"JpegInfo(invalid: {self.reason})"
+
+def inspect_jpeg(data) -> JpegInfo:
+    """
+    Validar estructura y leer dimensiones de un JPEG en memoria
+    
+    Recorre los segmentos desde SOI hasta SOS leyendo solo sus cabeceras,
+    toma ancho/alto del SOFn y comprueba que el flujo termine en EOI.
+    
+    Args:
+        data: bytes, bytearray o memoryview con el archivo completo
+    
+    Returns:
+        JpegInfo con valid=False y reason si la imagen está truncada
+        o corrupta
+    """
+    buf = memoryview(data)
+    size = len(buf)
+    
+    if size < 4 or buf[0] != 0xFF or buf[1] != SOI:
+        return JpegInfo(False, reason='falta marcador SOI')
+    
+    width = height = None
+    pos = 2
+    
+    while True:
+        # Saltar bytes de relleno 0xFF antes del código de marcador
+        while pos < size and buf[pos] == 0xFF:
+            pos += 1
+        if pos >= size:
+            return JpegInfo(False, width, height, truncated=True,
+                            reason='imagen truncada antes de SOS')
+        if buf[pos - 1] != 0xFF:
+            return JpegInfo(False, width, height, reason=f'byte inesperado en la posición {pos}')
+        
+        marker = buf[pos]
+        pos += 1
+        
+        if marker in STANDALONE_MARKERS:
+            continue
+        if marker == EOI:
+            return JpegInfo(False, width, height, reason='EOI antes de los datos de imagen')
+        
+        if pos + 2 > size:
+            return JpegInfo(False, width, height, truncated=True,
+                            reason='imagen truncada en cabecera de segmento')
+        length = (buf[pos] << 8) | buf[pos + 1]
+        if length < 2:
+            return JpegInfo(False, width, height, reason=f'segmento 0x{marker:02X} con longitud inválida')
+        if pos + length > size:
+            return JpegInfo(False, width, height, truncated=True,
+                            reason=f'segmento 0x{marker:02X} excede el archivo')
+        
+        if marker in SOF_MARKERS:
+            if length < 7:
+                return JpegInfo(False, reason='segmento SOF demasiado corto')
+            height = (buf[pos + 3] << 8) | buf[pos + 4]
+            width = (buf[pos + 5] << 8) | buf[pos + 6]
+        
+        pos += length
+        
+        if marker == SOS:
+            break
+    
+    if width is None or height is None:
+        return JpegInfo(False, reason='falta segmento SOF')
+    if width == 0 or height == 0:
+        return JpegInfo(False, width, height, reason='dimensiones nulas')
+    
+    # Los datos comprimidos llegan hasta EOI (FF D9) al final del archivo
+    tail_start = max(pos, size - MAX_TRAILING_BYTES - 2)
+    tail = bytes(buf[tail_start:])
+    eoi = tail.rfind(b'\xff\xd9')
+    if eoi < 0 or tail[eoi + 2:].strip(b'\x00\xff'):
+        return JpegInfo(False, width, height, truncated=True, reason='falta marcador EOI')
+    
+    return JpegInfo(True, width, height)
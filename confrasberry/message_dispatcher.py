@@ -0,0 +1,275 @@
+"""
+Fire Monitor - Message Dispatcher
+Reparte los mensajes MQTT en colas acotadas por tipo de topic con hilos
+trabajadores, para que el bucle de red de paho nunca espere a SQLite ni
+al disco
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable
+
+from image_assembler import BINARY_CHUNK_HEADER, BINARY_CHUNK_MAGIC
+
+# Políticas cuando la cola de un carril está llena
+OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+
+# device + capture al inicio del JSON de imagen (orden del firmware); se
+# leen sin decodificar el payload completo (~3.5 KB por chunk)
+_CAPTURE_KEY_RE = re.compile(rb'"device"\s*:\s*"([^"]*)"\s*,\s*"capture"\s*:\s*(\d+)')
+_DEVICE_RE = re.compile(rb'"device"\s*:\s*"([^"]*)"')
+
+def capture_key(msg) -> Hashable:
+    """
+    Clave de orden para metadata y chunks: (device, capture)
+    
+    Todos los mensajes de una captura van al mismo trabajador y se procesan
+    en el orden de llegada; capturas distintas pueden ir en paralelo. Los
+    chunks binarios llevan el dispositivo en el topic y la captura en la
+    cabecera. Sin número de captura (firmware antiguo) la clave es el
+    dispositivo, y sin dispositivo el prefijo común de los topics de imagen
+    ('fire/image' para meta y chunks): una transferencia nunca se reparte
+    entre trabajadores.
+    """
+    payload = msg.payload
+    if payload[:2] == BINARY_CHUNK_MAGIC and len(payload) >= BINARY_CHUNK_HEADER.size:
+        return (msg.topic.rsplit('/', 1)[-1], BINARY_CHUNK_HEADER.unpack_from(payload)[3])
+    
+    match = _CAPTURE_KEY_RE.search(payload, 0, 200)
+    if match is not None:
+        return (match.group(1).decode('utf-8', 'replace'), int(match.group(2)))
+    
+    match = _DEVICE_RE.search(payload, 0, 200)
+    if match is not None:
+        return match.group(1).decode('utf-8', 'replace')
+    return '/'.join(msg.topic.split('/')[:2])
+
+class Lane:
+    def __init__(self, name: str, topics: Iterable[str], workers: int = 1,
+                 max_queue: int = 100, overflow: str = 'drop_new',
+                 block_timeout: float = 0.5, key: Callable = None):
+        """
+        Carril de procesamiento (grupo de topics con sus propios trabajadores)
+        
+        Args:
+            name: Nombre del carril (etiqueta en las métricas)
+            topics: Topics MQTT que atiende ('prefijo/#' o 'prefijo/+'
+                    atienden todos los topics bajo el prefijo)
+            workers: Hilos del carril
+            max_queue: Mensajes en espera como máximo (repartidos entre los
+                       trabajadores)
+            overflow: Política con la cola llena:
+                      'drop_new'    descartar el mensaje que llega
+                      'drop_oldest' descartar el más antiguo en espera (para
+                                    mensajes de estado, el último manda)
+                      'block'       esperar hasta block_timeout y luego
+                                    descartar el que llega (frena el bucle
+                                    de red: usar solo en carriles poco
+                                    frecuentes)
+            block_timeout: Segundos de espera con overflow='block'
+            key: Función msg -> clave; mensajes con la misma clave van al
+                 mismo trabajador y conservan su orden (None = carril
+                 ordenado en un solo trabajador)
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de desbordamiento inválida: {overflow}")
+        
+        self.name = name
+        self.topics = tuple(topics)
+        self.workers = workers if key is not None else 1
+        self.capacity = max(1, max_queue // self.workers)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.key = key
+        
+        # Una cola por trabajador (deque + condición)
+        self.queues = [deque() for _ in range(self.workers)]
+        self.conditions = [threading.Condition() for _ in range(self.workers)]
+        self.threads = []
+        
+        self.lock = threading.Lock()  # stats (varios trabajadores)
+        self.stats = {
+            'received': 0,
+            'processed': 0,
+            'dropped': 0,
+            'errors': 0,
+            'max_depth': 0
+        }
+    
+    def depth(self) -> int:
+        return sum(len(q) for q in self.queues)
+
+class MessageDispatcher:
+    def __init__(self, handler: Callable, lanes: Iterable[Lane],
+                 default_lane: str = None, metrics=None):
+        """
+        Inicializar despachador
+        
+        Args:
+            handler: Función (msg) que procesa un mensaje en un trabajador
+            lanes: Carriles; cada carril tiene sus propios hilos, así un
+                   mensaje de alerta nunca espera detrás de los chunks de
+                   una imagen
+            default_lane: Carril de los topics no asignados (por defecto el
+                          último)
+            metrics: Instancia opcional de Metrics (tiempo en cola y
+                     descartes)
+        """
+        self.handler = handler
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.metrics = metrics
+        self.running = False
+        
+        self._routes = {}
+        self._prefixes = []
+        for lane in self.lanes.values():
+            for topic in lane.topics:
+                if topic.endswith(('/#', '/+')):
+                    self._prefixes.append((topic[:-1], lane))
+                else:
+                    self._routes[topic] = lane
+        self._default = self.lanes[default_lane] if default_lane else list(self.lanes.values())[-1]
+    
+    # ============================================
+    # CICLO DE VIDA
+    # ============================================
+    
+    def start(self):
+        """Iniciar los trabajadores de todos los carriles"""
+        if self.running:
+            return
+        
+        self.running = True
+        for lane in self.lanes.values():
+            for i in range(lane.workers):
+                thread = threading.Thread(target=self._run, args=(lane, i),
+                                          name=f'dispatch-{lane.name}-{i}', daemon=True)
+                thread.start()
+                lane.threads.append(thread)
+    
+    def stop(self, timeout: float = 10.0):
+        """Procesar lo pendiente y detener los trabajadores"""
+        if not self.running:
+            return
+        
+        self.running = False
+        for lane in self.lanes.values():
+            for condition in lane.conditions:
+                with condition:
+                    condition.notify_all()
+        
+        deadline = time.monotonic() + timeout
+        for lane in self.lanes.values():
+            for thread in lane.threads:
+                thread.join(max(0.0, deadline - time.monotonic()))
+            lane.threads = []
+    
+    # ============================================
+    # ENCOLADO (hilo de red de MQTT)
+    # ============================================
+    
+    def submit(self, msg) -> bool:
+        """
+        Encolar un mensaje en su carril
+        
+        Returns:
+            True si se encoló; False si se descartó por desbordamiento
+        """
+        lane = self._routes.get(msg.topic) or self._route(msg.topic)
+        index = hash(lane.key(msg)) % lane.workers if lane.workers > 1 else 0
+        pending = lane.queues[index]
+        condition = lane.conditions[index]
+        item = (time.monotonic(), msg)
+        
+        with condition:
+            with lane.lock:
+                lane.stats['received'] += 1
+            
+            if len(pending) >= lane.capacity:
+                if lane.overflow == 'drop_oldest':
+                    pending.popleft()
+                    self._dropped(lane, msg)
+                elif lane.overflow == 'block':
+                    condition.wait_for(lambda: len(pending) < lane.capacity,
+                                       lane.block_timeout)
+                
+                if len(pending) >= lane.capacity:
+                    self._dropped(lane, msg)
+                    return False
+            
+            pending.append(item)
+            depth = lane.depth()
+            with lane.lock:
+                if depth > lane.stats['max_depth']:
+                    lane.stats['max_depth'] = depth
+            condition.notify()
+        
+        return True
+    
+    # ============================================
+    # MÉTRICAS
+    # ============================================
+    
+    def get_metrics(self) -> Dict:
+        """Profundidad actual y contadores por carril ({carril}_{métrica})"""
+        values = {}
+        for lane in self.lanes.values():
+            values[f'{lane.name}_depth'] = lane.depth()
+            with lane.lock:
+                stats = dict(lane.stats)
+            for name, value in stats.items():
+                values[f'{lane.name}_{name}'] = value
+        return values
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _route(self, topic: str) -> Lane:
+        """Carril de un topic sin entrada exacta (se memoriza)"""
+        lane = self._default
+        for prefix, candidate in self._prefixes:
+            if topic.startswith(prefix):
+                lane = candidate
+                break
+        self._routes[topic] = lane
+        return lane
+    
+    def _dropped(self, lane: Lane, msg):
+        """Contabilizar un descarte"""
+        with lane.lock:
+            lane.stats['dropped'] += 1
+            dropped = lane.stats['dropped']
+        if self.metrics is not None:
+            self.metrics.inc('dispatch_dropped_total', lane=lane.name, policy=lane.overflow)
+        if dropped == 1 or dropped % 100 == 0:
+            print(f"⚠️ Cola '{lane.name}' llena, mensajes descartados: {dropped}")
+    
+    def _run(self, lane: Lane, index: int):
+        """Bucle de un trabajador"""
+        pending = lane.queues[index]
+        condition = lane.conditions[index]
+        
+        while True:
+            with condition:
+                condition.wait_for(lambda: pending or not self.running)
+                if not pending:
+                    return
+                enqueued_at, msg = pending.popleft()
+                condition.notify_all()  # productores en 'block'
+            
+            if self.metrics is not None:
+                self.metrics.observe('dispatch_wait_seconds', time.monotonic() - enqueued_at,
+                                     lane=lane.name)
+            
+            try:
+                self.handler(msg)
+                outcome = 'processed'
+            except Exception as e:
+                outcome = 'errors'
+                print(f"❌ Error en el carril '{lane.name}': {e}")
+            
+            with lane.lock:
+                lane.stats[outcome] += 1
@@ -0,0 +1,287 @@
+"""
+Fire Monitor - Metrics
+Contadores e histogramas de latencia del camino caliente, expuestos en
+formato de texto de Prometheus por un endpoint HTTP local
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+# Límites superiores de los buckets (segundos)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _NullTimer:
+    """Temporizador que no mide nada (métricas deshabilitadas)"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+    
+    def __init__(self, metrics, name: str, labels: Tuple):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.start)
+        return False
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+    
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+class Metrics:
+    def __init__(self, enabled: bool = True, buckets: Tuple = DEFAULT_BUCKETS,
+                 prefix: str = 'fire_'):
+        """
+        Inicializar registro de métricas
+        
+        Con enabled=False todas las llamadas retornan de inmediato y timer()
+        devuelve un contexto vacío compartido (sin medir el tiempo).
+        
+        Args:
+            enabled: Activar la recolección
+            buckets: Límites de los histogramas en segundos
+            prefix: Prefijo de los nombres exportados
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        
+        self._lock = threading.Lock()
+        self._counters = {}    # (nombre, labels) -> valor
+        self._histograms = {}  # (nombre, labels) -> _Histogram
+        self._collectors = []  # funciones -> {nombre: valor} (gauges)
+    
+    # ============================================
+    # REGISTRO
+    # ============================================
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """Incrementar un contador"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name: str, seconds: float, **labels):
+        """Registrar una duración en un histograma"""
+        if not self.enabled:
+            return
+        self._observe(name, tuple(sorted(labels.items())), seconds)
+    
+    def timer(self, name: str, **labels):
+        """
+        Medir la duración de un bloque
+        
+        Uso:
+            with metrics.timer('stage_seconds', stage='json'):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, tuple(sorted(labels.items())))
+    
+    def register_collector(self, collector: Callable[[], Dict]):
+        """
+        Añadir valores instantáneos (gauges) calculados al exportar
+        
+        Args:
+            collector: Función sin argumentos que devuelve {nombre: valor}
+        """
+        self._collectors.append(collector)
+    
+    def _observe(self, name: str, labels: Tuple, seconds: float):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist.counts[i] += 1
+                    break
+            hist.sum += seconds
+            hist.count += 1
+            if seconds > hist.max:
+                hist.max = seconds
+    
+    # ============================================
+    # EXPORTACIÓN
+    # ============================================
+    
+    def render_prometheus(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(h.counts), h.sum, h.count))
+                                for k, h in self._histograms.items())
+        
+        typed = set()
+        for (name, labels), value in counters:
+            full = self.prefix + name
+            if full not in typed:
+                lines.append(f'# TYPE {full} counter')
+                typed.add(full)
+            lines.append(f'{full}{self._format_labels(labels)} {value}')
+        
+        for (name, labels), (counts, total, count) in histograms:
+            full = self.prefix + name
+            if full not in typed:
+                lines.append(f'# TYPE {full} histogram')
+                typed.add(full)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{full}_bucket{self._format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{full}_bucket{self._format_labels(labels, le="+Inf")} {count}')
+            lines.append(f'{full}_sum{self._format_labels(labels)} {total:.6f}')
+            lines.append(f'{full}_count{self._format_labels(labels)} {count}')
+        
+        for name, value in sorted(self._collect().items()):
+            full = self.prefix + name
+            lines.append(f'# TYPE {full} gauge')
+            lines.append(f'{full} {value}')
+        
+        return '\n'.join(lines) + '\n'
+    
+    def summary(self) -> Dict:
+        """
+        Resumen compacto (para system_logs)
+        
+        Los percentiles se estiman con el límite superior del bucket.
+        """
+        with self._lock:
+            counters = {self._key_name(k): v for k, v in self._counters.items()}
+            histograms = {}
+            for key, hist in self._histograms.items():
+                if not hist.count:
+                    continue
+                histograms[self._key_name(key)] = {
+                    'count': hist.count,
+                    'avg_ms': round(hist.sum / hist.count * 1000, 2),
+                    'p50_ms': self._percentile_ms(hist, 0.50),
+                    'p99_ms': self._percentile_ms(hist, 0.99),
+                    'max_ms': round(hist.max * 1000, 2)
+                }
+        
+        return {'counters': counters, 'latency': histograms, 'gauges': self._collect()}
+    
+    def reset(self):
+        """Vaciar contadores e histogramas"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _collect(self) -> Dict:
+        values = {}
+        for collector in self._collectors:
+            try:
+                values.update({k: v for k, v in collector().items()
+                               if isinstance(v, (int, float)) and not isinstance(v, bool)})
+            except Exception as e:
+                print(f"⚠️ Error leyendo métricas: {e}")
+        return values
+    
+    def _percentile_ms(self, hist: _Histogram, q: float) -> float:
+        target = q * hist.count
+        cumulative = 0
+        for bound, bucket in zip(self.buckets, hist.counts):
+            cumulative += bucket
+            if cumulative >= target:
+                return round(min(bound, hist.max) * 1000, 2)
+        return round(hist.max * 1000, 2)
+    
+    @staticmethod
+    def _key_name(key: Tuple) -> str:
+        name, labels = key
+        if not labels:
+            return name
+        return name + '{' + ','.join(f'{k}={v}' for k, v in labels) + '}'
+    
+    @staticmethod
+    def _format_labels(labels: Tuple, **extra) -> str:
+        items = list(labels) + list(extra.items())
+        if not items:
+            return ''
+        parts = []
+        for key, value in items:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{key}="{value}"')
+        return '{' + ','.join(parts) + '}'
+
+class MetricsServer:
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9108):
+        """
+        Endpoint HTTP de métricas (GET /metrics)
+        
+        Escucha por defecto solo en localhost; un Prometheus o node_exporter
+        local puede consultarlo.
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+    
+    def start(self):
+        """Servir en un hilo en segundo plano"""
+        if self._server is not None:
+            return
+        
+        metrics = self.metrics
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='metrics-http', daemon=True)
+        self._thread.start()
+        print(f"✓ Métricas en http://{self.host}:{self.port}/metrics")
+    
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,260 @@
+"""
+Fire Monitor - Notification Outbox
+Entrega persistente de notificaciones: se guardan en SQLite
+(notification_outbox) y un hilo las envía con reintentos, también después
+de un reinicio o de un corte de internet
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict
+
+from database import DB_TIMESTAMP_FORMAT
+from telegram_notifier import DEFERRED
+
+# Espera entre intentos: 5s, 10s, 20s... hasta 2 minutos
+RETRY_BASE = 5.0
+RETRY_MAX = 120.0
+
+# Notificaciones más antiguas se abandonan (ya no tiene sentido avisar)
+MAX_AGE_HOURS = 24
+
+# Margen sobre el cooldown/ventana de álbum para que un resumen o álbum
+# confirme su envío; si no llega (reinicio), la notificación vuelve a vencer
+DEFER_MARGIN = 120.0
+
+class NotificationOutbox:
+    def __init__(self, db, notifier, poll_interval: float = 5.0, batch_size: int = 20,
+                 metrics=None):
+        """
+        Inicializar outbox
+        
+        Tipos de notificación:
+            'fire_alert':  {'detections', 'severity', 'timestamp', 'device'}
+            'alert_photo': {'image_path', 'caption'}
+        
+        Una notificación solo se marca entregada tras un envío real: si el
+        notificador la agrupa en un resumen o álbum sigue PENDING (aplazada)
+        hasta que on_deferred_result confirma ese envío.
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            notifier: TelegramNotifier que realiza los envíos
+            poll_interval: Segundos entre revisiones si nadie llama a wake()
+            batch_size: Notificaciones vencidas leídas por revisión
+            metrics: Instancia opcional de Metrics (tiempo hasta la entrega)
+        """
+        self.db = db
+        self.notifier = notifier
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.metrics = metrics
+        
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        
+        self.counters = {
+            'delivered': 0,
+            'deferred': 0,
+            'retried': 0,
+            'failed': 0
+        }
+        
+        # Última lectura de get_outbox_stats(), la actualiza el hilo de
+        # entrega: get_metrics() no consulta SQLite desde otros hilos
+        self._snapshot = {'pending': 0, 'oldest_created_at': None, 'max_attempts': 0}
+        
+        notifier.on_deferred_result = self._deferred_result
+    
+    # ============================================
+    # API
+    # ============================================
+    
+    def enqueue(self, kind: str, payload: Dict, alert_id: int = None) -> int:
+        """Guardar una notificación y despertar al hilo de entrega"""
+        notification_id = self.db.enqueue_notification(kind, payload, alert_id)
+        self.wake()
+        return notification_id
+    
+    def wake(self):
+        """Revisar el outbox ahora (p.ej. tras registrar una alerta con aviso)"""
+        self._wake.set()
+    
+    def start(self):
+        """Entregar en segundo plano (incluye lo pendiente de ejecuciones anteriores)"""
+        if self._thread is not None:
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 10.0):
+        """Detener el hilo (lo no entregado queda en la base de datos)"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def get_metrics(self) -> Dict:
+        """
+        Pendientes, antigüedad del más antiguo y contadores de entrega
+        
+        Usa la última lectura del hilo de entrega (cada poll_interval como
+        mucho), así el exportador de métricas no abre conexiones a SQLite.
+        """
+        metrics = dict(self.counters)
+        snapshot = self._snapshot
+        oldest = snapshot['oldest_created_at']
+        metrics['pending'] = snapshot['pending'] or 0
+        metrics['oldest_age_seconds'] = round(self._age_seconds(oldest), 1) if oldest else 0
+        metrics['max_attempts'] = snapshot['max_attempts'] or 0
+        return metrics
+    
+    def refresh_stats(self):
+        """Releer pendientes y antigüedad del outbox (hilo de entrega)"""
+        stats = self.db.get_outbox_stats()
+        self._snapshot = {
+            'pending': stats['pending'],
+            'oldest_created_at': stats['oldest_created_at'],
+            'max_attempts': stats['max_attempts']
+        }
+    
+    def deliver_due(self) -> int:
+        """
+        Intentar las notificaciones vencidas
+        
+        Returns:
+            Notificaciones entregadas
+        """
+        delivered = 0
+        
+        while not self._stop.is_set():
+            batch = self.db.get_due_notifications(self.batch_size)
+            if not batch:
+                break
+            
+            for notification in batch:
+                if self._deliver(notification):
+                    delivered += 1
+            
+            if len(batch) < self.batch_size:
+                break
+        
+        return delivered
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.deliver_due()
+                self.refresh_stats()
+            except Exception as e:
+                print(f"❌ Error en el outbox de notificaciones: {e}")
+    
+    def _deliver(self, notification: Dict) -> bool:
+        """Enviar una notificación y registrar el resultado"""
+        notification_id = notification['id']
+        age = self._age_seconds(notification['created_at'])
+        
+        if not self.notifier.enabled:
+            self._fail(notification_id, 'Telegram deshabilitado')
+            return False
+        if age > MAX_AGE_HOURS * 3600:
+            self._fail(notification_id, f'Caducada tras {notification["attempts"]} intentos')
+            return False
+        
+        try:
+            ok = self._send(notification['kind'], notification['payload'],
+                            notification['alert_id'], notification_id)
+            error = None if ok else 'Envío rechazado o sin conexión'
+        except FileNotFoundError as e:
+            self._fail(notification_id, str(e))
+            return False
+        except Exception as e:
+            ok = False
+            error = str(e)
+        
+        if ok == DEFERRED:
+            # En un resumen o álbum: se confirma en _deferred_result
+            self.db.defer_notification(notification_id, self._defer_seconds(),
+                                       notification['attempts'])
+            self.counters['deferred'] += 1
+            return False
+        
+        if ok:
+            self._delivered(notification_id, notification['kind'], age)
+            if notification['attempts']:
+                print(f"📬 Notificación {notification_id} entregada tras "
+                      f"{notification['attempts'] + 1} intentos ({int(age)}s)")
+            return True
+        
+        delay = min(RETRY_MAX, RETRY_BASE * (2 ** notification['attempts']))
+        self.db.reschedule_notification(notification_id, delay, error)
+        self.counters['retried'] += 1
+        print(f"⏳ Notificación {notification_id} pendiente, reintento en {int(delay)}s")
+        return False
+    
+    def _send(self, kind: str, payload: Dict, alert_id: int = None, ticket: int = None):
+        """Entregar según el tipo (True, False o DEFERRED)"""
+        if kind == 'fire_alert':
+            timestamp = payload.get('timestamp')
+            return self.notifier.send_fire_alert(
+                detections=payload.get('detections', 0),
+                timestamp=datetime.fromisoformat(timestamp) if timestamp else None,
+                severity=payload.get('severity', 'MEDIUM'),
+                device=payload.get('device'),
+                ticket=ticket
+            )
+        
+        if kind == 'alert_photo':
+            image_path = payload['image_path']
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f'Imagen eliminada: {image_path}')
+            return self.notifier.send_alert_photo(image_path, caption=payload.get('caption'),
+                                                  alert_id=alert_id, ticket=ticket)
+        
+        raise ValueError(f'Tipo de notificación desconocido: {kind}')
+    
+    def _delivered(self, notification_id: int, kind: str = None, age: float = None):
+        self.db.mark_notification_delivered(notification_id)
+        self.counters['delivered'] += 1
+        if self.metrics is not None and age is not None:
+            self.metrics.observe('outbox_delivery_seconds', age, kind=kind)
+    
+    def _deferred_result(self, notification_ids, ok: bool):
+        """
+        Resultado de un resumen o álbum con notificaciones del outbox (lo
+        llama el notificador desde su hilo de envío)
+        """
+        for notification_id in notification_ids:
+            if ok:
+                self._delivered(notification_id)
+            else:
+                self.db.reschedule_notification(notification_id, RETRY_BASE,
+                                                'Resumen o álbum no entregado')
+                self.counters['retried'] += 1
+        if not ok:
+            self.wake()
+    
+    def _defer_seconds(self) -> float:
+        """Plazo para que el resumen o álbum confirme el envío"""
+        return max(self.notifier.alert_cooldown, self.notifier.album_window) + DEFER_MARGIN
+    
+    def _fail(self, notification_id: int, reason: str):
+        self.db.fail_notification(notification_id, reason)
+        self.counters['failed'] += 1
+        print(f"❌ Notificación {notification_id} abandonada: {reason}")
+    
+    @staticmethod
+    def _age_seconds(created_at: str) -> float:
+        created = datetime.strptime(created_at, DB_TIMESTAMP_FORMAT)
+        return (datetime.now(timezone.utc).replace(tzinfo=None) - created).total_seconds()
@@ -0,0 +1,325 @@
+"""
+Fire Monitor - Retention Engine
+Elimina imágenes (archivo + registro + manifiesto) y logs antiguos, y
+mantiene el espacio ocupado por las imágenes dentro de un presupuesto
+"""
+
+import os
+import shutil
+import stat
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from database import DB_TIMESTAMP_FORMAT, days_ago_timestamp
+
+MB = 1024 * 1024
+
+class RetentionEngine:
+    def __init__(self, db, catalog, batch_size: int = 50, vacuum_pages: int = 1000,
+                 config=None):
+        """
+        Inicializar motor de retención
+        
+        La configuración se lee de system_config en cada ejecución (desde
+        memoria si se pasa config): image_retention_days, log_retention_days,
+        image_disk_budget_mb y min_free_disk_mb.
+        
+        Args:
+            db: Instancia de FireMonitorDB
+            catalog: ImageCatalog (directorio de imágenes y manifiesto)
+            batch_size: Imágenes eliminadas por transacción
+            vacuum_pages: Páginas devueltas al disco por ejecución
+                          (PRAGMA incremental_vacuum; sin efecto hasta que
+                          la base esté en auto_vacuum=INCREMENTAL, ver
+                          FireMonitorDB.enable_incremental_vacuum)
+            config: ConfigService opcional
+        """
+        self.db = db
+        self.config = config
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        
+        self._stored_bytes = None  # Estimación; se recalcula en cada run()
+        self._lock = threading.Lock()
+        # after_save() corre en varios trabajadores de imágenes a la vez (sin
+        # _lock): _stored_bytes solo se modifica con _bytes_lock
+        self._bytes_lock = threading.Lock()
+    
+    # ============================================
+    # API
+    # ============================================
+    
+    def run(self) -> Optional[Dict]:
+        """
+        Aplicar toda la política de retención
+        
+        1. Imágenes más antiguas que image_retention_days
+        2. Presupuesto de disco: primero capturas sin alerta, luego las
+           asociadas a alertas, siempre de la más antigua a la más nueva
+        3. Logs más antiguos que log_retention_days
+        4. Compactar el manifiesto si hubo bajas
+        5. Vacuum incremental de las páginas liberadas
+        
+        Returns:
+            Resumen de lo eliminado, o None si ya había una ejecución en curso
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        
+        try:
+            settings = self._settings()
+            result = {
+                'images_expired': 0,
+                'images_evicted': 0,
+                'bytes_freed': 0,
+                'logs_deleted': 0,
+                'pages_vacuumed': 0
+            }
+            
+            stored = self.db.get_image_storage_bytes()
+            with self._bytes_lock:
+                self._stored_bytes = stored
+            
+            # 1. Antigüedad
+            cutoff = days_ago_timestamp(settings['image_retention_days'])
+            while True:
+                batch = self.db.get_images_for_eviction(before=cutoff, limit=self.batch_size)
+                deleted, freed = self._delete_batch(batch)
+                result['images_expired'] += deleted
+                result['bytes_freed'] += freed
+                if len(batch) < self.batch_size or deleted == 0:
+                    break
+            
+            # 2. Presupuesto de disco
+            evicted, freed = self._enforce_budget_locked(settings)
+            result['images_evicted'] += evicted
+            result['bytes_freed'] += freed
+            
+            # 3. Logs
+            result['logs_deleted'] = self.db.delete_old_logs(settings['log_retention_days'])
+            
+            # 4. Manifiesto sin las imágenes eliminadas
+            compacted = self.catalog.compact_manifest()
+            if compacted is not None:
+                result['manifest_entries'] = compacted
+            
+            # 5. Devolver páginas libres al sistema de archivos
+            result['pages_vacuumed'] = self.db.incremental_vacuum(self.vacuum_pages)
+            
+            if result['images_expired'] or result['images_evicted'] or result['logs_deleted']:
+                self.db.log('INFO', 'DATABASE', 'Retención aplicada', details=result)
+            return result
+        finally:
+            self._lock.release()
+    
+    def after_save(self, image_size: int):
+        """
+        Contabilizar una imagen recién guardada
+        
+        Si se supera el presupuesto (o falta espacio libre) se desalojan
+        capturas en el momento, sin esperar a la siguiente ejecución de run().
+        """
+        with self._bytes_lock:
+            if self._stored_bytes is not None:
+                self._stored_bytes += image_size
+        
+        settings = self._settings()
+        if not self._over_budget(settings, linked=False):
+            return
+        
+        if self._lock.acquire(blocking=False):
+            try:
+                if self._stored_bytes is None:
+                    stored = self.db.get_image_storage_bytes()
+                    with self._bytes_lock:
+                        self._stored_bytes = stored
+                self._enforce_budget_locked(settings)
+            finally:
+                self._lock.release()
+    
+    def sweep_legacy_images(self) -> int:
+        """
+        Registrar los JPEG sueltos en images_dir que no tienen fila (una vez)
+        
+        Versiones anteriores guardaban cada captura directamente en
+        images_dir pero solo registraban las tomadas con una alerta activa:
+        el resto no contaba en el presupuesto ni se eliminaba nunca. Se
+        registran como capturas sin alerta con la fecha del archivo, así la
+        retención las elimina como a las demás (primero las más antiguas).
+        
+        Returns:
+            Imágenes registradas
+        """
+        if self.db.get_config('legacy_images_swept'):
+            return 0
+        
+        root = self.catalog.images_dir
+        try:
+            names = sorted(name for name in os.listdir(root)
+                           if name.lower().endswith(('.jpg', '.jpeg')))
+        except FileNotFoundError:
+            names = []
+        
+        registered = 0
+        for start in range(0, len(names), self.batch_size):
+            paths = [os.path.join(root, name) for name in names[start:start + self.batch_size]]
+            known = self.db.get_registered_image_paths(paths)
+            
+            orphans = []
+            for path in paths:
+                if path in known:
+                    continue
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(info.st_mode):
+                    continue
+                captured = datetime.fromtimestamp(info.st_mtime, timezone.utc)
+                orphans.append({
+                    'file_path': path,
+                    'image_size': info.st_size,
+                    'capture_time': captured.strftime(DB_TIMESTAMP_FORMAT)
+                })
+            registered += self.catalog.register_existing(orphans)
+        
+        self.db.set_config('legacy_images_swept', True, 'boolean',
+                           'Imágenes sueltas de versiones anteriores ya registradas')
+        
+        if registered:
+            stored = self.db.get_image_storage_bytes()
+            with self._bytes_lock:
+                self._stored_bytes = stored
+            print(f"🧹 {registered} imágenes antiguas sin registro añadidas a la retención")
+            self.db.log('INFO', 'DATABASE', 'Imágenes antiguas registradas para retención',
+                        details={'images': registered})
+        return registered
+    
+    def get_status(self) -> Dict:
+        """Uso de disco frente a los límites configurados"""
+        settings = self._settings()
+        stored = self.db.get_image_storage_bytes()
+        return {
+            'images_bytes': stored,
+            'budget_bytes': settings['image_disk_budget_mb'] * MB,
+            'free_bytes': self._free_bytes(),
+            'min_free_bytes': settings['min_free_disk_mb'] * MB
+        }
+    
+    # ============================================
+    # INTERNOS
+    # ============================================
+    
+    def _settings(self) -> Dict:
+        def value(key, default):
+            if self.config is not None:
+                return self.config.get(key, default)
+            configured = self.db.get_config(key)
+            return default if configured is None else configured
+        
+        return {
+            'image_retention_days': value('image_retention_days', 30),
+            'log_retention_days': value('log_retention_days', 7),
+            'image_disk_budget_mb': value('image_disk_budget_mb', 0),
+            'min_free_disk_mb': value('min_free_disk_mb', 0)
+        }
+    
+    def _free_bytes(self) -> Optional[int]:
+        try:
+            return shutil.disk_usage(self.catalog.images_dir).free
+        except OSError:
+            return None
+    
+    def _over_budget(self, settings: Dict, linked: bool) -> bool:
+        """
+        ¿Hay que seguir desalojando?
+        
+        El espacio libre mínimo solo justifica borrar capturas sin alerta: si
+        otro proceso llena la tarjeta no se pierden las evidencias de alertas.
+        """
+        budget = settings['image_disk_budget_mb'] * MB
+        if budget and self._stored_bytes is not None and self._stored_bytes > budget:
+            return True
+        
+        min_free = settings['min_free_disk_mb'] * MB
+        if min_free and not linked:
+            free = self._free_bytes()
+            return free is not None and free < min_free
+        
+        return False
+    
+    def _enforce_budget_locked(self, settings: Dict):
+        """Desalojar por antigüedad hasta cumplir el presupuesto (con _lock tomado)"""
+        evicted = freed = 0
+        
+        for linked in (False, True):
+            while self._over_budget(settings, linked):
+                batch = self.db.get_images_for_eviction(linked=linked, limit=self.batch_size)
+                deleted, batch_freed = self._delete_batch(batch)
+                evicted += deleted
+                freed += batch_freed
+                if deleted == 0:
+                    break
+        
+        if evicted:
+            print(f"🧹 Presupuesto de disco: {evicted} imágenes eliminadas ({freed // 1024} KB)")
+        return evicted, freed
+    
+    def _delete_batch(self, batch: List[Dict]):
+        """
+        Eliminar un lote: archivos, después filas y bajas en el manifiesto
+        
+        Primero se borran los archivos: si el proceso se interrumpe quedan
+        filas sin archivo (se limpian en la siguiente pasada) pero nunca
+        archivos huérfanos ocupando la tarjeta.
+        
+        Returns:
+            (imágenes eliminadas, bytes liberados)
+        """
+        removed = []
+        freed = 0
+        directories = set()
+        
+        for image in batch:
+            path = image['file_path']
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Conservar la fila para reintentar; el resto del lote sigue
+                print(f"⚠️ No se pudo eliminar {path}: {e}")
+                continue
+            
+            removed.append(image)
+            freed += image['image_size_bytes'] or 0
+            directories.add(os.path.dirname(path))
+        
+        if not removed:
+            return 0, 0
+        
+        self.db.delete_image_records([image['id'] for image in removed])
+        self.catalog.remove_many([(image['id'], image['file_path']) for image in removed])
+        
+        with self._bytes_lock:
+            if self._stored_bytes is not None:
+                self._stored_bytes = max(0, self._stored_bytes - freed)
+        
+        for directory in directories:
+            self._prune_empty_dirs(directory)
+        
+        return len(removed), freed
+    
+    def _prune_empty_dirs(self, directory: str):
+        """Eliminar directorios de día/mes/año vacíos (sin salir de images_dir)"""
+        root = os.path.abspath(self.catalog.images_dir)
+        directory = os.path.abspath(directory)
+        
+        while directory != root and directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
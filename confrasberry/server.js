@@ -27,6 +27,10 @@ const IMAGES_DIR = process.platform === 'win32'
 
 const LATEST_IMAGE = path.join(PUBLIC_DIR, 'latest.jpg');
 
+// Manifiesto NDJSON de solo-anexado que escribe image_catalog.py
+const IMAGES_MANIFEST = path.join(IMAGES_DIR, 'manifest.ndjson');
+const MANIFEST_TAIL_BYTES = 256 * 1024;
+
 // Topics MQTT
 const TOPIC_ALERT = 'fire/alert';
 const TOPIC_STATUS = 'fire/status';
@@ -202,6 +206,66 @@ mqttClient.on('reconnect', () => {
   console.log('🔄 Reconectando a broker MQTT...');
 });
 
+// ============================================
+// CATÁLOGO DE IMÁGENES
+// ============================================
+
+// Últimas `limit` imágenes vigentes del manifiesto, más recientes primero.
+// Solo se lee el final del archivo: no se lista ni se hace stat del directorio.
+function readManifestTail(limit) {
+  const fd = fs.openSync(IMAGES_MANIFEST, 'r');
+  try {
+    const { size } = fs.fstatSync(fd);
+    const start = Math.max(0, size - MANIFEST_TAIL_BYTES);
+    const buffer = Buffer.alloc(size - start);
+    fs.readSync(fd, buffer, 0, buffer.length, start);
+
+    let lines = buffer.toString('utf8').split('\n');
+    if (start > 0) lines = lines.slice(1); // Primera línea posiblemente cortada
+
+    const deleted = new Set();
+    const images = [];
+    for (let i = lines.length - 1; i >= 0 && images.length < limit; i--) {
+      if (!lines[i]) continue;
+      let entry;
+      try {
+        entry = JSON.parse(lines[i]);
+      } catch (err) {
+        continue;
+      }
+      if (entry.op === 'del') {
+        deleted.add(entry.id);
+      } else if (!deleted.has(entry.id)) {
+        images.push(entry);
+      }
+    }
+    return images;
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+// captured_at del manifiesto (UTC 'YYYY-MM-DD HH:MM:SS', como SQLite) a la
+// hora de Bogotá con el formato 'YYYYMMDD_HHMMSS' que espera la galería
+function toLocalStamp(capturedAt) {
+  const date = new Date(`${String(capturedAt).replace(' ', 'T')}Z`);
+  if (isNaN(date.getTime())) return capturedAt;
+
+  const parts = {};
+  new Intl.DateTimeFormat('en-GB', {
+    timeZone: 'America/Bogota',
+    year: 'numeric',
+    month: '2-digit',
+    day: '2-digit',
+    hour: '2-digit',
+    minute: '2-digit',
+    second: '2-digit',
+    hourCycle: 'h23'
+  }).formatToParts(date).forEach(({ type, value }) => { parts[type] = value; });
+
+  return `${parts.year}${parts.month}${parts.day}_${parts.hour}${parts.minute}${parts.second}`;
+}
+
 // ============================================
 // ENDPOINTS API
 // ============================================
@@ -221,51 +285,39 @@ app.get('/api/status', (req, res) => {
   });
 });
 
-// Lista de imágenes guardadas
+// Lista de imágenes guardadas (desde el manifiesto del catálogo)
 app.get('/api/images', (req, res) => {
-  // Verificar que el directorio existe
-  if (!fs.existsSync(IMAGES_DIR)) {
+  if (!fs.existsSync(IMAGES_MANIFEST)) {
     return res.json({
       success: true,
       data: [],
-      message: 'Directorio de imágenes vacío'
+      message: 'Catálogo de imágenes vacío'
     });
   }
 
-  fs.readdir(IMAGES_DIR, (err, files) => {
-    if (err) {
-      console.error('Error leyendo directorio:', err);
-      return res.status(500).json({
-        success: false,
-        error: 'Error leyendo directorio de imágenes'
-      });
-    }
-    
-    const images = files
-      .filter(file => file.toLowerCase().endsWith('.jpg'))
-      .sort((a, b) => {
-        // Ordenar por fecha de modificación (más reciente primero)
-        const statA = fs.statSync(path.join(IMAGES_DIR, a));
-        const statB = fs.statSync(path.join(IMAGES_DIR, b));
-        return statB.mtime - statA.mtime;
-      })
-      .slice(0, 50) // Últimas 50 imágenes
-      .map(file => {
-        const stat = fs.statSync(path.join(IMAGES_DIR, file));
-        return {
-          filename: file,
-          path: `/images/${file}`,
-          timestamp: file.replace('fire_capture_', '').replace('.jpg', ''),
-          size: stat.size,
-          modified: stat.mtime.toISOString()
-        };
-      });
-    
+  try {
+    const images = readManifestTail(50).map(entry => ({
+      id: entry.id,
+      filename: entry.file_name,
+      path: `/images/${entry.path}`,
+      timestamp: toLocalStamp(entry.captured_at),
+      size: entry.size,
+      width: entry.width,
+      height: entry.height,
+      alertId: entry.alert_id
+    }));
+
     res.json({
       success: true,
       data: images
     });
-  });
+  } catch (err) {
+    console.error('Error leyendo manifiesto de imágenes:', err);
+    res.status(500).json({
+      success: false,
+      error: 'Error leyendo catálogo de imágenes'
+    });
+  }
 });
 
 // Solicitar captura manual
@@ -0,0 +1,129 @@
+"""
+Fire Monitor - Telegram Dispatcher
+Cola de envíos con hilos trabajadores para no bloquear el hilo de MQTT
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+class TelegramDispatcher:
+    def __init__(self, workers: int = 2, max_queue: int = 100,
+                 latency_window: int = 200):
+        """
+        Inicializar despachador
+
+        Args:
+            workers: Número de hilos que entregan notificaciones
+            max_queue: Envíos pendientes como máximo; los que excedan se
+                       rechazan (el futuro se resuelve con False)
+            latency_window: Envíos recientes usados para las métricas
+        """
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.workers = []
+        self.num_workers = workers
+        
+        # Métricas
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._in_flight = 0
+        self.counters = {
+            'submitted': 0,
+            'delivered': 0,
+            'failed': 0,
+            'rejected': 0
+        }
+    
+    def start(self):
+        """Iniciar hilos trabajadores"""
+        if self.workers:
+            return
+        
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run, name=f'telegram-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+    
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Encolar un envío
+
+        Returns:
+            Future que se resuelve con el valor devuelto por func
+        """
+        future = Future()
+        
+        try:
+            self.queue.put_nowait((future, time.monotonic(), func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.counters['rejected'] += 1
+            print("⚠️ Cola de Telegram llena, notificación descartada")
+            future.set_result(False)
+            return future
+        
+        with self._lock:
+            self.counters['submitted'] += 1
+        return future
+    
+    def stop(self, timeout: float = 10.0):
+        """Entregar lo pendiente y detener los trabajadores"""
+        for _ in self.workers:
+            self.queue.put(None)
+        
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self.workers = []
+    
+    def get_metrics(self) -> Dict:
+        """Profundidad de cola y latencia de entrega (ms, desde el encolado)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = dict(self.counters)
+            metrics['in_flight'] = self._in_flight
+        
+        metrics['queue_depth'] = self.queue.qsize()
+        
+        if latencies:
+            metrics['latency_avg_ms'] = round(sum(latencies) / len(latencies), 1)
+            metrics['latency_p95_ms'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+            metrics['latency_max_ms'] = round(latencies[-1], 1)
+        else:
+            metrics['latency_avg_ms'] = None
+            metrics['latency_p95_ms'] = None
+            metrics['latency_max_ms'] = None
+        
+        return metrics
+    
+    def _run(self):
+        """Bucle de un trabajador"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            
+            future, enqueued_at, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            
+            with self._lock:
+                self._in_flight += 1
+            
+            try:
+                result = func(*args, **kwargs)
+                future.set_result(result)
+                ok = result is not False
+            except Exception as e:
+                print(f"❌ Error en envío de Telegram: {e}")
+                future.set_exception(e)
+                ok = False
+            
+            elapsed_ms = (time.monotonic() - enqueued_at) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                self._latencies.append(elapsed_ms)
+                self.counters['delivered' if ok else 'failed'] += 1
@@ -0,0 +1,93 @@
+"""
+Fire Monitor - Telegram File Cache
+file_id de las fotos ya subidas a Telegram, por hash del contenido: la
+misma imagen se reenvía (a cualquier chat) sin volver a subir el JPEG
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Entradas como máximo (se descartan las menos usadas)
+FILE_CACHE_SIZE = 500
+
+class FileIdCache:
+    def __init__(self, db=None, capacity: int = FILE_CACHE_SIZE):
+        """
+        Inicializar caché LRU de file_id
+        
+        Args:
+            db: FireMonitorDB opcional donde persistir la caché
+                (telegram_file_cache); sin db solo vive en memoria
+            capacity: Entradas como máximo
+        """
+        self.db = db
+        self.capacity = capacity
+        
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # content_hash -> file_id (más reciente al final)
+        
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stored': 0,
+            'evicted': 0,
+            'invalidated': 0
+        }
+        
+        if db is not None:
+            for row in db.load_telegram_files(capacity):
+                self._entries[row['content_hash']] = row['file_id']
+    
+    @staticmethod
+    def key(data: bytes) -> str:
+        """Hash del contenido de la imagen"""
+        return hashlib.sha256(data).hexdigest()
+    
+    def __contains__(self, content_hash: str) -> bool:
+        with self._lock:
+            return content_hash in self._entries
+    
+    def get(self, content_hash: str) -> Optional[str]:
+        """file_id de una imagen ya subida (None si hay que subirla)"""
+        with self._lock:
+            file_id = self._entries.get(content_hash)
+            if file_id is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(content_hash)
+            self.stats['hits'] += 1
+        
+        if self.db is not None:
+            self.db.touch_telegram_file(content_hash)
+        return file_id
+    
+    def put(self, content_hash: str, file_id: str, file_size: int = None):
+        """Recordar el file_id devuelto por Telegram tras una subida"""
+        with self._lock:
+            self._entries[content_hash] = file_id
+            self._entries.move_to_end(content_hash)
+            self.stats['stored'] += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.stats['evicted'] += 1
+        
+        if self.db is not None:
+            self.db.save_telegram_file(content_hash, file_id, file_size, self.capacity)
+    
+    def discard(self, content_hash: str):
+        """Olvidar un file_id que Telegram rechazó"""
+        with self._lock:
+            if self._entries.pop(content_hash, None) is None:
+                return
+            self.stats['invalidated'] += 1
+        
+        if self.db is not None:
+            self.db.delete_telegram_file(content_hash)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        return stats
@@ -3,11 +3,18 @@ Fire Monitor - Telegram Notifications
 Maneja envío de notificaciones y alertas via Telegram
 """
 
+import json
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Callable, Dict, List
 import os
+from telegram_dispatcher import TelegramDispatcher
+from telegram_scheduler import SendScheduler
+from telegram_file_cache import FileIdCache
 
 try:
     from telegram_config import (
@@ -27,23 +34,111 @@ except ImportError:
     ALERT_COOLDOWN = 300
     MESSAGES = {}
 
+# Reintentos ante errores de red o 5xx/429 (espera: 1s, 2s, 4s...; un 429
+# con retry_after espera lo que indique Telegram)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+MAX_RETRY_AFTER = 60  # Un retry_after mayor se da por fallido
+
+# Envíos simultáneos al repartir una notificación entre varios chats
+FANOUT_WORKERS = 8
+
+# Álbumes: las fotos de una misma alerta que llegan dentro de la ventana
+# salen juntas en un sendMediaGroup (máximo 10 por álbum en la Bot API)
+ALBUM_WINDOW = 10.0  # segundos (0 = cada foto por separado)
+ALBUM_MAX = 10
+
+# Un resumen que no se pudo enviar se conserva y se reintenta tras esta espera
+DIGEST_RETRY_DELAY = 30.0
+
+# Resultado de un envío agrupado en el resumen o en un álbum: todavía no
+# salió; si llevaba ticket, el resultado real llega por on_deferred_result
+DEFERRED = 'deferred'
+
+# Emojis y orden de severidad (el resumen informa el pico de la ventana)
+SEVERITY_EMOJI = {
+    'LOW': '🟡',
+    'MEDIUM': '🟠',
+    'HIGH': '🔴'
+}
+SEVERITY_RANK = {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}
+
+def parse_chat_ids(value) -> List[str]:
+    """
+    TELEGRAM_CHAT_ID a lista de chats
+    
+    Acepta un id (str o número), una lista/tupla o "id1, id2, ...".
+    """
+    if value is None:
+        return []
+    items = value if isinstance(value, (list, tuple, set)) else str(value).split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
 class TelegramNotifier:
-    def __init__(self, bot_token: str = None, chat_id: str = None):
+    def __init__(self, bot_token: str = None, chat_id: str = None,
+                 async_delivery: bool = False, workers: int = 2,
+                 max_queue: int = 100, metrics=None, file_cache: FileIdCache = None):
         """
         Inicializar notificador de Telegram
         
         Args:
             bot_token: Token del bot de Telegram
-            chat_id: ID del chat para enviar mensajes
+            chat_id: Chat(s) destinatarios (ver parse_chat_ids); cada
+                     notificación se envía a todos en paralelo
+            async_delivery: Entregar los envíos de dispatch() desde hilos
+                            trabajadores en lugar del hilo que llama
+            workers: Hilos trabajadores (solo con async_delivery)
+            max_queue: Envíos pendientes como máximo (solo con async_delivery)
+            metrics: metrics.Metrics opcional (tiempo de ida y vuelta por método)
+            file_cache: Caché de file_id de fotos ya subidas (por defecto
+                        solo en memoria; con FileIdCache(db) sobrevive a
+                        reinicios)
         """
+        self.metrics = metrics
         self.bot_token = bot_token or TELEGRAM_BOT_TOKEN
-        self.chat_id = chat_id or TELEGRAM_CHAT_ID
-        self.enabled = TELEGRAM_ENABLED and self.bot_token and self.chat_id
+        self.chat_ids = parse_chat_ids(chat_id or TELEGRAM_CHAT_ID)
+        self.config_enabled = TELEGRAM_ENABLED
+        self.enabled = bool(self.config_enabled and self.bot_token and self.chat_ids)
         self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.send_images = SEND_IMAGES
+        self.messages = MESSAGES
+        
+        # Sesión HTTP con keep-alive (reutiliza la conexión TLS)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, FANOUT_WORKERS))
+        self.session.mount('https://', adapter)
         
-        # Control de rate limiting
+        # Control de rate limiting: cooldown de alertas + límites de la Bot
+        # API (cubetas global y por chat)
         self.last_alert_time = None
         self.alert_cooldown = ALERT_COOLDOWN
+        self.scheduler = SendScheduler()
+        self._fanout_pool = None
+        
+        # Fotos ya subidas: se reenvían por file_id sin volver a subirlas
+        self.file_cache = file_cache if file_cache is not None else FileIdCache()
+        
+        # Lo que llega durante el cooldown se agrupa en un resumen que se
+        # envía al cerrarse la ventana (una notificación por ventana)
+        self.last_photo_time = None
+        self._last_sent_detections = None
+        self._digest = None
+        self._digest_timer = None
+        self._digest_lock = threading.Lock()
+        
+        # Álbumes abiertos por alerta (protegidos por _digest_lock)
+        self.album_window = ALBUM_WINDOW
+        self._albums = {}  # alert_id -> {'images', 'tickets', 'caption', 'timer', ...}
+        
+        # Callable(tickets, ok) al enviarse (o fallar) un resumen o álbum con
+        # envíos que llevaban ticket (p.ej. ids del outbox)
+        self.on_deferred_result = None
+        
+        # Entrega asíncrona
+        self.dispatcher = None
+        if async_delivery:
+            self.dispatcher = TelegramDispatcher(workers=workers, max_queue=max_queue)
+            self.dispatcher.start()
         
         if self.enabled:
             print("✓ Notificador de Telegram inicializado")
@@ -55,7 +150,7 @@ class TelegramNotifier:
         """Verificar que el bot está configurado correctamente"""
         try:
             url = f"{self.base_url}/getMe"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=5)
             
             if response.status_code == 200:
                 data = response.json()
@@ -72,29 +167,195 @@ class TelegramNotifier:
             print(f"❌ Error conectando con Telegram: {e}")
             return False
     
-    def send_message(self, text: str, parse_mode: str = 'HTML') -> bool:
+    def apply_config(self, changes: Dict):
+        """
+        Aplicar cambios de telegram_config.py sin reiniciar
+        
+        Args:
+            changes: Claves de config_service.TELEGRAM_KEYS con su valor nuevo
+        """
+        if 'ALERT_COOLDOWN' in changes:
+            self.alert_cooldown = changes['ALERT_COOLDOWN']
+        if 'SEND_IMAGES' in changes:
+            self.send_images = changes['SEND_IMAGES']
+        if 'MESSAGES' in changes:
+            self.messages = changes['MESSAGES'] or {}
+        if 'TELEGRAM_ENABLED' in changes:
+            self.config_enabled = changes['TELEGRAM_ENABLED']
+        
+        credentials_changed = False
+        if changes.get('TELEGRAM_BOT_TOKEN'):
+            credentials_changed = changes['TELEGRAM_BOT_TOKEN'] != self.bot_token
+            self.bot_token = changes['TELEGRAM_BOT_TOKEN']
+            self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        if changes.get('TELEGRAM_CHAT_ID'):
+            self.chat_ids = parse_chat_ids(changes['TELEGRAM_CHAT_ID'])
+        
+        was_enabled = self.enabled
+        self.enabled = bool(self.config_enabled and self.bot_token and self.chat_ids)
+        
+        if self.enabled and (credentials_changed or not was_enabled):
+            self.verify_connection()
+        if was_enabled != self.enabled:
+            print(f"🔧 Notificaciones de Telegram {'habilitadas' if self.enabled else 'deshabilitadas'}")
+    
+    def _post(self, method: str, timeout: float, chat_id: str = None,
+              **kwargs) -> requests.Response:
+        """
+        POST a la Bot API con límites de envío y reintentos
+        
+        Cada intento espera su turno en el planificador (global + chat).
+        Reintenta ante errores de red y 5xx con espera exponencial; un 429
+        pausa el chat durante su retry_after. Devuelve la última respuesta
+        obtenida o relanza la última excepción de red.
+        """
+        url = f"{self.base_url}/{method}"
+        
+        for attempt in range(MAX_RETRIES + 1):
+            waited = self.scheduler.acquire(chat_id)
+            if waited and self.metrics is not None:
+                self.metrics.observe('telegram_throttle_seconds', waited, method=method)
+            
+            try:
+                started = time.perf_counter()
+                response = self.session.post(url, timeout=timeout, **kwargs)
+                if self.metrics is not None:
+                    self.metrics.observe('telegram_request_seconds', time.perf_counter() - started,
+                                         method=method)
+                    self.metrics.inc('telegram_responses_total', method=method,
+                                     status=response.status_code)
+                if response.status_code < 500 and response.status_code != 429:
+                    return response
+                if attempt == MAX_RETRIES:
+                    return response
+                
+                if response.status_code == 429:
+                    retry_after = self._retry_after(response)
+                    if retry_after is not None:
+                        if retry_after > MAX_RETRY_AFTER:
+                            print(f"❌ Telegram pide esperar {retry_after}s ({method}), envío descartado")
+                            return response
+                        print(f"⏳ Límite de Telegram en {method} (chat {chat_id}), reintento en {retry_after}s")
+                        self.scheduler.pause(chat_id, retry_after)
+                        continue
+            except (requests.ConnectionError, requests.Timeout):
+                if self.metrics is not None:
+                    self.metrics.inc('telegram_responses_total', method=method, status='network_error')
+                if attempt == MAX_RETRIES:
+                    raise
+            
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
+    
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        """Segundos de espera de un 429 (parameters.retry_after o cabecera)"""
+        try:
+            return float(response.json()['parameters']['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError, TypeError):
+            return None
+    
+    def _fanout(self, send: Callable[[str], bool], chat_ids: List[str] = None) -> Dict[str, bool]:
+        """
+        Ejecutar send(chat_id) para cada chat, en paralelo si hay varios
+        
+        El planificador reparte los turnos, así 15 destinatarios tardan lo
+        que un envío y no la suma de todos.
+        
+        Returns:
+            Dict chat_id -> True si se entregó
+        """
+        chat_ids = list(chat_ids or self.chat_ids)
+        if len(chat_ids) == 1:
+            return {chat_ids[0]: send(chat_ids[0])}
+        
+        if self._fanout_pool is None:
+            self._fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS,
+                                                   thread_name_prefix='telegram-fanout')
+        
+        futures = {chat_id: self._fanout_pool.submit(send, chat_id) for chat_id in chat_ids}
+        results = {}
+        for chat_id, future in futures.items():
+            try:
+                results[chat_id] = bool(future.result())
+            except Exception as e:
+                print(f"❌ Error enviando a chat {chat_id}: {e}")
+                results[chat_id] = False
+        
+        failed = [chat_id for chat_id, ok in results.items() if not ok]
+        if failed and len(failed) < len(results):
+            print(f"⚠️ Envío fallido a {len(failed)} de {len(results)} chats: {', '.join(failed)}")
+        return results
+    
+    def dispatch(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Ejecutar un envío (p.ej. self.send_fire_alert) sin bloquear
+        
+        Con async_delivery el envío se encola y lo entrega un hilo
+        trabajador; si no, se ejecuta en el acto. En ambos casos se
+        devuelve un Future con el resultado.
+        """
+        if self.dispatcher is not None:
+            return self.dispatcher.submit(func, *args, **kwargs)
+        
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def get_delivery_metrics(self) -> Dict:
+        """Métricas de la cola de envíos y del planificador de límites"""
+        metrics = self.dispatcher.get_metrics() if self.dispatcher else {}
+        metrics.update({f'scheduler_{k}': v for k, v in self.scheduler.get_stats().items()})
+        metrics.update({f'file_cache_{k}': v for k, v in self.file_cache.get_stats().items()})
+        return metrics
+    
+    def shutdown(self, timeout: float = 10.0):
+        """Entregar envíos pendientes (álbumes y resumen abiertos) y cerrar la sesión HTTP"""
+        self.flush_albums()
+        self.flush_digest()
+        if self.dispatcher is not None:
+            self.dispatcher.stop(timeout)
+            self.dispatcher = None
+        if self._fanout_pool is not None:
+            self._fanout_pool.shutdown(wait=True)
+            self._fanout_pool = None
+        self.session.close()
+    
+    def send_message(self, text: str, parse_mode: str = 'HTML',
+                     chat_ids: List[str] = None) -> bool:
         """
-        Enviar mensaje de texto
+        Enviar mensaje de texto a todos los chats
         
         Args:
             text: Mensaje a enviar
             parse_mode: Formato del mensaje ('HTML', 'Markdown', o None)
+            chat_ids: Destinatarios (por defecto todos los configurados)
             
         Returns:
-            True si se envió correctamente
+            True si llegó al menos a un chat
         """
         if not self.enabled:
             return False
         
+        results = self._fanout(lambda chat_id: self._send_message_to(chat_id, text, parse_mode),
+                               chat_ids)
+        return any(results.values())
+    
+    def _send_message_to(self, chat_id: str, text: str, parse_mode: str) -> bool:
         try:
-            url = f"{self.base_url}/sendMessage"
             data = {
-                'chat_id': self.chat_id,
+                'chat_id': chat_id,
                 'text': text,
                 'parse_mode': parse_mode
             }
             
-            response = requests.post(url, json=data, timeout=10)
+            response = self._post('sendMessage', timeout=10, chat_id=chat_id, json=data)
             
             if response.status_code == 200:
                 return True
@@ -106,18 +367,24 @@ class TelegramNotifier:
             print(f"❌ Error enviando mensaje a Telegram: {e}")
             return False
     
-    def send_photo(self, image_path: str, caption: str = None) -> bool:
+    def send_photo(self, image_path: str, caption: str = None,
+                   chat_ids: List[str] = None) -> bool:
         """
-        Enviar foto con caption opcional
+        Enviar foto con caption opcional a todos los chats
+        
+        La imagen se sube una sola vez: el file_id que devuelve Telegram se
+        guarda por hash del contenido y los demás chats (y envíos
+        posteriores de la misma imagen) lo reutilizan.
         
         Args:
             image_path: Ruta a la imagen a enviar
             caption: Texto que acompaña la imagen
+            chat_ids: Destinatarios (por defecto todos los configurados)
             
         Returns:
-            True si se envió correctamente
+            True si llegó al menos a un chat
         """
-        if not self.enabled or not SEND_IMAGES:
+        if not self.enabled or not self.send_images:
             return False
         
         if not os.path.exists(image_path):
@@ -125,29 +392,179 @@ class TelegramNotifier:
             return False
         
         try:
-            url = f"{self.base_url}/sendPhoto"
-            
+            # Leer en memoria una vez: sirve para todos los chats y reintentos
             with open(image_path, 'rb') as photo:
-                files = {'photo': photo}
-                data = {'chat_id': self.chat_id}
-                
-                if caption:
-                    data['caption'] = caption
-                    data['parse_mode'] = 'HTML'
-                
-                response = requests.post(url, files=files, data=data, timeout=30)
-                
+                photo_bytes = photo.read()
+        except OSError as e:
+            print(f"❌ Error leyendo imagen {image_path}: {e}")
+            return False
+        
+        content_hash = self.file_cache.key(photo_bytes)
+        send = lambda chat_id: self._send_photo_to(chat_id, image_path, photo_bytes, caption,
+                                                   content_hash)
+        
+        chat_ids = list(chat_ids or self.chat_ids)
+        if len(chat_ids) > 1 and content_hash not in self.file_cache:
+            # Subir al primer chat; el resto recibe el file_id
+            first = send(chat_ids[0])
+            results = self._fanout(send, chat_ids[1:])
+            return first or any(results.values())
+        
+        results = self._fanout(send, chat_ids)
+        return any(results.values())
+    
+    def _send_photo_to(self, chat_id: str, image_path: str, photo_bytes: bytes,
+                       caption: str = None, content_hash: str = None) -> bool:
+        try:
+            data = {'chat_id': chat_id}
+            
+            if caption:
+                data['caption'] = caption
+                data['parse_mode'] = 'HTML'
+            
+            # Ya subida: enviar por file_id (milisegundos en lugar de subir el JPEG)
+            file_id = self.file_cache.get(content_hash) if content_hash else None
+            if file_id is not None:
+                response = self._post('sendPhoto', timeout=10, chat_id=chat_id,
+                                      data=dict(data, photo=file_id))
                 if response.status_code == 200:
-                    print(f"✓ Foto enviada: {os.path.basename(image_path)}")
+                    print(f"✓ Foto enviada: {os.path.basename(image_path)} (file_id)")
                     return True
-                else:
+                if response.status_code != 400:
                     print(f"❌ Error enviando foto: {response.status_code}")
                     return False
-                    
+                # file_id rechazado: olvidarlo y subir la imagen
+                self.file_cache.discard(content_hash)
+            
+            files = {'photo': (os.path.basename(image_path), photo_bytes, 'image/jpeg')}
+            response = self._post('sendPhoto', timeout=30, chat_id=chat_id, files=files, data=data)
+            
+            if response.status_code == 200:
+                print(f"✓ Foto enviada: {os.path.basename(image_path)}")
+                if content_hash:
+                    self._remember_file_id(content_hash, response, len(photo_bytes))
+                return True
+            else:
+                print(f"❌ Error enviando foto: {response.status_code}")
+                return False
+        
         except Exception as e:
             print(f"❌ Error enviando foto a Telegram: {e}")
             return False
     
+    def _remember_file_id(self, content_hash: str, response: requests.Response, size: int):
+        """Guardar el file_id de la foto subida (el tamaño mayor de result.photo)"""
+        try:
+            file_id = response.json()['result']['photo'][-1]['file_id']
+        except (ValueError, KeyError, IndexError, TypeError):
+            return
+        self.file_cache.put(content_hash, file_id, size)
+    
+    def send_media_group(self, image_paths: List[str], caption: str = None,
+                         chat_ids: List[str] = None) -> bool:
+        """
+        Enviar varias fotos como un álbum (una petición y un caption)
+        
+        Las fotos ya subidas van por file_id; el resto se adjunta en la misma
+        petición y su file_id queda en la caché.
+        
+        Args:
+            image_paths: Imágenes (se envían las primeras ALBUM_MAX)
+            caption: Texto del álbum (en la primera foto)
+            chat_ids: Destinatarios (por defecto todos los configurados)
+        
+        Returns:
+            True si llegó al menos a un chat
+        """
+        if not self.enabled or not self.send_images:
+            return False
+        
+        photos = []  # (ruta, bytes, hash)
+        for image_path in image_paths[:ALBUM_MAX]:
+            try:
+                with open(image_path, 'rb') as photo:
+                    photo_bytes = photo.read()
+            except OSError as e:
+                print(f"❌ Error leyendo imagen {image_path}: {e}")
+                continue
+            photos.append((image_path, photo_bytes, self.file_cache.key(photo_bytes)))
+        
+        if not photos:
+            return False
+        if len(photos) == 1:
+            return self.send_photo(photos[0][0], caption, chat_ids)
+        
+        send = lambda chat_id: self._send_media_group_to(chat_id, photos, caption)
+        
+        chat_ids = list(chat_ids or self.chat_ids)
+        if len(chat_ids) > 1 and any(h not in self.file_cache for _, _, h in photos):
+            # Subir al primer chat; el resto recibe los file_id
+            first = send(chat_ids[0])
+            results = self._fanout(send, chat_ids[1:])
+            return first or any(results.values())
+        
+        results = self._fanout(send, chat_ids)
+        return any(results.values())
+    
+    def _send_media_group_to(self, chat_id: str, photos: List, caption: str = None,
+                             use_cache: bool = True) -> bool:
+        try:
+            media = []
+            files = {}
+            cached = []
+            for index, (image_path, photo_bytes, content_hash) in enumerate(photos):
+                file_id = self.file_cache.get(content_hash) if use_cache else None
+                if file_id is not None:
+                    cached.append(content_hash)
+                    item = {'type': 'photo', 'media': file_id}
+                else:
+                    name = f'photo{index}'
+                    files[name] = (os.path.basename(image_path), photo_bytes, 'image/jpeg')
+                    item = {'type': 'photo', 'media': f'attach://{name}'}
+                
+                if index == 0 and caption:
+                    item['caption'] = caption
+                    item['parse_mode'] = 'HTML'
+                media.append(item)
+            
+            data = {'chat_id': chat_id, 'media': json.dumps(media)}
+            response = self._post('sendMediaGroup', timeout=60, chat_id=chat_id,
+                                  data=data, files=files or None)
+            
+            if response.status_code == 400 and cached:
+                # Algún file_id rechazado: olvidarlos y subir todas
+                for content_hash in cached:
+                    self.file_cache.discard(content_hash)
+                return self._send_media_group_to(chat_id, photos, caption, use_cache=False)
+            
+            if response.status_code == 200:
+                print(f"✓ Álbum enviado: {len(photos)} fotos ({len(files)} subidas)")
+                self._remember_album_file_ids(photos, response)
+                return True
+            else:
+                print(f"❌ Error enviando álbum: {response.status_code}")
+                return False
+        
+        except Exception as e:
+            print(f"❌ Error enviando álbum a Telegram: {e}")
+            return False
+    
+    def _remember_album_file_ids(self, photos: List, response: requests.Response):
+        """Guardar los file_id de las fotos de un álbum (un mensaje por foto)"""
+        try:
+            messages = response.json()['result']
+        except (ValueError, KeyError, TypeError):
+            return
+        
+        for (_, photo_bytes, content_hash), message in zip(photos, messages):
+            if content_hash in self.file_cache:
+                continue
+            try:
+                file_id = message['photo'][-1]['file_id']
+            except (KeyError, IndexError, TypeError):
+                continue
+            self.file_cache.put(content_hash, file_id, len(photo_bytes))
+    
     def can_send_alert(self) -> bool:
         """Verificar si se puede enviar una alerta (rate limiting)"""
         if not self.last_alert_time:
@@ -157,42 +574,56 @@ class TelegramNotifier:
         return elapsed >= self.alert_cooldown
     
     def send_fire_alert(self, detections: int = 0, timestamp: datetime = None, 
-                       severity: str = 'MEDIUM', image_path: str = None) -> bool:
+                       severity: str = 'MEDIUM', image_path: str = None,
+                       device: str = None, ticket=None) -> bool:
         """
         Enviar alerta de incendio detectado
         
+        Durante el cooldown la alerta no se descarta: se agrupa en el
+        resumen de la ventana (ver flush_digest).
+        
         Args:
             detections: Número de detecciones acumuladas
             timestamp: Fecha/hora de la detección
             severity: Severidad de la alerta (LOW, MEDIUM, HIGH)
             image_path: Ruta a imagen capturada (opcional)
+            device: Dispositivo que detectó (para el resumen)
+            ticket: Identificador que se informa por on_deferred_result si
+                    la alerta queda agrupada
             
         Returns:
-            True si se envió correctamente
+            True si se envió, DEFERRED si quedó agrupada en el resumen
         """
         if not self.enabled:
             return False
         
-        # Rate limiting
-        if not self.can_send_alert():
-            remaining = self.alert_cooldown - (datetime.now() - self.last_alert_time).total_seconds()
-            print(f"⏳ Alerta bloqueada por cooldown ({int(remaining)}s restantes)")
-            return False
+        # Rate limiting: dentro de la ventana se agrupa; fuera se reserva la
+        # ventana antes de enviar para que otro hilo no envíe a la vez
+        with self._digest_lock:
+            pending = self._digest is not None
+            if pending or not self.can_send_alert():
+                self._add_to_digest(detections=detections, severity=severity,
+                                    device=device, image_path=image_path, ticket=ticket)
+                remaining = self._window_remaining()
+                if remaining > 0:
+                    print(f"⏳ Alerta agrupada en el resumen ({int(remaining)}s restantes)")
+                    return DEFERRED
+            else:
+                self.last_alert_time = datetime.now()
+        
+        # Ventana cerrada con un resumen aún pendiente (temporizador en
+        # curso): la alerta sale dentro del resumen
+        if pending:
+            self.flush_digest()
+            return DEFERRED
         
         # Preparar mensaje
         timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Emojis según severidad
-        severity_emoji = {
-            'LOW': '🟡',
-            'MEDIUM': '🟠',
-            'HIGH': '🔴'
-        }
-        
         message = f"""
-{MESSAGES.get('fire_detected', '🔥 ¡ALERTA DE INCENDIO!')}
+{self.messages.get('fire_detected', '🔥 ¡ALERTA DE INCENDIO!')}
 
-{severity_emoji.get(severity, '🔥')} <b>Severidad:</b> {severity}
+{SEVERITY_EMOJI.get(severity, '🔥')} <b>Severidad:</b> {severity}
 📊 <b>Detecciones:</b> {detections}
 🕐 <b>Fecha/Hora:</b> {timestamp_str}
 
@@ -205,11 +636,321 @@ class TelegramNotifier:
         # Enviar imagen si está disponible
         if success and image_path and os.path.exists(image_path):
             caption = f"📸 Captura de detección - {timestamp_str}"
-            self.send_photo(image_path, caption)
+            if self.send_photo(image_path, caption):
+                self.last_photo_time = datetime.now()
         
         if success:
-            self.last_alert_time = datetime.now()
+            self._last_sent_detections = detections
             print(f"📱 Alerta de incendio enviada a Telegram")
+        else:
+            # Sin envío no hay ventana que respetar (salvo que ya haya un resumen)
+            with self._digest_lock:
+                if self._digest is None:
+                    self.last_alert_time = None
+        
+        return success
+    
+    def note_alert_update(self, detections: int, severity: str = None,
+                          device: str = None) -> bool:
+        """
+        Registrar nuevas detecciones de una alerta ya notificada
+        
+        No genera mensaje propio: solo se suma al resumen si la ventana de
+        cooldown está abierta (sensor intermitente).
+        
+        Returns:
+            True si se agrupó en el resumen
+        """
+        if not self.enabled:
+            return False
+        
+        with self._digest_lock:
+            if self._digest is None and self.can_send_alert():
+                return False
+            self._add_to_digest(detections=detections, severity=severity, device=device)
+            return True
+    
+    def send_alert_photo(self, image_path: str, caption: str = None,
+                         alert_id: int = None, ticket=None) -> bool:
+        """
+        Enviar imagen de una alerta respetando el cooldown
+        
+        La primera imagen de la ventana sale de inmediato; las siguientes se
+        agrupan en el resumen (que adjunta la más reciente). Con alert_id y
+        album_window > 0, las imágenes de la alerta que llegan en los
+        album_window segundos siguientes a la primera salen juntas en un
+        álbum con el caption más reciente.
+        
+        Con ticket, el resultado de una imagen agrupada se informa por
+        on_deferred_result cuando se envía (o falla) el álbum o el resumen.
+        
+        Returns:
+            True si se envió, DEFERRED si quedó en un álbum o en el resumen
+        """
+        if not self.enabled or not self.send_images:
+            return False
+        
+        batch = alert_id is not None and self.album_window > 0
+        
+        with self._digest_lock:
+            previous_photo_time = opened = self.last_photo_time
+            if not (batch and alert_id in self._albums):
+                if self.last_photo_time is not None and \
+                        (datetime.now() - self.last_photo_time).total_seconds() < self.alert_cooldown:
+                    self._add_to_digest(image_path=image_path, ticket=ticket)
+                    return DEFERRED
+                self.last_photo_time = opened = datetime.now()
+            
+            if batch:
+                full = self._add_to_album(alert_id, image_path, caption, ticket,
+                                          previous_photo_time=previous_photo_time)
+        
+        if not batch:
+            success = self.send_photo(image_path, caption)
+            if not success:
+                # Sin envío no hay ventana que respetar: el reintento no
+                # debe acabar agrupado en el resumen
+                with self._digest_lock:
+                    if self.last_photo_time == opened:
+                        self.last_photo_time = previous_photo_time
+            return success
+        if full:
+            self.dispatch(self.flush_album, alert_id)
+        return DEFERRED
+    
+    # ============================================
+    # ÁLBUMES POR ALERTA
+    # ============================================
+    
+    def flush_album(self, alert_id: int) -> bool:
+        """
+        Enviar el álbum abierto de una alerta (lo llama el temporizador al
+        cerrarse la ventana, al llegar a ALBUM_MAX fotos, o shutdown())
+        
+        Si el álbum no se puede enviar, las fotos con ticket se informan como
+        fallidas (su dueño las reintenta) y las demás se intentan una a una.
+        
+        Returns:
+            True si había álbum y se envió
+        """
+        with self._digest_lock:
+            album = self._albums.pop(alert_id, None)
+        if album is None:
+            return False
+        album['timer'].cancel()
+        
+        caption = album['caption']
+        count = len(album['images'])
+        if count > 1:
+            caption = f"{caption}\n\n📸 {count} capturas" if caption else f"📸 {count} capturas"
+        tickets = [ticket for ticket in album['tickets'] if ticket is not None]
+        if self.send_media_group(album['images'], caption):
+            self._report_deferred(tickets, True)
+            return True
+        
+        print(f"⚠️ Álbum de la alerta {alert_id} no enviado")
+        self._report_deferred(tickets, False)
+        untracked = [image_path for image_path, ticket in zip(album['images'], album['tickets'])
+                     if ticket is None]
+        sent = [self.send_photo(image_path, album['caption']) for image_path in untracked]
+        if not any(sent):
+            # Nada salió: no hay ventana de fotos que respetar
+            with self._digest_lock:
+                if self.last_photo_time == album['opened']:
+                    self.last_photo_time = album['previous_photo_time']
+        return bool(sent) and all(sent)
+    
+    def flush_albums(self):
+        """Enviar todos los álbumes abiertos"""
+        with self._digest_lock:
+            alert_ids = list(self._albums)
+        for alert_id in alert_ids:
+            self.flush_album(alert_id)
+    
+    def _add_to_album(self, alert_id: int, image_path: str, caption: str = None,
+                      ticket=None, previous_photo_time: datetime = None) -> bool:
+        """
+        Añadir una imagen al álbum de la alerta (con _digest_lock tomado)
+        
+        previous_photo_time es el last_photo_time anterior a abrir el álbum
+        (se restaura si el álbum no llega a enviarse).
+        
+        Returns:
+            True si el álbum quedó lleno y hay que enviarlo ya
+        """
+        album = self._albums.get(alert_id)
+        if album is None:
+            timer = threading.Timer(self.album_window, self.dispatch,
+                                    args=(self.flush_album, alert_id))
+            timer.daemon = True
+            album = self._albums[alert_id] = {
+                'images': [],
+                'tickets': [],
+                'caption': None,
+                'timer': timer,
+                'opened': self.last_photo_time,
+                'previous_photo_time': previous_photo_time
+            }
+            timer.start()
+        
+        album['images'].append(image_path)
+        album['tickets'].append(ticket)
+        if caption:
+            album['caption'] = caption
+        return len(album['images']) >= ALBUM_MAX
+    
+    # ============================================
+    # RESUMEN DE LA VENTANA DE COOLDOWN
+    # ============================================
+    
+    def flush_digest(self) -> bool:
+        """
+        Enviar el resumen pendiente (lo llama el temporizador al cerrarse la
+        ventana, o shutdown())
+        
+        El envío abre una nueva ventana: con un sensor intermitente sale como
+        máximo un mensaje por cooldown.
+        
+        Returns:
+            True si había resumen y se encoló/envió
+        """
+        with self._digest_lock:
+            digest, self._digest = self._digest, None
+            if self._digest_timer is not None:
+                self._digest_timer.cancel()
+                self._digest_timer = None
+            if digest is None:
+                return False
+            
+            now = datetime.now()
+            self.last_alert_time = now
+            if digest['images']:
+                self.last_photo_time = now
+        
+        self.dispatch(self._deliver_digest, digest)
+        return True
+    
+    def _window_remaining(self) -> float:
+        """Segundos hasta que cierre la ventana de cooldown actual"""
+        now = datetime.now()
+        remaining = 0.0
+        for started in (self.last_alert_time, self.last_photo_time):
+            if started is not None:
+                remaining = max(remaining, self.alert_cooldown - (now - started).total_seconds())
+        return remaining
+    
+    def _add_to_digest(self, detections: int = None, severity: str = None,
+                       device: str = None, image_path: str = None, ticket=None):
+        """Acumular un evento en el resumen (con _digest_lock tomado)"""
+        digest = self._digest
+        if digest is None:
+            digest = self._digest = {
+                'started': datetime.now(),
+                'events': 0,
+                'base_detections': self._last_sent_detections,
+                'detections': None,
+                'severity': None,
+                'devices': set(),
+                'images': [],
+                'tickets': set()
+            }
+            self._digest_timer = threading.Timer(self._window_remaining(), self.flush_digest)
+            self._digest_timer.daemon = True
+            self._digest_timer.start()
+        
+        if ticket is not None:
+            # Reintento de algo que ya está en el resumen
+            if ticket in digest['tickets']:
+                return
+            digest['tickets'].add(ticket)
+        
+        if detections is not None:
+            digest['events'] += 1
+            digest['detections'] = detections
+        if severity and SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(digest['severity'], 0):
+            digest['severity'] = severity
+        if device:
+            digest['devices'].add(device)
+        if image_path:
+            digest['images'].append(image_path)
+    
+    def _deliver_digest(self, digest: Dict) -> bool:
+        """Enviar un resumen; si falla, devolverlo a la ventana para reintentarlo"""
+        success = self._send_digest(digest)
+        if success:
+            self._report_deferred(digest['tickets'], True)
+        else:
+            self._restore_digest(digest)
+        return success
+    
+    def _report_deferred(self, tickets, ok: bool):
+        """Informar el resultado de envíos agrupados (on_deferred_result)"""
+        if not tickets or self.on_deferred_result is None:
+            return
+        try:
+            self.on_deferred_result(list(tickets), ok)
+        except Exception as e:
+            print(f"❌ Error informando envíos agrupados: {e}")
+    
+    def _restore_digest(self, digest: Dict):
+        """
+        Volver a abrir un resumen no enviado (fusionado con lo que haya
+        llegado mientras tanto) y programar un reintento
+        """
+        with self._digest_lock:
+            current = self._digest
+            if current is not None:
+                digest['events'] += current['events']
+                if current['detections'] is not None:
+                    digest['detections'] = current['detections']
+                if SEVERITY_RANK.get(current['severity'], 0) > SEVERITY_RANK.get(digest['severity'], 0):
+                    digest['severity'] = current['severity']
+                digest['devices'] |= current['devices']
+                digest['images'].extend(current['images'])
+                digest['tickets'] |= current['tickets']
+            self._digest = digest
+            
+            if self._digest_timer is not None:
+                self._digest_timer.cancel()
+            self._digest_timer = threading.Timer(DIGEST_RETRY_DELAY, self.flush_digest)
+            self._digest_timer.daemon = True
+            self._digest_timer.start()
+        
+        print(f"⏳ Resumen no enviado, reintento en {int(DIGEST_RETRY_DELAY)}s")
+    
+    def _send_digest(self, digest: Dict) -> bool:
+        """Mensaje único con lo ocurrido en la ventana (+ última imagen)"""
+        lines = [self.messages.get('fire_digest', '🔥 <b>Resumen de alertas</b>'), '']
+        
+        if digest['events']:
+            lines.append(f"🔔 <b>Eventos agrupados:</b> {digest['events']}")
+        if digest['detections'] is not None:
+            base = digest['base_detections']
+            last = digest['detections']
+            # El contador del ESP32 se reinicia con el dispositivo
+            delta = last - base if base is not None and last >= base else last
+            origin = f"{base} → " if base is not None else ''
+            lines.append(f"📊 <b>Detecciones:</b> +{delta} ({origin}{last})")
+        if digest['severity']:
+            lines.append(f"{SEVERITY_EMOJI.get(digest['severity'], '🔥')} "
+                         f"<b>Severidad máxima:</b> {digest['severity']}")
+        if digest['devices']:
+            lines.append(f"📡 <b>Dispositivos:</b> {', '.join(sorted(digest['devices']))}")
+        if digest['images']:
+            lines.append(f"📸 <b>Imágenes:</b> {len(digest['images'])}")
+        lines.append(f"🕐 <b>Desde:</b> {digest['started'].strftime('%H:%M:%S')}")
+        
+        success = self.send_message('\n'.join(lines))
+        
+        latest = next((p for p in reversed(digest['images']) if os.path.exists(p)), None)
+        if success and latest and self.send_images:
+            self.send_photo(latest, f"📸 Última captura ({len(digest['images'])} en la ventana)")
+        
+        if success:
+            if digest['detections'] is not None:
+                self._last_sent_detections = digest['detections']
+            print(f"📱 Resumen de alertas enviado ({digest['events']} eventos, "
+                  f"{len(digest['images'])} imágenes)")
         
         return success
     
@@ -226,7 +967,7 @@ class TelegramNotifier:
         if not self.enabled:
             return False
         
-        message = MESSAGES.get('fire_cleared', '✅ Alerta despejada')
+        message = self.messages.get('fire_cleared', '✅ Alerta despejada')
         
         if duration:
             minutes = duration // 60
@@ -257,9 +998,9 @@ class TelegramNotifier:
             return False
         
         if status == 'online':
-            message = MESSAGES.get('system_online', '🟢 Sistema iniciado')
+            message = self.messages.get('system_online', '🟢 Sistema iniciado')
         else:
-            message = MESSAGES.get('system_offline', '🔴 Sistema detenido')
+            message = self.messages.get('system_offline', '🔴 Sistema detenido')
         
         if details:
             message += f"\n\n{details}"
@@ -285,7 +1026,7 @@ class TelegramNotifier:
             caption = f"📸 Captura manual\n🕐 {timestamp}"
             return self.send_photo(image_path, caption)
         else:
-            message = MESSAGES.get('capture_failed', '⚠️ Error en captura')
+            message = self.messages.get('capture_failed', '⚠️ Error en captura')
             return self.send_message(message)
     
     def send_stats_report(self, stats: dict) -> bool:
@@ -0,0 +1,126 @@
+"""
+Fire Monitor - Telegram Scheduler
+Límites de envío de la Bot API con cubetas de tokens (global y por chat)
+y pausas por 429 (retry_after)
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+# Límites documentados de la Bot API
+GLOBAL_RATE = 30.0          # mensajes/s en total
+CHAT_RATE = 1.0             # mensajes/s a un mismo chat privado
+GROUP_RATE = 20.0 / 60.0    # mensajes/s a un mismo grupo (20 por minuto)
+CHAT_BURST = 3              # ráfaga tolerada por chat
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Cubeta de tokens con reservas
+        
+        reserve() descuenta el token aunque todavía no esté disponible y
+        devuelve cuánto hay que esperar; así varios hilos que piden a la
+        vez quedan escalonados en lugar de competir.
+        
+        Args:
+            rate: Tokens por segundo
+            capacity: Tokens acumulables (ráfaga máxima)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def reserve(self, now: float) -> float:
+        """Tomar un token; devuelve los segundos de espera antes de usarlo"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+    
+    def pause(self, seconds: float, now: float):
+        """No entregar tokens durante seconds (429 con retry_after)"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+class SendScheduler:
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE, chat_burst: int = CHAT_BURST):
+        """
+        Inicializar planificador de envíos
+        
+        Cada envío necesita un token de la cubeta global y otro de la de su
+        chat (los grupos, con chat_id negativo, tienen un ritmo menor).
+        
+        Args:
+            global_rate: Mensajes/s para todo el bot
+            chat_rate: Mensajes/s por chat privado
+            group_rate: Mensajes/s por grupo
+            chat_burst: Ráfaga permitida por chat
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}  # chat_id -> TokenBucket
+        
+        self.stats = {
+            'acquired': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'retry_after': 0
+        }
+    
+    def acquire(self, chat_id: Optional[str] = None) -> float:
+        """
+        Esperar turno para un envío a chat_id
+        
+        Returns:
+            Segundos esperados
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = self._global.reserve(now)
+            if chat_id is not None:
+                wait = max(wait, self._bucket(chat_id).reserve(now))
+            
+            self.stats['acquired'] += 1
+            if wait > 0:
+                self.stats['throttled'] += 1
+                self.stats['throttled_seconds'] += wait
+        
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def pause(self, chat_id: Optional[str], seconds: float):
+        """
+        Respetar un 429: detener los envíos a chat_id (o todos, si el límite
+        no es de un chat concreto) durante seconds
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._global if chat_id is None else self._bucket(chat_id)
+            bucket.pause(seconds, now)
+            self.stats['retry_after'] += 1
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['chats'] = len(self._chats)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 3)
+        return stats
+    
+    def _bucket(self, chat_id) -> TokenBucket:
+        """Cubeta de un chat (con _lock tomado)"""
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            rate = self.group_rate if key.startswith('-') else self.chat_rate
+            bucket = self._chats[key] = TokenBucket(rate, self.chat_burst)
+        return bucket
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Pruebas de FireMonitorDB: creación de la base en modo pooled
+
+Ejecutar con: python -m pytest test_database.py
+"""
+
+import sys
+import os
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from database import FireMonitorDB
+
+def pragma(db, name):
+    conn = db.get_connection()
+    try:
+        return conn.execute(f'PRAGMA {name}').fetchone()[0]
+    finally:
+        db.release_connection(conn)
+
+# ============================================
+# AUTO_VACUUM
+# ============================================
+
+def test_new_pooled_database_uses_incremental_auto_vacuum(tmp_path):
+    db = FireMonitorDB(str(tmp_path / 'fire_monitor.db'), pooled=True)
+    try:
+        assert pragma(db, 'journal_mode') == 'wal'
+        assert pragma(db, 'auto_vacuum') == 2  # INCREMENTAL
+        assert db.enable_incremental_vacuum() is False
+    finally:
+        db.close()
+
+def test_new_database_uses_incremental_auto_vacuum(tmp_path):
+    db = FireMonitorDB(str(tmp_path / 'fire_monitor.db'))
+    assert pragma(db, 'auto_vacuum') == 2
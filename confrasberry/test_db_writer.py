@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la escritura diferida: reintentos y escritura fila a fila
+
+Ejecutar con: python -m pytest test_db_writer.py
+"""
+
+import sys
+import os
+import sqlite3
+
+import pytest
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import db_writer
+from database import FireMonitorDB, SQL_INSERT_LOG
+from db_writer import WriteBehindQueue
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_writer, 'RETRY_BACKOFF', 0)
+    database = FireMonitorDB(str(tmp_path / 'fire_monitor.db'), pooled=True)
+    yield database
+    database.close()
+
+def log_count(db):
+    conn = db.get_connection()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM system_logs WHERE component = 'TEST'").fetchone()[0]
+    finally:
+        db.release_connection(conn)
+
+def log_row(message, level='INFO'):
+    return (SQL_INSERT_LOG, (level, 'TEST', message, None))
+
+def test_busy_batch_is_retried(db, monkeypatch):
+    writer = WriteBehindQueue(db)
+    execute = writer._execute
+    failures = [sqlite3.OperationalError('database is locked')]
+    
+    def flaky_execute(groups):
+        if failures:
+            raise failures.pop()
+        execute(groups)
+    
+    monkeypatch.setattr(writer, '_execute', flaky_execute)
+    writer._write_batch([log_row('uno'), log_row('dos')])
+    
+    stats = writer.get_stats()
+    assert stats['retries'] == 1
+    assert stats['written'] == 2
+    assert stats['dropped'] == 0
+    assert log_count(db) == 2
+
+def test_failing_batch_falls_back_to_single_rows(db):
+    writer = WriteBehindQueue(db)
+    writer._write_batch([log_row('uno'), log_row('inválido', level='NOPE'), log_row('tres')])
+    
+    stats = writer.get_stats()
+    assert stats['written'] == 2
+    assert stats['dropped'] == 1
+    assert log_count(db) == 2
+
+def test_flush_writes_queued_rows(db):
+    writer = WriteBehindQueue(db, flush_interval_ms=10000)
+    writer.start()
+    try:
+        assert writer.submit(*log_row('uno'))
+        assert writer.flush()
+        assert log_count(db) == 1
+    finally:
+        writer.stop()
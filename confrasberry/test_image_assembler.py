@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Pruebas del reensamblado de imágenes: presupuesto de memoria, tamaño
+máximo por imagen y chunks binarios con CRC inválido
+
+Ejecutar con: python -m pytest test_image_assembler.py
+"""
+
+import sys
+import os
+import zlib
+
+import pytest
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from image_assembler import (BINARY_CHUNK_HEADER, BINARY_CHUNK_MAGIC, BINARY_CHUNK_VERSION,
+                             ImageReassembler, parse_binary_chunk)
+
+def binary_chunk(capture_id, index, total, data, crc=None):
+    """Payload de fire/image/bin/<device> tal como lo envía el firmware"""
+    header = BINARY_CHUNK_HEADER.pack(BINARY_CHUNK_MAGIC, BINARY_CHUNK_VERSION, 0,
+                                      capture_id, index, total,
+                                      zlib.crc32(data) if crc is None else crc)
+    return header + data
+
+def meta(capture_id, size, chunks, device='cam-1'):
+    return {'device': device, 'capture': capture_id, 'size': size, 'chunks': chunks}
+
+# ============================================
+# PRESUPUESTO DE MEMORIA
+# ============================================
+
+def test_oldest_transfer_evicted_when_budget_exceeded():
+    reassembler = ImageReassembler(max_bytes=100)
+    
+    assert reassembler.start_transfer(meta(1, 60, 2)) is not None
+    assert reassembler.start_transfer(meta(2, 60, 2)) is not None
+    
+    stats = reassembler.get_stats()
+    assert stats['evicted'] == 1
+    assert stats['in_progress'] == 1
+    assert stats['bytes_buffered'] == 60
+    assert reassembler.pending_transfers()[0]['capture_id'] == 2
+
+def test_oldest_transfer_evicted_when_too_many_transfers():
+    reassembler = ImageReassembler(max_transfers=2)
+    
+    for capture_id in (1, 2, 3):
+        reassembler.start_transfer(meta(capture_id, 10, 1))
+    
+    captures = {t['capture_id'] for t in reassembler.pending_transfers()}
+    assert captures == {2, 3}
+    assert reassembler.get_stats()['evicted'] == 1
+
+def test_oversized_metadata_rejected_before_allocating():
+    reassembler = ImageReassembler(max_bytes=1000, max_image_bytes=100)
+    
+    assert reassembler.start_transfer(meta(1, 101, 2)) is None
+    
+    stats = reassembler.get_stats()
+    assert stats['rejected'] == 1
+    assert stats['started'] == 0
+    assert stats['bytes_buffered'] == 0
+
+def test_transfer_without_size_rejected_once_over_image_limit():
+    reassembler = ImageReassembler(max_bytes=1000, max_image_bytes=100)
+    
+    chunk = {'device': 'cam-1', 'capture': 7, 'total': 3, 'data': b'x' * 60}
+    assert reassembler.add_chunk(dict(chunk, chunk=0)) is None
+    assert reassembler.add_chunk(dict(chunk, chunk=1)) is None
+    
+    stats = reassembler.get_stats()
+    assert stats['rejected'] == 1
+    assert stats['in_progress'] == 0
+    assert stats['bytes_buffered'] == 0
+
+# ============================================
+# CHUNKS BINARIOS
+# ============================================
+
+def test_binary_chunks_reassemble_image():
+    image = bytes(range(256)) * 2
+    reassembler = ImageReassembler()
+    reassembler.start_transfer(meta(5, len(image), 2))
+    
+    first = parse_binary_chunk('cam-1', binary_chunk(5, 0, 2, image[:300]))
+    last = parse_binary_chunk('cam-1', binary_chunk(5, 1, 2, image[300:]))
+    
+    assert reassembler.add_chunk(first) is None
+    transfer = reassembler.add_chunk(last)
+    assert transfer is not None
+    assert bytes(transfer.assemble()) == image
+    assert reassembler.get_stats()['bytes_buffered'] == 0
+
+def test_binary_chunk_with_bad_crc_discards_transfer():
+    reassembler = ImageReassembler()
+    reassembler.start_transfer(meta(5, 20, 2))
+    
+    chunk = parse_binary_chunk('cam-1', binary_chunk(5, 0, 2, b'a' * 10, crc=1234))
+    assert chunk['data'] is None
+    
+    assert reassembler.add_chunk(chunk) is None
+    stats = reassembler.get_stats()
+    assert stats['corrupt'] == 1
+    assert stats['in_progress'] == 0
+    assert stats['bytes_buffered'] == 0
+
+def test_binary_chunk_with_bad_header_raises():
+    with pytest.raises(ValueError):
+        parse_binary_chunk('cam-1', b'FI')
+    with pytest.raises(ValueError):
+        parse_binary_chunk('cam-1', b'XX' + binary_chunk(1, 0, 1, b'data')[2:])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Pruebas del catálogo de imágenes: regeneración y compactación del
+manifiesto
+
+Ejecutar con: python -m pytest test_image_catalog.py
+"""
+
+import sys
+import os
+import json
+
+import pytest
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from database import FireMonitorDB
+from image_catalog import ImageCatalog
+
+@pytest.fixture
+def catalog(tmp_path):
+    db = FireMonitorDB(str(tmp_path / 'fire_monitor.db'))
+    return ImageCatalog(db, str(tmp_path / 'images'))
+
+def save(catalog, device='cam-1'):
+    path = catalog.path_for(device=device)
+    with open(path, 'wb') as f:
+        f.write(b'jpeg')
+    return catalog.add(path, image_size=4, device=device)
+
+def manifest(catalog):
+    with open(catalog.manifest_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_rebuild_drops_deletes_and_keeps_device(catalog):
+    first = save(catalog, 'cam-1')
+    second = save(catalog, 'cam-2')
+    catalog.db.delete_image_records([first])
+    catalog.remove(first)
+    
+    assert catalog.compact_manifest() == 1
+    
+    entries = manifest(catalog)
+    assert [(e['op'], e['id'], e['device']) for e in entries] == [('add', second, 'cam-2')]
+    assert catalog.compact_manifest() is None
+
+def test_rebuild_keeps_images_added_meanwhile(catalog, monkeypatch):
+    first = save(catalog)
+    added = []
+    iter_images = catalog.db.iter_images
+    
+    def iter_and_add(**kwargs):
+        # Una captura llega mientras se recorren las filas (add no espera)
+        added.append(save(catalog))
+        return iter_images(**kwargs)
+    
+    monkeypatch.setattr(catalog.db, 'iter_images', iter_and_add)
+    
+    assert catalog.rebuild_manifest() == 2
+    assert [e['id'] for e in manifest(catalog)] == [first, added[0]]
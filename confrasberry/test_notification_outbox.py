@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Pruebas del outbox de notificaciones: entrega, reintentos y notificaciones
+agrupadas en un resumen o álbum (con una base SQLite temporal)
+
+Ejecutar con: python -m pytest test_notification_outbox.py
+"""
+
+import sys
+import os
+
+import pytest
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from database import FireMonitorDB
+from notification_outbox import NotificationOutbox
+from telegram_notifier import DEFERRED
+
+class FakeNotifier:
+    """Notificador sin red: devuelve los resultados indicados en orden"""
+    
+    def __init__(self, *results):
+        self.enabled = True
+        self.alert_cooldown = 60
+        self.album_window = 10.0
+        self.on_deferred_result = None
+        self.results = list(results)
+        self.sent = []
+    
+    def send_fire_alert(self, detections, timestamp=None, severity='MEDIUM', device=None,
+                        ticket=None):
+        self.sent.append(ticket)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+@pytest.fixture
+def db(tmp_path):
+    database = FireMonitorDB(str(tmp_path / 'fire_monitor.db'))
+    yield database
+    database.close()
+
+def notification(db, notification_id):
+    conn = db.get_connection()
+    try:
+        row = conn.execute('SELECT * FROM notification_outbox WHERE id = ?',
+                           (notification_id,)).fetchone()
+        return dict(row)
+    finally:
+        db.release_connection(conn)
+
+def enqueue_alert(outbox):
+    return outbox.enqueue('fire_alert', {'detections': 3, 'severity': 'HIGH'})
+
+# ============================================
+# ENTREGA Y REINTENTOS
+# ============================================
+
+def test_delivered_notification_is_marked(db):
+    outbox = NotificationOutbox(db, FakeNotifier(True))
+    notification_id = enqueue_alert(outbox)
+    
+    assert outbox.deliver_due() == 1
+    
+    row = notification(db, notification_id)
+    assert row['status'] == 'DELIVERED'
+    assert row['attempts'] == 1
+    assert outbox.counters['delivered'] == 1
+    assert db.get_due_notifications() == []
+
+def test_failed_send_is_rescheduled_with_backoff(db):
+    notifier = FakeNotifier(False)
+    outbox = NotificationOutbox(db, notifier)
+    notification_id = enqueue_alert(outbox)
+    
+    assert outbox.deliver_due() == 0
+    
+    row = notification(db, notification_id)
+    assert row['status'] == 'PENDING'
+    assert row['attempts'] == 1
+    assert row['last_error']
+    assert outbox.counters['retried'] == 1
+    # El siguiente intento queda en el futuro: no se reintenta en el acto
+    assert db.get_due_notifications() == []
+    assert notifier.sent == [notification_id]
+
+def test_exception_while_sending_is_retried(db):
+    outbox = NotificationOutbox(db, FakeNotifier(ConnectionError('sin red')))
+    notification_id = enqueue_alert(outbox)
+    
+    assert outbox.deliver_due() == 0
+    
+    row = notification(db, notification_id)
+    assert row['status'] == 'PENDING'
+    assert row['last_error'] == 'sin red'
+
+def test_disabled_notifier_fails_notification(db):
+    notifier = FakeNotifier()
+    notifier.enabled = False
+    outbox = NotificationOutbox(db, notifier)
+    notification_id = enqueue_alert(outbox)
+    
+    assert outbox.deliver_due() == 0
+    assert notification(db, notification_id)['status'] == 'FAILED'
+    assert outbox.counters['failed'] == 1
+
+def test_metrics_come_from_last_refresh(db):
+    outbox = NotificationOutbox(db, FakeNotifier(False))
+    enqueue_alert(outbox)
+    
+    assert outbox.get_metrics()['pending'] == 0
+    outbox.deliver_due()
+    outbox.refresh_stats()
+    
+    metrics = outbox.get_metrics()
+    assert metrics['pending'] == 1
+    assert metrics['max_attempts'] == 1
+
+# ============================================
+# RESUMEN / ÁLBUM (DEFERRED)
+# ============================================
+
+def test_deferred_notification_stays_pending_until_confirmed(db):
+    notifier = FakeNotifier(DEFERRED)
+    outbox = NotificationOutbox(db, notifier)
+    notification_id = enqueue_alert(outbox)
+    
+    assert outbox.deliver_due() == 0
+    
+    row = notification(db, notification_id)
+    assert row['status'] == 'PENDING'
+    assert row['attempts'] == 0
+    assert db.get_due_notifications() == []
+    assert outbox.counters['deferred'] == 1
+    
+    notifier.on_deferred_result([notification_id], True)
+    assert notification(db, notification_id)['status'] == 'DELIVERED'
+    assert outbox.counters['delivered'] == 1
+
+def test_deferred_notification_retried_when_group_fails(db):
+    notifier = FakeNotifier(DEFERRED)
+    outbox = NotificationOutbox(db, notifier)
+    notification_id = enqueue_alert(outbox)
+    outbox.deliver_due()
+    
+    notifier.on_deferred_result([notification_id], False)
+    
+    row = notification(db, notification_id)
+    assert row['status'] == 'PENDING'
+    assert row['attempts'] == 1
+    assert outbox.counters['retried'] == 1
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la retención: imágenes sueltas de versiones anteriores
+
+Ejecutar con: python -m pytest test_retention.py
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from database import FireMonitorDB
+from image_catalog import ImageCatalog
+from retention import RetentionEngine
+
+@pytest.fixture
+def retention(tmp_path):
+    db = FireMonitorDB(str(tmp_path / 'fire_monitor.db'))
+    catalog = ImageCatalog(db, str(tmp_path / 'images'))
+    os.makedirs(catalog.images_dir)
+    return RetentionEngine(db, catalog, batch_size=1)
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+def test_legacy_images_are_registered_once_and_counted(retention):
+    root = retention.catalog.images_dir
+    old = write_file(os.path.join(root, 'fire_capture_20250101_120000.jpg'), 100)
+    os.utime(old, (1735732800, 1735732800))  # 2025-01-01 12:00:00 UTC
+    write_file(os.path.join(root, 'fire_capture_20250102_120000.jpg'), 50)
+    known = write_file(os.path.join(root, 'fire_capture_20250103_120000.jpg'), 10)
+    retention.db.save_image_record(alert_id=None, file_path=known, file_name=os.path.basename(known),
+                                   image_size=10, width=None, height=None)
+    
+    assert retention.sweep_legacy_images() == 2
+    assert retention.db.get_image_storage_bytes() == 160
+    
+    rows = {row['file_path']: row for row in retention.db.get_all_images()}
+    assert rows[old]['capture_time'] == '2025-01-01 12:00:00'
+    assert rows[old]['alert_id'] is None
+    assert retention.db.get_images_for_eviction(limit=1)[0]['file_path'] == old
+    
+    # Solo la primera vez
+    write_file(os.path.join(root, 'fire_capture_20250104_120000.jpg'), 5)
+    assert retention.sweep_legacy_images() == 0
+
+def test_legacy_images_deleted_by_budget(retention):
+    root = retention.catalog.images_dir
+    for day in range(1, 4):
+        path = write_file(os.path.join(root, f'fire_capture_2025010{day}_120000.jpg'), 600 * 1024)
+        os.utime(path, (time.time() - (4 - day) * 3600,) * 2)  # Más antigua primero
+    retention.sweep_legacy_images()
+    retention.db.set_config('image_disk_budget_mb', 1, 'integer')
+    
+    result = retention.run()
+    
+    assert result['images_evicted'] == 2
+    assert sorted(os.listdir(root)) == ['fire_capture_20250103_120000.jpg', 'manifest.ndjson']
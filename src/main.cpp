@@ -4,6 +4,7 @@
 #include <ArduinoJson.h>
 #include <PubSubClient.h>
 #include "base64.h"
+#include <rom/crc.h>
 
 // ==== PROTOTIPOS DE FUNCIONES ====
 void callback(char* topic, byte* payload, unsigned int length);
@@ -32,6 +33,13 @@ const char* TOPIC_ALERT = "fire/alert";
 const char* TOPIC_CAPTURE_CMD = "fire/capture";
 const char* TOPIC_IMAGE = "fire/image";
 const char* TOPIC_STATUS = "fire/status";
+const char* TOPIC_IMAGE_BIN = "fire/image/bin/ESP32-CAM";  // fire/image/bin/<device>
+
+// Transporte de imágenes: 1 = chunks binarios (cabecera de 16 bytes + JPEG
+// sin codificar, ~35% menos datos que Base64/JSON); 0 = JSON en fire/image
+#define IMAGE_BINARY_TRANSPORT 1
+#define BIN_CHUNK_HEADER_SIZE 16
+#define BIN_CHUNK_VERSION 1
 
 // ==== Pin del sensor KY-026 ====
 #define FLAME_SENSOR_PIN 13
@@ -152,14 +160,20 @@ void captureAndSendImage() {
   const int chunkSize = 2550;  // Reducido de 4000 a 2000
   const int totalChunks = (fb->len + chunkSize - 1) / chunkSize;
 
+  // Identificador de captura: permite a la Raspberry separar transferencias
+  const unsigned long captureId = millis();
+
   // Metadata
   StaticJsonDocument<256> metaDoc;
   metaDoc["device"] = "ESP32-CAM";
-  metaDoc["timestamp"] = millis();
+  metaDoc["capture"] = captureId;
+  metaDoc["timestamp"] = captureId;
   metaDoc["size"] = fb->len;
   metaDoc["width"] = fb->width;
   metaDoc["height"] = fb->height;
   metaDoc["chunks"] = totalChunks;
+  metaDoc["chunk_size"] = chunkSize;
+  metaDoc["transport"] = IMAGE_BINARY_TRANSPORT ? "bin" : "json";
 
   char metaBuffer[256];
   serializeJson(metaDoc, metaBuffer);
@@ -168,6 +182,39 @@ void captureAndSendImage() {
 
   Serial.printf("📤 Enviando imagen en %d chunks...\n", totalChunks);
 
+#if IMAGE_BINARY_TRANSPORT
+  // Cabecera little-endian (igual que BINARY_CHUNK_HEADER en la Raspberry):
+  // magic 'FI' | versión | flags | capture u32 | chunk u16 | total u16 | crc32 u32
+  static uint8_t binChunk[BIN_CHUNK_HEADER_SIZE + chunkSize];
+  
+  for (int i = 0; i < totalChunks; i++) {
+    int start = i * chunkSize;
+    int len = (i == totalChunks - 1) ? fb->len - start : chunkSize;
+    uint32_t capture32 = (uint32_t)captureId;
+    uint16_t index16 = (uint16_t)i;
+    uint16_t total16 = (uint16_t)totalChunks;
+    uint32_t crc = crc32_le(0, fb->buf + start, len);
+    
+    binChunk[0] = 'F';
+    binChunk[1] = 'I';
+    binChunk[2] = BIN_CHUNK_VERSION;
+    binChunk[3] = 0;
+    memcpy(binChunk + 4, &capture32, 4);
+    memcpy(binChunk + 8, &index16, 2);
+    memcpy(binChunk + 10, &total16, 2);
+    memcpy(binChunk + 12, &crc, 4);
+    memcpy(binChunk + BIN_CHUNK_HEADER_SIZE, fb->buf + start, len);
+    
+    if (mqtt.publish(TOPIC_IMAGE_BIN, binChunk, BIN_CHUNK_HEADER_SIZE + len)) {
+      Serial.printf("  ✓ Chunk %d/%d enviado (%d bytes)\n", i + 1, totalChunks, len);
+    } else {
+      Serial.printf("  ❌ Error enviando chunk %d\n", i + 1);
+    }
+    
+    delay(250); // Delay entre chunks
+    yield();    // Evita WDT reset
+  }
+#else
   for (int i = 0; i < totalChunks; i++) {
     int start = i * chunkSize;
     int len = (i == totalChunks - 1) ? fb->len - start : chunkSize;
@@ -180,9 +227,11 @@ void captureAndSendImage() {
 
     // CORRECCIÓN: DynamicJsonDocument con tamaño calculado dinámicamente
     // Tamaño necesario = overhead JSON (~100) + tamaño del string Base64
-    const size_t capacity = JSON_OBJECT_SIZE(3) + chunkB64.length() + 100;
+    const size_t capacity = JSON_OBJECT_SIZE(5) + chunkB64.length() + 100;
     DynamicJsonDocument doc(capacity);
     
+    doc["device"] = "ESP32-CAM";
+    doc["capture"] = captureId;
     doc["chunk"] = i;
     doc["total"] = totalChunks;
     doc["data"] = chunkB64;
@@ -204,6 +253,7 @@ void captureAndSendImage() {
     delay(250); // Delay entre chunks
     yield();    // Evita WDT reset
   }
+#endif
 
   esp_camera_fb_return(fb);
   s->set_framesize(s, FRAMESIZE_SVGA);